@@ -1,42 +1,64 @@
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from ete3 import Tree
+from newick import OutgroupResolver, iter_newick_text
+
+# Outgroup names by priority, indexed once per process
+OUTGROUPS = OutgroupResolver([f'amborella_{i}' for i in range(10000)] + [f'water_lily_{i}' for i in range(10000)])
 
 def trim_leaves(tree, start_str):
     for leaf in tree.iter_leaves():
         if leaf.name.startswith(start_str):
             leaf.delete()
 
-def reroot_tree(tree, names):
-    for name in names:
-        leaves = tree.get_leaves_by_name(name)
-        if leaves:
-            tree.set_outgroup(leaves[0])
-            return
+def reroot_tree(tree, outgroups):
+    # One pass over the leaves: the first leaf carrying the highest-priority outgroup name
+    leaves = tree.get_leaves()
+    best = outgroups.pick([leaf.name for leaf in leaves])
+    if best is not None:
+        tree.set_outgroup(leaves[best])
+        return
     tree.set_outgroup(tree.get_midpoint_outgroup())
 
+def clean_tree(newick, start_str):
+    """Trim and reroot one Newick tree; returns the rewritten Newick string."""
+    tree = Tree(newick)
+    trim_leaves(tree, start_str)
+    reroot_tree(tree, OUTGROUPS)
+    return tree.write(format=1)
+
+def clean_trees(newicks, start_str, workers=1):
+    """
+    Yield the cleaned trees of an iterable of Newick strings, in input order.
+    With `workers` > 1 the trees are cleaned in a process pool; at most a few trees per
+    worker are in flight, so the input is still read lazily.
+    """
+    if workers <= 1:
+        for newick in newicks:
+            yield clean_tree(newick, start_str)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for newick in newicks:
+            pending.append(executor.submit(clean_tree, newick, start_str))
+            if len(pending) >= 4 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 def main():
     parser = argparse.ArgumentParser(description='Process a tree.')
     parser.add_argument('--tree', type=str, required=True, help='The input tree file.')
     parser.add_argument('--start_str', type=str, required=True, help='The input string.')
     parser.add_argument('--output', type=str, required=True, help='The output file.')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for trimming and rerooting (default: 1).')
     args = parser.parse_args()
 
-    with open(args.tree, 'r') as f:
-        trees = f.read().split(';\n')
-
-    output_trees = []
-    names = [f'amborella_{i}' for i in range(10000)] + [f'water_lily_{i}' for i in range(10000)]
-    
-    for t in trees:
-        if t.strip() == '':
-            continue
-        tree = Tree(t + ';')
-        trim_leaves(tree, args.start_str)
-        reroot_tree(tree, names)
-        output_trees.append(tree.write(format=1))
-
+    # Trees are read, cleaned and written one at a time, one tree per line
     with open(args.output, 'w') as f:
-        f.write(';\n'.join(output_trees) + ';')
+        for newick in clean_trees(iter_newick_text(args.tree), args.start_str, args.workers):
+            f.write(newick + '\n')
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,7 @@
 import os
-import pandas as pd
+import argparse
 from Bio import SeqIO
+from exonerate_utils import CONTIG_ID_COL, read_exonerate_stats, row_ranges
 
 def get_args():
     parser = argparse.ArgumentParser(description='Process some integers.')
@@ -21,18 +22,18 @@ def get_fasta_file(args):
     return os.path.join(args.input_dir, args.gene_name, f"{args.gene_name}_contigs.fasta")
 
 def get_df(exonerate_stats_file):
-    df = pd.read_csv(exonerate_stats_file, sep='\t')
-    return df.loc[:df[df.iloc[:,0] == "Hits with subsumed hits removed"].index[0] - 1]
+    # Rows above "Hits with subsumed hits removed", with the exon range column parsed once;
+    # a file without that row is malformed
+    df, query_ranges, _ = read_exonerate_stats(exonerate_stats_file, "Hits with subsumed hits removed", required=True)
+    return df, query_ranges
 
-def write_sequences(df, fasta_file, args):
+def write_sequences(df, query_ranges, fasta_file, args):
     data_name = os.path.basename(args.input_dir)
     output_file = os.path.join(args.output_dir, f"{data_name}_{args.gene_name}.fasta")
 
     with open(output_file, 'w') as f:
-        for index, row in df.iterrows():
-            exon_ranges_str = row.iloc[6]
-            sequence_name = row.iloc[3]
-            exon_ranges = eval(exon_ranges_str)
+        for index, sequence_name in enumerate(df.iloc[:, CONTIG_ID_COL].tolist()):
+            exon_ranges = row_ranges(query_ranges, index)
 
             for record in SeqIO.parse(fasta_file, "fasta"):
                 if record.id == sequence_name:
@@ -51,9 +52,9 @@ def main():
 
     fasta_file = get_fasta_file(args)
 
-    df = get_df(exonerate_stats_file)
+    df, query_ranges = get_df(exonerate_stats_file)
 
-    write_sequences(df, fasta_file, args)
+    write_sequences(df, query_ranges, fasta_file, args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,443 @@
+# newick.py
+"""
+Compact array-backed tree and Newick reader for the distance stages.
+A tree is stored as preorder NumPy arrays: node 0 is the root, every node comes after its
+parent, and the subtree of node v is the contiguous id range [v, subtree_end[v]). Only the
+parent index, branch length, support value and name of each node are kept, instead of one
+Bio.Phylo Clade object per node, so loading a FastTree/IQ-TREE tree is a single tokenizer
+pass and a few list appends per node.
+Parsing follows Bio.Phylo.NewickIO (same tokens, numeric internal labels read as support
+values), and the rerooting functions reproduce `Tree.root_with_outgroup` and
+`Tree.root_at_midpoint` step by step, so the resulting trees (node order, branch lengths)
+and every distance computed from them are identical to the Bio.Phylo ones.
+`OutgroupResolver` picks the outgroup from a priority list of names in one pass.
+"""
+import re
+import numpy as np
+
+# Token patterns of Bio.Phylo.NewickIO
+TOKENIZER = re.compile(
+    r"(\(|\)|[^\s\(\)\[\]\'\:\;\,]+|\:\ ?[+-]?[0-9]*\.?[0-9]+([eE][+-]?[0-9]+)?|\,"
+    r"|\[(\\.|[^\]])*\]|\'(\\.|[^\'])*\'|\;|\n)")
+# Plain-text fast path: structural characters, and a `name:length` label between them
+STRUCTURE = re.compile(r"([(),;])")
+SPECIAL_CHARS = re.compile(r"[\s'\[\]]")
+PLAIN_LABEL = re.compile(r"[^:]*(?::[+-]?[0-9]*\.?[0-9]+(?:[eE][+-]?[0-9]+)?)?")
+
+class NewickTree:
+    """
+    Tree as preorder arrays: `parent` (-1 for the root), `branch` and `support` (NaN when
+    absent) and `names` (None for unnamed nodes). `level` and `subtree_end` are derived.
+    """
+    def __init__(self, parent, branch, support, names, level=None):
+        n = len(parent)
+        parent = list(parent)
+        if level is None:
+            level = [0] * n
+            for v in range(1, n):
+                level[v] = level[parent[v]] + 1
+        subtree_end = list(range(1, n + 1))
+        for v in range(n - 1, 0, -1):
+            if subtree_end[v] > subtree_end[parent[v]]:
+                subtree_end[parent[v]] = subtree_end[v]
+        self.parent = np.array(parent, dtype=np.int64)
+        self.branch = np.array(branch, dtype=np.float64)
+        self.support = np.array(support, dtype=np.float64)
+        self.names = list(names)
+        self.level = np.array(level, dtype=np.int64)
+        self.subtree_end = np.array(subtree_end, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_tip(self):
+        """Boolean array marking the terminal nodes."""
+        return self.subtree_end == np.arange(1, len(self) + 1)
+
+    def tips(self):
+        """Terminal node ids in preorder (the order of `Tree.get_terminals`)."""
+        return np.flatnonzero(self.is_tip())
+
+    def tip_names(self):
+        return [self.names[v] for v in self.tips()]
+
+    def children(self, node):
+        """Child node ids of `node`, in Newick order."""
+        child = node + 1
+        end = self.subtree_end[node]
+        while child < end:
+            yield child
+            child = self.subtree_end[child]
+
+def _parse_support(text):
+    """Numeric internal label as a support value (Bio.Phylo's confidence), else None."""
+    if text.isdigit():
+        return int(text)
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def _support_and_names(names, internal):
+    """Move numeric internal labels from `names` to a support list, as Bio.Phylo's parser does."""
+    support = [np.nan] * len(names)
+    for v, name in enumerate(names):
+        if name and internal[v]:
+            value = _parse_support(name)
+            if value is not None:
+                support[v], names[v] = value, None
+    return support
+
+def _parse_plain(text):
+    """
+    Vectorized parser for plain Newick text (no quotes, comments or whitespace), as written
+    by FastTree and IQ-TREE. Returns None when the text needs the general tokenizer.
+    Every '(' or ',' opens a node; a node's parent is the last node opened one level up, and
+    a label belongs to the node just opened, or after a ')' to the last node at that level.
+    """
+    if SPECIAL_CHARS.search(text):
+        return None
+    pieces = STRUCTURE.split(text)
+    labels, seps = pieces[0::2], pieces[1::2]
+    if ";" in seps and (seps.index(";") != len(seps) - 1 or labels[-1]):
+        return None
+    if not all(map(PLAIN_LABEL.fullmatch, labels)):
+        return None
+    seps = np.frombuffer("".join(seps[:len(seps) - (seps[-1:] == [";"])]).encode(), dtype=np.uint8)
+    step = (seps == ord("(")).astype(np.int64) - (seps == ord(")"))
+    depth = np.cumsum(step)
+    opens = (seps == ord("(")) | (seps == ord(","))
+    if len(depth) and (depth.min() < 0 or depth[-1] != 0 or np.any(depth[seps == ord(",")] == 0)):
+        return None
+    level = np.concatenate(([0], depth[opens]))
+    n = len(level)
+    ids = np.arange(n)
+    # Nodes sorted by (level, id): the last node of a level opened before a position is one lookup away
+    keys = level * n + ids
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    parent = np.full(n, -1, dtype=np.int64)
+    parent[1:] = order[np.searchsorted(sorted_keys, (level[1:] - 1) * n + ids[1:]) - 1]
+    # Label k follows separator k-1; its node is the last node opened at that separator's level
+    opened = np.concatenate(([0], np.cumsum(opens)))
+    target = np.zeros(len(labels), dtype=np.int64)
+    target[1:len(seps) + 1] = order[np.searchsorted(sorted_keys, depth * n + opened[1:], side='right') - 1]
+
+    names, branch = [None] * n, [np.nan] * n
+    for node, label in zip(target.tolist(), labels):
+        if label:
+            name, colon, length = label.partition(":")
+            if name:
+                names[node] = name
+            if colon:
+                branch[node] = float(length)
+    internal = np.bincount(parent[1:], minlength=n) > 0
+    support = _support_and_names(names, internal)
+    return NewickTree(parent.tolist(), branch, support, names, level)
+
+def parse_newick(text):
+    """Parse one Newick tree string into a NewickTree."""
+    tree = _parse_plain(text.strip())
+    if tree is not None:
+        return tree
+    parent, branch, names, children = [-1], [np.nan], [None], [[]]
+    root = current = 0
+    open_count = close_count = 0
+
+    def new_node(up):
+        parent.append(up)
+        branch.append(np.nan)
+        names.append(None)
+        children.append([])
+        if up >= 0:
+            children[up].append(len(names) - 1)
+        return len(names) - 1
+
+    tokens = TOKENIZER.finditer(text.strip())
+    for match in tokens:
+        token = match.group()
+        if token.startswith("'"):
+            names[current] = token[1:-1] if not names[current] else names[current] + token[:-1]
+        elif token.startswith("["):
+            continue
+        elif token == "(":
+            current = new_node(current)
+            open_count += 1
+        elif token == ",":
+            if current == root:
+                # Top-level list without enclosing parentheses: the old root becomes a child
+                root = new_node(-1)
+                parent[current] = root
+                children[root].append(current)
+            current = new_node(parent[current])
+        elif token == ")":
+            if parent[current] < 0:
+                raise ValueError("Parenthesis mismatch.")
+            current = parent[current]
+            close_count += 1
+        elif token == ";":
+            break
+        elif token.startswith(":"):
+            branch[current] = float(token[1:])
+        elif token != "\n":
+            names[current] = token
+    if open_count != close_count:
+        raise ValueError(f"Mismatch, {open_count} open vs {close_count} close parentheses.")
+    for match in tokens:
+        raise ValueError(f"Text after semicolon in Newick tree: {match.group()}")
+
+    support = _support_and_names(names, children)
+    if root == 0:
+        # Nodes are created in preorder unless the root had to be replaced
+        return NewickTree(parent, branch, support, names)
+    order = _preorder(children, root)
+    new_id = {v: k for k, v in enumerate(order)}
+    return NewickTree([new_id[parent[v]] if parent[v] >= 0 else -1 for v in order],
+                      [branch[v] for v in order], [support[v] for v in order], [names[v] for v in order])
+
+def iter_newick_text(source):
+    """
+    Iterate over the Newick strings of a file (path or text handle), one tree at a time.
+    Lines are joined until one ends with ';', as Bio.Phylo.parse does.
+    """
+    if isinstance(source, str):
+        with open(source, 'r') as handle:
+            yield from iter_newick_text(handle)
+        return
+    buffer = ""
+    for line in source:
+        buffer += line.rstrip()
+        if buffer.endswith(";"):
+            yield buffer
+            buffer = ""
+    if buffer:
+        yield buffer
+
+def iter_newick(source):
+    """Iterate over the trees of a Newick file (path or text handle), one at a time."""
+    for text in iter_newick_text(source):
+        yield parse_newick(text)
+
+def read_newick(source):
+    """Read a file containing exactly one Newick tree."""
+    trees = iter_newick(source)
+    tree = next(trees, None)
+    if tree is None:
+        raise ValueError("There are no trees in this file.")
+    if next(trees, None) is not None:
+        raise ValueError("There are multiple trees in this file; use iter_newick() instead.")
+    return tree
+
+def _preorder(children, root):
+    order, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(reversed(children[node]))
+    return order
+
+class _Rerooter:
+    """
+    Mutable child lists of a NewickTree on which the Bio.Phylo rerooting steps are replayed.
+    Branch lengths are kept as Python floats (None when absent) so that every arithmetic step
+    matches Bio.Phylo's.
+    """
+    def __init__(self, tree):
+        n = len(tree)
+        self.children = [[] for _ in range(n)]
+        for v, up in enumerate(tree.parent.tolist()):
+            if up >= 0:
+                self.children[up].append(v)
+        self.parent = tree.parent.tolist()
+        self.branch = [None if np.isnan(b) else b for b in tree.branch.tolist()]
+        self.support = tree.support.tolist()
+        self.names = list(tree.names)
+        self.root = 0
+
+    def new_node(self, branch, children):
+        self.children.append(children)
+        self.parent.append(-1)
+        self.branch.append(branch)
+        self.support.append(np.nan)
+        self.names.append(None)
+        return len(self.names) - 1
+
+    def path(self, node):
+        """Nodes from below the root down to `node` (`Tree.get_path`)."""
+        path = []
+        while node != self.root:
+            path.append(node)
+            node = self.parent[node]
+        return path[::-1]
+
+    def root_with_outgroup(self, outgroup, outgroup_branch_length=None):
+        """`Tree.root_with_outgroup` on a single node."""
+        path = self.path(outgroup)
+        if not path:
+            return
+        moved = [self.root] + path
+        children, branch = self.children, self.branch
+        prev = branch[outgroup] or 0.0
+        if not children[outgroup] or outgroup_branch_length is not None:
+            branch[outgroup] = outgroup_branch_length or 0.0
+            new_root = self.new_node(branch[self.root], [outgroup])
+            if len(path) == 1:
+                new_parent = new_root
+            else:
+                up = path.pop(-2)
+                children[up].remove(outgroup)
+                prev, branch[up] = branch[up], prev - branch[outgroup]
+                children[new_root].insert(0, up)
+                new_parent = up
+        else:
+            new_root = new_parent = outgroup
+            branch[new_root] = branch[self.root]
+        for up in path[-2::-1]:
+            children[up].remove(new_parent)
+            prev, branch[up] = branch[up], prev
+            children[new_parent].insert(0, up)
+            new_parent = up
+        old_root = self.root
+        children[old_root].remove(outgroup if outgroup in children[old_root] else new_parent)
+        if len(children[old_root]) == 1:
+            # Drop the old bifurcating root, joining its two branches
+            ingroup = children[old_root][0]
+            branch[ingroup] = branch[ingroup] + prev if branch[ingroup] else prev
+            children[new_parent].insert(0, ingroup)
+        else:
+            branch[old_root] = prev
+            children[new_parent].insert(0, old_root)
+        self.root = new_root
+        self.parent[new_root] = -1
+        # Only the nodes on the old root path (and the new root) had their child lists changed
+        for node in [new_root] + moved:
+            if node != old_root or len(children[old_root]) != 1:
+                for child in children[node]:
+                    self.parent[child] = node
+
+    def deepest(self):
+        """First node in preorder with the largest root distance, and that distance (`Tree.depths`)."""
+        best = self.root
+        start = self.branch[self.root] or 0
+        best_depth = start
+        stack = [(self.root, start)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > best_depth:
+                best, best_depth = node, depth
+            for child in reversed(self.children[node]):
+                stack.append((child, depth + (self.branch[child] or 0)))
+        return best, best_depth
+
+    def eccentricities(self):
+        """Largest path length from every node to any node, for screening midpoint candidates."""
+        order = _preorder(self.children, self.root)
+        weight = [b or 0.0 for b in self.branch]
+        down = [0.0] * len(weight)
+        for node in reversed(order):
+            for child in self.children[node]:
+                down[node] = max(down[node], down[child] + weight[child])
+        up = [0.0] * len(weight)
+        for node in order:
+            # Longest and second longest reach through the children, to exclude a child's own branch
+            first = second = 0.0
+            first_child = None
+            for child in self.children[node]:
+                reach = down[child] + weight[child]
+                if reach > first:
+                    first, second, first_child = reach, first, child
+                elif reach > second:
+                    second = reach
+            for child in self.children[node]:
+                sibling = second if child == first_child else first
+                up[child] = weight[child] + max(up[node], sibling)
+        return [max(d, u) for d, u in zip(down, up)]
+
+    def root_at_midpoint(self):
+        """
+        `Tree.root_at_midpoint`: root at every tip in turn, keep the first tip with the largest
+        depth and the first deepest node in that rooting, then split the path between them.
+        Only tips within rounding of the longest path are measured exactly; the others are
+        rerooted (which sets the node order of the result) but cannot hold the maximum.
+        """
+        tips = [v for v in _preorder(self.children, self.root) if not self.children[v]]
+        eccentricity = self.eccentricities()
+        longest = max(eccentricity[tip] for tip in tips)
+        candidates = {tip for tip in tips if eccentricity[tip] >= longest * (1 - 1e-9) - 1e-12}
+        max_distance, tip1, tip2 = 0.0, None, None
+        for tip in tips:
+            self.root_with_outgroup(tip)
+            if tip in candidates:
+                node, depth = self.deepest()
+                if depth > max_distance:
+                    tip1, tip2, max_distance = tip, node, depth
+        if tip1 is None:
+            raise ValueError("Cannot root at midpoint: the tree has no positive path length.")
+        self.root_with_outgroup(tip1)
+        remainder = 0.5 * (max_distance - (self.branch[self.root] or 0))
+        for node in self.path(tip2):
+            remainder -= self.branch[node]
+            if remainder < 0:
+                self.root_with_outgroup(node, outgroup_branch_length=-remainder)
+                return
+        raise ValueError("Somehow, failed to find the midpoint!")
+
+    def to_tree(self):
+        order = _preorder(self.children, self.root)
+        new_id = {v: k for k, v in enumerate(order)}
+        return NewickTree([new_id[self.parent[v]] if v != self.root else -1 for v in order],
+                          [np.nan if self.branch[v] is None else self.branch[v] for v in order],
+                          [self.support[v] for v in order], [self.names[v] for v in order])
+
+class OutgroupResolver:
+    """
+    Picks a tree's outgroup from a priority list of candidate names in a single pass over its
+    node names, instead of one whole-tree search per candidate. Names match a candidate when
+    equal, or with `substring=True` when they contain it. Build it once and reuse it for
+    every tree of a file.
+    """
+    def __init__(self, candidates, substring=False):
+        self.candidates = list(candidates)
+        self.substring = substring
+        self.rank = {}
+        for rank, name in enumerate(self.candidates):
+            self.rank.setdefault(name, rank)
+
+    def rank_of(self, name):
+        """Priority of `name` (0 is best), or None if it matches no candidate."""
+        if not self.substring:
+            return self.rank.get(name)
+        return next((rank for rank, candidate in enumerate(self.candidates) if candidate in name), None)
+
+    def pick(self, names):
+        """
+        Position in `names` of the outgroup: the first name matching the highest-priority
+        candidate present, or None when no name matches. Empty names are skipped.
+        """
+        best = best_rank = None
+        for position, name in enumerate(names):
+            if not name:
+                continue
+            rank = self.rank_of(name)
+            if rank is not None and (best_rank is None or rank < best_rank):
+                best, best_rank = position, rank
+                if rank == 0:
+                    break
+        return best
+
+def root_by_outgroup(tree, resolver):
+    """Root `tree` on the node chosen by `resolver`, or at the midpoint when no candidate is present."""
+    node = resolver.pick(tree.names)
+    return root_with_outgroup(tree, node) if node is not None else root_at_midpoint(tree)
+
+def root_with_outgroup(tree, node, outgroup_branch_length=None):
+    """Return `tree` rerooted on node id `node`, as `Tree.root_with_outgroup` does."""
+    rerooter = _Rerooter(tree)
+    rerooter.root_with_outgroup(node, outgroup_branch_length)
+    return rerooter.to_tree()
+
+def root_at_midpoint(tree):
+    """Return `tree` rooted at the midpoint of its two most distant tips, as `Tree.root_at_midpoint` does."""
+    rerooter = _Rerooter(tree)
+    rerooter.root_at_midpoint()
+    return rerooter.to_tree()
@@ -0,0 +1,182 @@
+# tree_utils.py
+"""
+Array-backed helpers for fast distance calculations on Bio.Phylo trees and NewickTrees.
+The tree is walked once to record the parent, depth level and branch length of
+every clade in NumPy arrays, together with an Euler tour and a sparse table for
+constant-time lowest common ancestor (LCA) queries. All pairwise distances are
+then filled in with vectorized arithmetic instead of one `tree.distance` call
+(and two root-path walks) per pair. A NewickTree (see newick.py) is already stored
+in preorder arrays, so its index is built without any per-node Python work.
+Branch lengths are summed in the same order as Bio.Phylo, so the resulting
+matrices are identical to the ones produced by `tree.distance`.
+"""
+import numpy as np
+from newick import NewickTree
+
+class TreeIndex:
+    """
+    Preorder snapshot of a Bio.Phylo tree or NewickTree with an Euler tour LCA structure.
+    Node 0 is the root; `names`, `support` (NaN when absent) and `is_tip` describe node i,
+    and for a Bio.Phylo tree `clades[i]` is the clade stored as node i (None for a NewickTree).
+    """
+    def __init__(self, tree):
+        if isinstance(tree, NewickTree):
+            self._index_arrays(tree)
+        else:
+            self._index_clades(tree)
+        self.is_tip = self.subtree_end == np.arange(1, len(self.names) + 1)
+        # Same name resolution as Bio.Phylo: the first clade in preorder wins
+        self.name_to_node = {}
+        for idx, name in enumerate(self.names):
+            if name is not None:
+                self.name_to_node.setdefault(name, idx)
+        self._build_sparse_table()
+        self._path_sums = None
+
+    def _index_clades(self, tree):
+        root = getattr(tree, 'root', tree)
+        clades, parent, level, branch = [root], [-1], [0], [0.0]
+        euler, first, subtree_end = [0], [0], [0]
+        # Iterative depth-first walk: assigns preorder ids and records the Euler tour
+        stack = [(0, iter(root.clades))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                # Preorder ids make every subtree the contiguous id range [node, subtree_end[node])
+                subtree_end[node] = len(clades)
+                stack.pop()
+                if stack:
+                    euler.append(stack[-1][0])
+                continue
+            idx = len(clades)
+            clades.append(child)
+            parent.append(node)
+            level.append(level[node] + 1)
+            # Bio.Phylo skips missing branch lengths when summing a path
+            branch.append(child.branch_length if child.branch_length is not None else 0.0)
+            first.append(len(euler))
+            subtree_end.append(idx + 1)
+            euler.append(idx)
+            stack.append((idx, iter(child.clades)))
+        self.clades = clades
+        self.names = [clade.name for clade in clades]
+        self.support = np.array([np.nan if clade.confidence is None else clade.confidence for clade in clades],
+                                dtype=np.float64)
+        self.parent = np.array(parent, dtype=np.int64)
+        self.level = np.array(level, dtype=np.int64)
+        self.branch = np.array(branch, dtype=np.float64)
+        self.euler = np.array(euler, dtype=np.int64)
+        self.first = np.array(first, dtype=np.int64)
+        self.subtree_end = np.array(subtree_end, dtype=np.int64)
+
+    def _index_arrays(self, tree):
+        nodes = np.arange(len(tree), dtype=np.int64)
+        self.clades = None
+        self.names = tree.names
+        self.support = tree.support
+        self.parent = tree.parent
+        self.level = tree.level
+        self.branch = np.nan_to_num(tree.branch, nan=0.0)
+        self.branch[0] = 0.0
+        self.subtree_end = tree.subtree_end
+        # In preorder, node v enters the Euler tour after v nodes and v - level[v] returns to a parent,
+        # and its parent is revisited right after v's subtree (2 * size - 1 entries)
+        self.first = 2 * nodes - self.level
+        euler = np.empty(2 * len(nodes) - 1, dtype=np.int64)
+        euler[self.first] = nodes
+        euler[self.first[1:] + 2 * (self.subtree_end[1:] - nodes[1:]) - 1] = self.parent[1:]
+        self.euler = euler
+
+    def _build_sparse_table(self):
+        """Sparse table over the Euler tour: row k holds the shallowest position in each window of 2**k."""
+        euler_level = self.level[self.euler]
+        size = len(self.euler)
+        rows = [np.arange(size, dtype=np.int64)]
+        span = 1
+        while 2 * span <= size:
+            prev = rows[-1]
+            left = prev[:size - 2 * span + 1]
+            right = prev[span:size - span + 1]
+            row = np.arange(size, dtype=np.int64)
+            row[:len(left)] = np.where(euler_level[left] <= euler_level[right], left, right)
+            rows.append(row)
+            span *= 2
+        self.euler_level = euler_level
+        self.sparse = np.vstack(rows)
+
+    def children(self, node):
+        """Child node ids of `node`, in the clade order of the original tree."""
+        child = node + 1
+        end = self.subtree_end[node]
+        while child < end:
+            yield child
+            child = self.subtree_end[child]
+
+    def tip_names(self):
+        """Names of the terminal nodes in preorder (the order of `Tree.get_terminals`)."""
+        return [self.names[v] for v in np.flatnonzero(self.is_tip)]
+
+    def lookup(self, names):
+        """Map clade names to node ids."""
+        return np.array([self.name_to_node[name] for name in names], dtype=np.int64)
+
+    def lca(self, u, v):
+        """Vectorized lowest common ancestor of node id arrays `u` and `v` (broadcast together)."""
+        fu, fv = self.first[u], self.first[v]
+        lo = np.minimum(fu, fv)
+        hi = np.maximum(fu, fv)
+        # frexp gives the exact floor(log2(length)) for integer window lengths
+        k = np.frexp(hi - lo + 1)[1] - 1
+        left = self.sparse[k, lo]
+        right = self.sparse[k, hi - (1 << k) + 1]
+        pick = np.where(self.euler_level[left] <= self.euler_level[right], left, right)
+        return self.euler[pick]
+
+    def path_sums(self):
+        """
+        Table S where S[node, k] is the branch length from the level-k ancestor of `node` down to `node`.
+        Lengths are accumulated top-down, exactly as `Clade.distance` sums them.
+        """
+        if self._path_sums is None:
+            depth = int(self.level.max())
+            order = np.argsort(self.level, kind='stable')
+            by_level = np.split(order, np.searchsorted(self.level[order], np.arange(1, depth + 1)))
+            sums = np.zeros((len(self.names), depth + 1))
+            for lvl in range(1, depth + 1):
+                nodes = by_level[lvl]
+                # Extending the parent's running sums by one branch keeps the left-to-right summation order
+                sums[nodes] = sums[self.parent[nodes]]
+                sums[nodes, :lvl] += self.branch[nodes][:, None]
+            self._path_sums = sums
+        return self._path_sums
+
+    def distance_matrix(self, nodes):
+        """Full pairwise patristic distance matrix between the given node ids."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        sums = self.path_sums()
+        anc_level = self.level[self.lca(nodes[:, None], nodes[None, :])]
+        return sums[nodes[:, None], anc_level] + sums[nodes[None, :], anc_level]
+
+    def lca_depth_matrix(self, nodes):
+        """Pairwise matrix of the root-to-LCA distance, as `tree.distance(tree.common_ancestor(a, b))`."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return self.path_sums()[self.lca(nodes[:, None], nodes[None, :]), 0]
+
+    def parent_lca_distance_matrix(self, nodes):
+        """
+        Pairwise matrix of d(LCA, parent of a) + d(LCA, parent of b), each term computed as
+        `tree.distance(lca, tree.get_path(a)[-2])`, i.e. 0 for nodes at depth 0 or 1.
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        sums = self.path_sums()
+        anc = self.lca(nodes[:, None], nodes[None, :])
+
+        def to_parent(node):
+            # One of the LCA and the parent is an ancestor of the other: sum down from the upper one
+            parent = np.maximum(self.parent[node], 0)
+            lower = np.where(self.level[parent] >= self.level[anc], parent, anc)
+            upper_level = np.minimum(self.level[parent], self.level[anc])
+            return np.where(self.level[node] > 1, sums[lower, upper_level], 0.0)
+
+        return to_parent(nodes[:, None]) + to_parent(nodes[None, :])
@@ -0,0 +1,42 @@
+import os
+import sys
+import argparse
+import filecmp
+
+# Helper modules copied into each script folder; every copy must stay byte-identical
+SHARED_MODULES = {
+    'newick.py': ['02.ExonTree', '03.PCA', 'pipeline/full_run', 'pipeline/testing_tools',
+                  'release/v1.1_underconstruction'],
+    'tree_utils.py': ['02.ExonTree', '03.PCA', 'pipeline/full_run', 'release/v1.1_underconstruction'],
+    'exonerate_utils.py': ['02.ExonTree', 'pipeline/full_run', 'release/v1.1_underconstruction'],
+    'matrix_utils.py': ['pipeline/full_run', 'release/v1.1_underconstruction'],
+}
+
+def find_mismatches(root):
+    """Messages for every copy that is missing or differs from the module's first copy."""
+    mismatches = []
+    for module, folders in SHARED_MODULES.items():
+        paths = [os.path.join(folder, module) for folder in folders]
+        missing = [path for path in paths if not os.path.isfile(os.path.join(root, path))]
+        mismatches.extend(f"{path} is missing" for path in missing)
+        present = [path for path in paths if path not in missing]
+        for path in present[1:]:
+            if not filecmp.cmp(os.path.join(root, present[0]), os.path.join(root, path), shallow=False):
+                mismatches.append(f"{path} differs from {present[0]}")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the copied helper modules are identical in every folder')
+    parser.add_argument('--root', type=str, default=os.path.dirname(os.path.abspath(__file__)),
+                        help='Repository root (default: the folder of this script)')
+    args = parser.parse_args()
+
+    mismatches = find_mismatches(args.root)
+    for message in mismatches:
+        print(message)
+    if mismatches:
+        sys.exit(1)
+    print(f"All copies of {', '.join(SHARED_MODULES)} are identical")
+
+if __name__ == "__main__":
+    main()
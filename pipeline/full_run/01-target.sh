@@ -72,8 +72,7 @@ cat ./gene_list.txt | parallel --jobs ${threads} '
     ls "./all_trees/${gene_name_shorter}"*"tre" > ./loop.treelist.txt;
     i=1;
     while read filename; do
-        python matrix_ult.py -t "${filename}" -n "./all_trees/${gene_name_shorter}.${i}.list.txt" -o "./all_trees/${gene_name_shorter}.${i}.matrix";
-        cp "./all_trees/${gene_name_shorter}.${i}.matrix" "./all_trees/${gene_name_shorter}.${i}.cleaned.csv";
+        python matrix_ult.py -t "${filename}" -n "./all_trees/${gene_name_shorter}.${i}.list.txt" -o "./all_trees/${gene_name_shorter}.${i}.matrix.npz";
         ((i++));
     done < ./loop.treelist.txt;
 '
@@ -2,6 +2,7 @@ import argparse
 import os
 import pandas as pd
 import numpy as np
+from matrix_utils import MATRIX_SUFFIX, read_matrix_frame, ordered_row_sums
 from sklearn.preprocessing import StandardScaler
 
 def distance_to_similarity(distance_df):
@@ -63,43 +64,48 @@ def normalize_columns(df):
     return df
 
 def process_matrices(directory, proj_name, threshold, flag):
-    all_matrices = []
-    
+    row_names, totals = [], []
+    column_order = {}
+
+    # Collect one matrix file per tree prefix, preferring the binary .matrix.npz store
+    matrix_files = {}
     for filename in os.listdir(directory):
-        if filename.endswith('cleaned.csv'):
-            # Load the matrix
-            matrix_path = os.path.join(directory, filename)
-            matrix = pd.read_csv(matrix_path)
-            
-            # Clean up the matrix
-            matrix = clean_up_matrix(matrix, proj_name, threshold, flag) 
-            # Apply distance to similarity transformation
-            matrix = distance_to_similarity(matrix)
-
-            # Check if there are any numeric columns left before normalization
+        if filename.endswith(MATRIX_SUFFIX):
+            matrix_files[filename[:-len('matrix.npz')]] = filename
+        elif filename.endswith('cleaned.csv'):
+            matrix_files.setdefault(filename.split("cleaned.csv")[0], filename)
+
+    for filename in matrix_files.values():
+        # Load the matrix
+        matrix_path = os.path.join(directory, filename)
+        matrix = read_matrix_frame(matrix_path)
+        
+        # Clean up the matrix
+        matrix = clean_up_matrix(matrix, proj_name, threshold, flag) 
+        # Apply distance to similarity transformation
+        matrix = distance_to_similarity(matrix)
+
+        # Check if there are any numeric columns left before normalization
 #             if not matrix.select_dtypes(include=[np.number]).empty:
 #                 # Normalize the matrix
 #                 matrix = normalize_columns(matrix)
 
-            # Append to the list of all matrices
-            all_matrices.append(matrix)
-
-    # Concatenate all matrices into a single DataFrame
-    total_matrix = pd.concat(all_matrices, ignore_index=True)
+        # Reduce the matrix to its row totals right away so only one matrix is held in memory;
+        # the columns are added in the order of the concatenation of all matrices
+        row_names.append(matrix.iloc[:, 0].to_numpy(dtype=object))
+        totals.append(ordered_row_sums(matrix.iloc[:, 1:], column_order))
 
-    # Merge all matrices by row names
-    total_matrix = pd.concat(all_matrices, ignore_index=True)
-    total_matrix.fillna(0, inplace=True)
-    # Sum only the numeric columns, excluding the first column with row names
-    numeric_cols = [col for col in total_matrix.columns if col != 'Unnamed: 0']
-    total_matrix['total_value'] = total_matrix[numeric_cols].sum(axis=1)
-    final_output = total_matrix[['Unnamed: 0', 'total_value']].rename(columns={'Unnamed: 0': 'row_name'})
+    # Stack the per-matrix row totals
+    final_output = pd.DataFrame({
+        'row_name': np.concatenate(row_names) if row_names else np.array([], dtype=object),
+        'total_value': np.concatenate(totals) if totals else np.array([], dtype=np.float64),
+    })
     
     return final_output
 
 def main():
     parser = argparse.ArgumentParser(description='Process batch of matrix files into a single similarity matrix.')
-    parser.add_argument('input_dir', type=str, help='Directory containing the matrix CSV files')
+    parser.add_argument('input_dir', type=str, help='Directory containing the per-tree matrix files (.matrix.npz or cleaned.csv)')
     parser.add_argument('output_file', type=str, help='Output file path for the similarity matrix')
     parser.add_argument('removing_pattern', type=str, help='Name of the target sequences to be removed')
     parser.add_argument('--threshold', type=float, default=1.96, help='Threshold for value adjustment in clean_up_matrix function')
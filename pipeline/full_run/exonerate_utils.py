@@ -0,0 +1,59 @@
+# exonerate_utils.py
+"""
+Reader for HybPiper's per-gene `exonerate_stats.tsv`.
+The coordinate columns hold stringified lists of ranges such as "[(0, 120), (150, 300)]".
+Instead of calling `eval` on every cell, a whole column is parsed at once with a regular
+expression into flat NumPy start/end arrays plus per-row offsets (the ranges of row i are
+`starts[offsets[i]:offsets[i + 1]]`). Cells that are not a plain list of integer pairs
+raise a ValueError, so no text from the TSV is ever executed.
+"""
+import numpy as np
+import pandas as pd
+
+# Column positions in exonerate_stats.tsv
+CONTIG_ID_COL = 3
+QUERY_RANGES_COL = 6
+HIT_RANGES_COL = 13
+
+RANGE_PAIR = r'\(\s*(-?\d+)\s*,\s*(-?\d+)\s*\)'
+
+def parse_ranges(column):
+    """
+    Parse a column of stringified range lists.
+    Returns (starts, ends, offsets) as int64 arrays, with offsets of length len(column) + 1.
+    """
+    column = column.astype(str)
+    # A valid cell is "[", integer pairs separated by commas, "]"
+    leftover = column.str.replace(RANGE_PAIR, '', regex=True).str.replace(r'[\s,]', '', regex=True)
+    invalid = leftover != '[]'
+    if invalid.any():
+        bad = column[invalid]
+        raise ValueError(f"Malformed coordinate ranges in row {bad.index[0]}: {bad.iloc[0]!r}")
+    pairs = column.str.extractall(RANGE_PAIR)
+    counts = pairs.groupby(level=0).size().reindex(column.index, fill_value=0).to_numpy()
+    offsets = np.zeros(len(column) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return pairs[0].to_numpy(dtype=np.int64), pairs[1].to_numpy(dtype=np.int64), offsets
+
+def row_ranges(parsed, i):
+    """List of (start, end) tuples of row `i` from `parse_ranges` output."""
+    starts, ends, offsets = parsed
+    lo, hi = offsets[i], offsets[i + 1]
+    return list(zip(starts[lo:hi].tolist(), ends[lo:hi].tolist()))
+
+def read_exonerate_stats(stats_file, stop_marker, required=False):
+    """
+    Read an exonerate_stats.tsv, keeping only the rows above the first row whose first cell
+    is `stop_marker`, and parse its coordinate columns once. If the marker is absent, all rows
+    are kept, or a ValueError is raised when it is `required`.
+    Returns (df, query_ranges, hit_ranges); the ranges are `parse_ranges` tuples.
+    """
+    df = pd.read_csv(stats_file, sep='\t')
+    end_idx = df[df.iloc[:, 0] == stop_marker].index
+    if len(end_idx) > 0:
+        df = df.loc[:end_idx[0] - 1]
+    elif required:
+        raise ValueError(f"{stats_file}: no '{stop_marker}' row")
+    query_ranges = parse_ranges(df.iloc[:, QUERY_RANGES_COL])
+    hit_ranges = parse_ranges(df.iloc[:, HIT_RANGES_COL])
+    return df, query_ranges, hit_ranges
@@ -1,31 +1,25 @@
 import argparse
-from Bio import Phylo
 import pandas as pd
-import numpy as np
+from tree_utils import TreeIndex
+from newick import read_newick
 
 def calculate_genetic_distance(tree_file):
     # Read the tree file
     tree = tree_file
 
-    # Get the list of terminal node names (i.e., taxa)
-    taxa = [leaf.name for leaf in tree.get_terminals()]
+    # Terminal node names (i.e., taxa), in tip order
+    index = TreeIndex(tree)
+    taxa = index.tip_names()
 
-    # Initialize a matrix to store the distances
-    distance_matrix = np.zeros((len(taxa), len(taxa)))
-
-    # Calculate pairwise distances
-    for i in range(len(taxa)):
-        for j in range(i+1, len(taxa)):
-            distance = tree.distance(taxa[i], taxa[j])
-            distance_matrix[i, j] = distance
-            distance_matrix[j, i] = distance
+    # Calculate pairwise distances in one pass (same values as tree.distance for every pair)
+    distance_matrix = index.distance_matrix(index.lookup(taxa))
 
     return taxa, distance_matrix
 
 
 def genetic_distance_matrix(tree_file, output_file):
     # Load the tree
-    tree = Phylo.read(tree_file, 'newick')
+    tree = read_newick(tree_file)
 
     clades, distance_matrix = calculate_genetic_distance(tree)
 
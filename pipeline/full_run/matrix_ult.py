@@ -1,98 +1,99 @@
 import argparse
-from Bio import Phylo
 import pandas as pd
 import numpy as np
+from tree_utils import TreeIndex
+from newick import read_newick, OutgroupResolver, root_by_outgroup
+from matrix_utils import save_distance_matrix
+
+# Outgroups by priority, matched as substrings of the node names
+REROOT_TAXA = OutgroupResolver(["Amborella", "Nymphaea", "Austrobaileya"], substring=True)
+
+def find_node_sister_taxa(index):
+    # Resolve the sister taxa of every NODE tip in one sweep over the indexed tree
+    names = index.names
+    is_tip = index.is_tip.tolist()
+    is_real = [tip and "NODE" not in name for tip, name in zip(is_tip, names)]
+
+    # Non-NODE tips under node v are real_names[real_before[v]:real_before[subtree_end[v]]]
+    real_names = [name for name, real in zip(names, is_real) if real]
+    real_before = np.concatenate(([0], np.cumsum(is_real)))
+    end = index.subtree_end
+
+    # Post-order pass: for each internal node, the first child clade holding non-NODE tips
+    sister_range = [None] * len(names)
+    for v in range(len(names) - 1, 0, -1):
+        if is_tip[v]:
+            continue
+        for child in index.children(v):
+            lo, hi = real_before[child], real_before[end[child]]
+            if hi > lo:
+                sister_range[v] = (lo, hi)
+                break
 
-def find_clade_and_move(tree, taxa_name):
-    # Find the matching leaf and the smallest clade containing this leaf
-    target_leaf = None
-    for leaf in tree.get_terminals():  # Iterate through all terminal nodes
-        if leaf.name == taxa_name:
-            target_leaf = leaf
-            break  # Stop when the target leaf is found
-    
-    # Initialize the list for recording taxa names
-    recorded_taxa = []
-    
-    if target_leaf:
-        # Get the path from the root to this leaf, which includes all its ancestors
-        path_to_leaf = tree.get_path(target_leaf)
-        
-        # Iterate from the leaf up to the root
-        for clade in reversed(path_to_leaf):
-            # Check sister groups of the current clade
-            parent = clade
-            if parent.clades:  # Ensure this clade has child nodes (i.e., is not a leaf itself)
-                for sister in parent.clades:
-                    if sister != clade and any("NODE" not in leaf.name for leaf in sister.get_terminals()):
-                        # Record names from the sister group if they don't contain "NODE"
-                        recorded_taxa.extend([leaf.name for leaf in sister.get_terminals() if "NODE" not in leaf.name])
-                        break  # Stop checking other sisters once a valid one is found
-                else:
-                    # If no valid sister group is found, move up to the upper clade
-                    continue
-                
+    # Duplicate tip names all resolve to the first tip carrying that name
+    first_tip = {}
+    for v, name in enumerate(names):
+        if is_tip[v]:
+            first_tip.setdefault(name, v)
+
+    # Support above 0.7 (a missing support never stops the traversal)
+    strong = (index.support > 0.7).tolist()
+    records = []
+    for v, name in enumerate(names):
+        if not is_tip[v] or "NODE" not in name:
+            continue
+        recorded_taxa = []
+        # Climb from the parent up to (but excluding) the root
+        node = index.parent[first_tip[name]]
+        while node > 0:
+            if sister_range[node] is not None:
+                lo, hi = sister_range[node]
+                recorded_taxa.extend(real_names[lo:hi])
                 # If the clade has a support value above 0.7, stop the traversal
-                if parent.confidence is not None and parent.confidence > 0.7:
+                if strong[node]:
                     break
-    
-    # Return the list of recorded taxa names, excluding any that contain "NODE"
-    return recorded_taxa
+            node = index.parent[node]
+        if recorded_taxa:  # Only add if there are recorded taxa
+            records.append((name, recorded_taxa))
+
+    return records
 
-def calculate_genetic_distance(tree_file):
+def calculate_genetic_distance(tree_file, index=None):
     # Read the tree file
     tree = tree_file
 
-    # Get the list of terminal node names (i.e., taxa)
-    taxa = [leaf.name for leaf in tree.get_terminals()]
+    # Terminal node names (i.e., taxa), in tip order
+    if index is None:
+        index = TreeIndex(tree)
+    taxa = index.tip_names()
 
-    # Initialize a matrix to store the distances
-    distance_matrix = np.zeros((len(taxa), len(taxa)))
-
-    # Calculate pairwise distances
-    for i in range(len(taxa)):
-        for j in range(i+1, len(taxa)):
-            distance = tree.distance(taxa[i], taxa[j])
-            distance_matrix[i, j] = distance
-            distance_matrix[j, i] = distance
+    # Calculate pairwise distances in one pass (same values as tree.distance for every pair)
+    distance_matrix = index.distance_matrix(index.lookup(taxa))
 
     return taxa, distance_matrix
 
 
 def genetic_distance_matrix(tree_file, node_output_file, output_file):
     # Load the tree
-    tree = Phylo.read(tree_file, 'newick')
-
-    # Reroot logic, assuming this part remains unchanged
-    reroot_taxa = ["Amborella", "Nymphaea", "Austrobaileya"]
-    for taxa in reroot_taxa:
-        for clade in tree.find_clades():
-            if clade.name and taxa in clade.name:  # Ensure clade.name is not None
-                tree.root_with_outgroup(clade)
-                break
-        else:
-            continue
-        break
-    else:
-        tree.root_at_midpoint()
+    tree = read_newick(tree_file)
 
-    # Initialize a list to store records for tips that contain "NODE"
-    node_records = []
+    # Reroot on the first available outgroup in one pass over the names; midpoint if none
+    tree = root_by_outgroup(tree, REROOT_TAXA)
 
-    # Screen all the tip names (terminal nodes)
-    for tip in tree.get_terminals():  # Iterate through terminal nodes only
-        if tip.name and "NODE" in tip.name:  # Check if tip has a name and contains "NODE"
-            recorded_taxa = find_clade_and_move(tree, tip.name)
-            if recorded_taxa:  # Only add if there are recorded taxa
-                node_records.append(f'{tip.name}: {"; ".join(recorded_taxa)}')
+    # Index the rerooted tree once for both the NODE records and the distances
+    index = TreeIndex(tree)
 
     # Writing the NODE information to a file
     with open(node_output_file, 'w') as file:
-        for record in node_records:
-            file.write(f'{record}\n')
+        for tip_name, recorded_taxa in find_node_sister_taxa(index):
+            file.write(f'{tip_name}: {"; ".join(recorded_taxa)}\n')
 
     # Proceed with the distance matrix calculation (same as before)
-    clades, distance_matrix = calculate_genetic_distance(tree)
+    clades, distance_matrix = calculate_genetic_distance(tree, index)
+    # A .npz output keeps the matrix binary (labels + float32), anything else is written as CSV
+    if output_file.endswith('.npz'):
+        save_distance_matrix(output_file, clades, distance_matrix)
+        return
     df = pd.DataFrame(distance_matrix)
     df.columns = clades
     df.index = clades
@@ -102,7 +103,7 @@ def main():
     parser = argparse.ArgumentParser(description='Calculate genetic distances and find NODE related taxa in a Newick tree file.')
     parser.add_argument('-t', '--tree', required=True, help='Path to the Newick tree file.')
     parser.add_argument('-n', '--node_output', required=True, help='Path to the output text file for NODE related taxa.')
-    parser.add_argument('-o', '--output', required=True, help='Path to the output CSV file for the genetic distance matrix.')
+    parser.add_argument('-o', '--output', required=True, help='Path to the output file for the genetic distance matrix (CSV, or binary if it ends with .npz).')
     args = parser.parse_args()
 
     genetic_distance_matrix(args.tree, args.node_output, args.output)
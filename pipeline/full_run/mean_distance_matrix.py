@@ -1,43 +1,45 @@
 import argparse
-from Bio import Phylo
 import numpy as np
 import pandas as pd
-
-def pairwise_distances(trees, species):
-    """Calculate pairwise distances for all species across all trees."""
-    # Initialize a dictionary to hold the sum of distances and counts
-    distances_sum = { (s1, s2): 0.0 for s1 in species for s2 in species if s1 != s2 }
-    counts = { (s1, s2): 0 for s1 in species for s2 in species if s1 != s2 }
-
+from tree_utils import TreeIndex
+from newick import iter_newick
+
+def pairwise_distances(trees, tree_matrix=TreeIndex.distance_matrix):
+    """
+    Calculate the mean pairwise distance of every species pair over the trees containing both.
+    Trees are consumed one at a time: each tree's tip matrix, `tree_matrix(index, nodes)`
+    (patristic distances by default, see tree_utils), is computed once and added to global
+    sum and count arrays through the species' global indices.
+    Returns (sorted species list, mean distance matrix); pairs never seen together stay 0.
+    """
+    index_of = {}
+    capacity = 0
+    sums = np.zeros((0, 0))
+    counts = np.zeros((0, 0), dtype=np.int64)
     for tree in trees:
-        for s1 in species:
-            for s2 in species:
-                if s1 != s2:
-                    try:
-                        distance = tree.distance(s1, s2)
-                        distances_sum[(s1, s2)] += distance
-                        counts[(s1, s2)] += 1
-                    except:
-                        # Handle cases where the species pair is not in the tree
-                        pass
-
+        index = TreeIndex(tree)
+        # Each species once per tree, resolved to its first clade as tree.distance does
+        names = list(dict.fromkeys(index.tip_names()))
+        for name in names:
+            index_of.setdefault(name, len(index_of))
+        if len(index_of) > capacity:
+            capacity = max(len(index_of), 2 * capacity)
+            sums = np.pad(sums, ((0, capacity - len(sums)),) * 2)
+            counts = np.pad(counts, ((0, capacity - len(counts)),) * 2)
+        glob = np.array([index_of[name] for name in names], dtype=np.int64)
+        sums[np.ix_(glob, glob)] += tree_matrix(index, index.lookup(names))
+        counts[np.ix_(glob, glob)] += 1
+
+    species = sorted(index_of)
+    order = np.array([index_of[name] for name in species], dtype=np.int64)
+    sums, counts = sums[np.ix_(order, order)], counts[np.ix_(order, order)]
     # Average the distances
-    for pair in distances_sum:
-        if counts[pair] > 0:
-            distances_sum[pair] /= counts[pair]
-
-    return distances_sum
-
-def create_distance_matrix(distances, species):
-    """Create a distance matrix from the averaged distances."""
-    matrix = np.zeros((len(species), len(species)))
-
-    for i, s1 in enumerate(species):
-        for j, s2 in enumerate(species):
-            if i != j:
-                matrix[i, j] = distances.get((s1, s2), 0.0)
-                matrix[j, i] = matrix[i, j]  # Symmetric matrix
+    matrix = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    np.fill_diagonal(matrix, 0.0)
+    return species, matrix
 
+def create_distance_matrix(matrix, species):
+    """Create a distance matrix DataFrame from the averaged distances."""
     return pd.DataFrame(matrix, index=species, columns=species)
 
 def main():
@@ -46,19 +48,11 @@ def main():
     parser.add_argument('output_file', type=str, help='Output file for the distance matrix')
     args = parser.parse_args()
 
-    trees = list(Phylo.parse(args.input_file, 'newick'))
-    species = set()
-    for tree in trees:
-        species.update([term.name for term in tree.get_terminals()])
-    
-    # Convert species set to a list for consistent ordering
-    species_list = sorted(list(species))
-
-    distances = pairwise_distances(trees, species_list)
-    distance_matrix = create_distance_matrix(distances, species_list)
+    # Trees are streamed from the file, not loaded all at once
+    species_list, matrix = pairwise_distances(iter_newick(args.input_file))
+    distance_matrix = create_distance_matrix(matrix, species_list)
 
     distance_matrix.to_csv(args.output_file, sep=',')
 
 if __name__ == "__main__":
     main()
-
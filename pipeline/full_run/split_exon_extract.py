@@ -1,51 +1,75 @@
 import argparse
+import bisect
+import io
 import os
-import pandas as pd
-from intervaltree import Interval, IntervalTree
 from Bio import SeqIO
+from exonerate_utils import CONTIG_ID_COL, read_exonerate_stats, row_ranges
 
-def extract_contigs(row, fasta_sequences, output_dir):
-    ranges = eval(row.iloc[13])
-    sequence_id = row.iloc[3]
-    sequence = next((seq for seq in fasta_sequences if seq.id == sequence_id), None)
+def index_contigs(fasta_file_path):
+    # Contig ID -> record; the first record wins if an ID repeats
+    contigs = {}
+    for record in SeqIO.parse(fasta_file_path, "fasta"):
+        contigs.setdefault(record.id, record)
+    return contigs
+
+def extract_contigs(sequence_id, ranges, exon_names, contigs, exon_records):
+    sequence = contigs.get(sequence_id)
     if sequence is None:
         print(f"Sequence {sequence_id} not found in fasta file.")
         return
 
     for i, (start, end) in enumerate(ranges):
-        exon_name = row['exon_names'][i]
+        exon_name = exon_names[i]
         contig = sequence[start:end]
         # Include both the exon name and a unique identifier in the contig ID
         contig.id = f"{exon_name}_{sequence_id}_{i+1}"
         contig.description = ""
 
-        # Write to a fasta file
-        file_path = os.path.join(output_dir, f"{exon_name}.fasta")
-        with open(file_path, "a") as output_handle:
-            SeqIO.write(contig, output_handle, "fasta")
+        # Collect per exon; write_exon_fastas writes each fasta file once
+        exon_records.setdefault(exon_name, []).append(contig)
 
 
-def clean_fasta(row, fasta_sequences, output_dir):
-    ranges = eval(row.iloc[13])
-    sequence_id = row.iloc[3]
-    sequence = next((seq for seq in fasta_sequences if seq.id == sequence_id), None)
-    if sequence is None:
-        print(f"Sequence {sequence_id} not found in fasta file.")
-        return
-
-    for i, (start, end) in enumerate(ranges):
-        exon_name = row['exon_names'][i]
+def write_exon_fastas(exon_records, output_dir):
+    # Format each exon fasta in memory, write it under a temporary name and rename it into place
+    for exon_name, records in exon_records.items():
+        buffer = io.StringIO()
+        SeqIO.write(records, buffer, "fasta")
         file_path = os.path.join(output_dir, f"{exon_name}.fasta")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-
-def check_overlap(exon_ranges, start, end, overlap_percentage):
-    for (exon_start, exon_end), exon_name in exon_ranges:
-        overlap = min(end, exon_end) - max(start, exon_start)
-        if overlap > 0 and (overlap / (max(end, exon_end) - min(start, exon_start)) >= overlap_percentage):
-            return exon_name
-    return None
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w") as output_handle:
+            output_handle.write(buffer.getvalue())
+        os.replace(tmp_path, file_path)
+
+
+class ExonIndex:
+    # Discovered exons sorted by start. An interval with overlap >= overlap_percentage * union
+    # must start within length * (1 - p) / p of the new one, so only that window is compared.
+    # Returns the first-discovered matching exon, like a scan of the discovery-ordered list.
+    def __init__(self, overlap_percentage):
+        self.overlap_percentage = overlap_percentage
+        self.starts = []
+        self.entries = []  # (start, discovery order, end, exon name), sorted like starts
+
+    def add(self, start, end, exon_name):
+        pos = bisect.bisect_right(self.starts, start)
+        self.starts.insert(pos, start)
+        self.entries.insert(pos, (start, len(self.entries), end, exon_name))
+
+    def find(self, start, end):
+        if self.overlap_percentage > 0:
+            window = (end - start) * (1 - self.overlap_percentage) / self.overlap_percentage + 1
+            lo = bisect.bisect_left(self.starts, start - window)
+            hi = bisect.bisect_right(self.starts, start + window)
+        else:
+            lo, hi = 0, len(self.entries)
+        best = None
+        for exon_start, order, exon_end, exon_name in self.entries[lo:hi]:
+            if best is not None and order > best[0]:
+                continue
+            overlap = min(end, exon_end) - max(start, exon_start)
+            if overlap > 0 and (overlap / (max(end, exon_end) - min(start, exon_start)) >= self.overlap_percentage):
+                best = (order, exon_name)
+        return best[1] if best is not None else None
 
 def main():
     parser = argparse.ArgumentParser()
@@ -61,24 +85,19 @@ def main():
     # Make the output directory
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
-    df = pd.read_csv(file_path, sep='\t')
-    # Find the index of the row where the first cell is "Hits with subsumed hits removed"
-    end_index = df[df.iloc[:, 0] == 'Hits with subsumed hits removed'].index[0]
-
-    # Only keep the rows above this index
-    df = df.loc[:end_index-1]
+    # Only keep the rows above "Hits with subsumed hits removed"; the coordinate columns are parsed once here
+    df, query_ranges, hit_ranges = read_exonerate_stats(file_path, 'Hits with subsumed hits removed', required=True)
 
-    exon_ranges = []
+    exon_index = ExonIndex(args.overlap_percentage)
     exon_names = []
 
-    for index, row in df.iterrows():
-        ranges = eval(row.iloc[6])
+    for index in range(len(df)):
         row_names = []
-        for i, (start, end) in enumerate(ranges):
-            overlap_name = check_overlap(exon_ranges, start, end, args.overlap_percentage)
+        for i, (start, end) in enumerate(row_ranges(query_ranges, index)):
+            overlap_name = exon_index.find(start, end)
             if overlap_name is None:
                 exon_name = f'{data_name}_{args.gene_name}_exon_{i+1}'
-                exon_ranges.append(((start, end), exon_name))
+                exon_index.add(start, end, exon_name)
             else:
                 exon_name = overlap_name
             row_names.append(exon_name)
@@ -93,18 +112,15 @@ def main():
     df.to_csv(output_file_path, sep='\t', index=False)
 
     fasta_file_path = os.path.join(args.input_dir, args.gene_name, f"{args.gene_name}_contigs.fasta")
-    fasta_sequences = list(SeqIO.parse(fasta_file_path, "fasta"))
-
-    for index, row in df.iterrows():
-        if row.iloc[9] == "-1":
-            row['exon_names'] = row['exon_names'][::-1]
-        clean_fasta(row, fasta_sequences, args.output_dir)
-
-
-    for index, row in df.iterrows():
-        if row.iloc[9] == "-1":
-            row['exon_names'] = row['exon_names'][::-1]
-        extract_contigs(row, fasta_sequences, args.output_dir)
+    contigs = index_contigs(fasta_file_path)
+
+    exon_records = {}
+    rows = zip(df.iloc[:, CONTIG_ID_COL].tolist(), df.iloc[:, 9].tolist(), exon_names)
+    for index, (sequence_id, strand, row_names) in enumerate(rows):
+        if strand == "-1":
+            row_names = row_names[::-1]
+        extract_contigs(sequence_id, row_ranges(hit_ranges, index), row_names, contigs, exon_records)
+    write_exon_fastas(exon_records, args.output_dir)
 if __name__ == '__main__':
     main()
 
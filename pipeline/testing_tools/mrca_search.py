@@ -1,30 +1,29 @@
 import csv
-from Bio import Phylo
+from newick import read_newick, OutgroupResolver, root_by_outgroup
 import argparse
 
+ROOT_NAMES = OutgroupResolver(['amborella', 'water_lily'])
+
 def reroot_tree(tree):
     # Reroot the tree by 'amborella', if not exist then 'water lily', if both not exist, root by midpoint.
-    for root_name in ['amborella', 'water_lily']:
-        root_clades = list(tree.find_clades(name=root_name))
-        if root_clades:
-            tree.root_with_outgroup(root_clades[0])
-            return tree
-    tree.root_at_midpoint()
-    return tree
+    return root_by_outgroup(tree, ROOT_NAMES)
 
 def analyze_unknown_species(tree):
     results = {}
+    is_tip = tree.is_tip()
     # Find unknown species (any species with 'NODE' in its name).
-    unknown_species = [clade for clade in tree.get_terminals() if 'NODE' in clade.name]
-    
+    unknown_species = [v for v in tree.tips() if 'NODE' in tree.names[v]]
+
     for unknown in unknown_species:
-        path_to_root = tree.get_path(unknown)
-        for clade in reversed(path_to_root):  # Start from the node closest to the unknown and move up
-            if clade.confidence is not None and clade.confidence > 0.75:
+        node = unknown
+        while node > 0:  # Start from the unknown and move up, excluding the root
+            if tree.support[node] > 0.75:
                 # Get all species or clades within this clade, excluding unknowns
-                clade_group = [term.name for term in clade.get_terminals() if 'NODE' not in term.name]
-                results[unknown.name] = clade_group
+                clade_group = [tree.names[v] for v in range(node, tree.subtree_end[node])
+                               if is_tip[v] and 'NODE' not in tree.names[v]]
+                results[tree.names[unknown]] = clade_group
                 break  # Stop at the first clade with support > 0.75
+            node = tree.parent[node]
     return results
 
 def write_to_csv(output_file, analysis_results):
@@ -37,7 +36,7 @@ def write_to_csv(output_file, analysis_results):
             writer.writerow({'Unknown_Species': unknown, 'Related_Clade': ', '.join(clade_group)})
 
 def main(args):
-    tree = Phylo.read(args.input, 'newick')
+    tree = read_newick(args.input)
     tree = reroot_tree(tree)
     analysis_results = analyze_unknown_species(tree)
     
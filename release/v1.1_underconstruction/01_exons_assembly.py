@@ -4,7 +4,7 @@
 This script performs the following steps:
 1. Quality trimming of raw reads using fastp.
 2. Assembly of target sequences using HybPiper.
-3. For each gene in the provided gene list:
+3. For each gene in the provided gene list (genes run in parallel worker processes):
     - Processes exon data from exonerate results.
     - Extracts exon sequences from assembled contigs.
     - Writes exon assignments to a TSV file and creates FASTA files for each exon.
@@ -23,69 +23,111 @@ Arguments:
 - `-ov`, `--overlap`: Overlap ratio to consider the same exon (default is 0.8).
 - `--output_hyb`: Output folder for HybPiper results (default is "01_hyb_output").
 - `--output_exon`: Output folder for exon FASTAs (default is "02_exon_extracted").
+- `--extract_workers`: Worker processes for per-gene exon extraction (default is the thread count).
+- `--resume`: Skip steps and genes recorded as completed in `<proj_name>.manifest.jsonl` whose inputs are unchanged.
 
 Example usage:
 python 01_exons_assembly.py -c config.yaml -t 8 -r1 reads_1.fastq -r2 reads_2.fastq -p my_project -g gene_list.txt
 or
 python 01_exons_assembly.py --threads 8 --read1 reads_1.fastq --read2 reads_2.fastq --proj_name my_project --gene_list gene_list.txt
 """
+import io
 import os
 import sys
+import bisect
 import argparse
-import pandas as pd
+import contextlib
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from Bio import SeqIO
 # Import shared utilities
 from pipeline_utils import log_status, run_command, is_valid_project_name, load_config
+from exonerate_utils import CONTIG_ID_COL, read_exonerate_stats, row_ranges
+from checkpoint import Manifest, manifest_path
 
-def extract_contigs(row, fasta_sequences, output_dir):
+def index_contigs(contigs_fasta):
     """
-    Extract contig sequences for each exon in the DataFrame row and append to exon-specific FASTA files.
+    Map contig IDs to their sequence records, read once per gene.
+    If an ID occurs more than once, the first record is kept (as a linear search would find it).
+    """
+    contigs = {}
+    for record in SeqIO.parse(contigs_fasta, "fasta"):
+        contigs.setdefault(record.id, record)
+    return contigs
+
+def extract_contigs(sequence_id, ranges, exon_names, contigs, exon_records):
+    """
+    Extract the exon segments (contig coordinate `ranges`, named by `exon_names`) of one
+    alignment hit on contig `sequence_id` and collect them in `exon_records`
+    (exon name -> list of records), to be written by `write_exon_fastas`.
     """
-    ranges = eval(row.iloc[13])  # exon coordinate ranges
-    sequence_id = row.iloc[3]
     # Find the full sequence record corresponding to this contig ID
-    sequence = next((seq for seq in fasta_sequences if seq.id == sequence_id), None)
+    sequence = contigs.get(sequence_id)
     if sequence is None:
         print(f"Warning: Sequence {sequence_id} not found in FASTA.")
         return
-    # Write each exon segment to its respective FASTA file
+    # Collect each exon segment under its respective exon
     for i, (start, end) in enumerate(ranges):
-        exon_name = row['exon_names'][i]
+        exon_name = exon_names[i]
         contig = sequence[start:end]              # extract subsequence for the exon
         contig.id = f"{exon_name}_{sequence_id}_{i+1}"
         contig.description = ""
-        exon_file = os.path.join(output_dir, f"{exon_name}.fasta")
-        with open(exon_file, "a") as fh:
-            SeqIO.write(contig, fh, "fasta")
+        exon_records.setdefault(exon_name, []).append(contig)
 
-def clean_fasta(row, fasta_sequences, output_dir):
+def write_exon_fastas(exon_records, output_dir):
     """
-    Remove existing exon FASTA files for the exons present in the given row.
-    This prevents old data from previous genes from accumulating in the files.
+    Write each exon's records to `<exon_name>.fasta` in `output_dir`, replacing files from previous runs.
+    Every file is formatted in memory, written once to a temporary name and renamed into place,
+    so a partially written exon FASTA never exists. Returns the paths of the files written.
     """
-    ranges = eval(row.iloc[13])
-    sequence_id = row.iloc[3]
-    sequence = next((seq for seq in fasta_sequences if seq.id == sequence_id), None)
-    if sequence is None:
-        return
-    for i, _ in enumerate(ranges):
-        exon_name = row['exon_names'][i]
+    exon_files = []
+    for exon_name, records in exon_records.items():
+        buffer = io.StringIO()
+        SeqIO.write(records, buffer, "fasta")
         exon_file = os.path.join(output_dir, f"{exon_name}.fasta")
-        if os.path.exists(exon_file):
-            os.remove(exon_file)
+        tmp_file = f"{exon_file}.tmp"
+        with open(tmp_file, "w") as fh:
+            fh.write(buffer.getvalue())
+        os.replace(tmp_file, exon_file)
+        exon_files.append(exon_file)
+    return exon_files
 
-def check_overlap(exon_ranges, start, end, overlap_threshold):
+class ExonIndex:
     """
-    Check if the interval (start, end) overlaps significantly (>= overlap_threshold) with any existing exon interval.
-    Returns the name of an overlapping exon if found, otherwise None.
+    Exon intervals discovered so far, kept sorted by start position.
+    Two intervals are the same exon if their overlap is at least `overlap_threshold` of their
+    combined length. Since overlap >= threshold * union implies
+    |start - existing_start| <= length * (1 - threshold) / threshold, a lookup only compares
+    exons whose start falls in that window instead of every exon found so far.
     """
-    for (existing_start, existing_end), exon_name in exon_ranges:
-        # Compute overlap length between intervals
-        overlap_len = min(end, existing_end) - max(start, existing_start)
-        # Check if overlap is at least the given fraction of the combined interval length
-        if overlap_len > 0 and overlap_len / (max(end, existing_end) - min(start, existing_start)) >= overlap_threshold:
-            return exon_name
-    return None
+    def __init__(self, overlap_threshold):
+        self.overlap_threshold = overlap_threshold
+        self.starts = []   # sorted exon starts
+        self.entries = []  # (start, discovery order, end, exon name), in the same order as `starts`
+
+    def add(self, start, end, exon_name):
+        """Record a newly defined exon."""
+        pos = bisect.bisect_right(self.starts, start)
+        self.starts.insert(pos, start)
+        self.entries.insert(pos, (start, len(self.entries), end, exon_name))
+
+    def find(self, start, end):
+        """Name of the first-discovered exon overlapping (start, end) by >= the threshold, otherwise None."""
+        if self.overlap_threshold > 0:
+            # +1 keeps the window inclusive despite float rounding
+            window = (end - start) * (1 - self.overlap_threshold) / self.overlap_threshold + 1
+            lo = bisect.bisect_left(self.starts, start - window)
+            hi = bisect.bisect_right(self.starts, start + window)
+        else:
+            lo, hi = 0, len(self.entries)
+        best = None
+        for existing_start, order, existing_end, exon_name in self.entries[lo:hi]:
+            if best is not None and order > best[0]:
+                continue
+            overlap_len = min(end, existing_end) - max(start, existing_start)
+            if overlap_len > 0 and overlap_len / (max(end, existing_end) - min(start, existing_start)) >= self.overlap_threshold:
+                best = (order, exon_name)
+        return best[1] if best is not None else None
 
 def process_exon_data(input_dir, gene_name, output_dir, overlap_threshold):
     """
@@ -93,27 +135,25 @@ def process_exon_data(input_dir, gene_name, output_dir, overlap_threshold):
     - Reads the exonerate_stats.tsv for the gene.
     - Determines exon names (ensuring overlapping hits get the same name).
     - Writes a TSV of exon assignments and creates FASTA files for each exon.
+    Returns the paths of the exon FASTA files.
     """
     data_label = os.path.basename(input_dir)  # project or sample identifier (folder name)
     stats_file = os.path.join(input_dir, gene_name, data_label, 'exonerate_stats.tsv')
     if not os.path.isfile(stats_file):
         raise FileNotFoundError(f"Expected stats file not found: {stats_file}")
-    df = pd.read_csv(stats_file, sep='\t')
-    # Truncate DataFrame at the line indicating frameshift filtering (if present)
-    end_idx = df[df.iloc[:, 0] == 'Hits filtered to remove hits with frameshifts'].index
-    if len(end_idx) > 0:
-        df = df.loc[:end_idx[0]-1]
-    exon_ranges = []  # list of ((start, end), exon_name) for discovered exons
+    # Rows above the frameshift filtering line (if present), with the query and contig
+    # coordinate columns parsed once for both exon naming and extraction
+    df, query_ranges, hit_ranges = read_exonerate_stats(stats_file, 'Hits filtered to remove hits with frameshifts')
+    exon_index = ExonIndex(overlap_threshold)  # discovered exons, indexed by position
     exon_names_per_row = []  # exon name list for each alignment hit (row)
-    for _, row in df.iterrows():
-        ranges = eval(row.iloc[6])  # parse stringified list of exon coordinates
+    for r in range(len(df)):
         row_exon_names = []
-        for i, (start, end) in enumerate(ranges):
-            overlap_exon = check_overlap(exon_ranges, start, end, overlap_threshold)
+        for i, (start, end) in enumerate(row_ranges(query_ranges, r)):
+            overlap_exon = exon_index.find(start, end)
             if overlap_exon is None:
                 # Define a new exon
                 exon_name = f"{data_label}_{gene_name}_exon_{i+1}"
-                exon_ranges.append(((start, end), exon_name))
+                exon_index.add(start, end, exon_name)
             else:
                 # Use the existing exon name for overlapping region
                 exon_name = overlap_exon
@@ -126,39 +166,98 @@ def process_exon_data(input_dir, gene_name, output_dir, overlap_threshold):
     df.to_csv(output_tsv, sep='\t', index=False)
     # Load assembled contigs FASTA for this gene (from HybPiper output)
     contigs_fasta = os.path.join(input_dir, gene_name, f"{gene_name}_contigs.fasta")
-    fasta_sequences = list(SeqIO.parse(contigs_fasta, "fasta"))
-    # Remove any old entries in exon FASTA files for this gene, then extract new sequences
-    for _, row in df.iterrows():
-        clean_fasta(row, fasta_sequences, output_dir)
-    for _, row in df.iterrows():
-        extract_contigs(row, fasta_sequences, output_dir)
+    contigs = index_contigs(contigs_fasta)
+    # Collect the exon segments of all rows, then write each exon FASTA once
+    exon_records = {}
+    sequence_ids = df.iloc[:, CONTIG_ID_COL].tolist()
+    for r, (sequence_id, exon_names) in enumerate(zip(sequence_ids, exon_names_per_row)):
+        extract_contigs(sequence_id, row_ranges(hit_ranges, r), exon_names, contigs, exon_records)
+    return write_exon_fastas(exon_records, output_dir)
 
-def sequence_assembly(num_threads, read1, read2, target_fasta, project, log_file, output_hyb_dir):
+def sequence_assembly(num_threads, read1, read2, target_fasta, project, log_file, output_hyb_dir, manifest=None):
     """
     Step 1: Run quality trimming and assembly:
     - Uses fastp for read trimming.
     - Runs HybPiper to assemble target sequences from trimmed reads.
+    With a `manifest` (checkpoint.Manifest) in resume mode, steps already completed
+    on the same inputs are skipped.
     """
     # 1A. Read trimming with fastp
+    trimmed = [f"{read1}.trimmed.fastq.gz", f"{read2}.trimmed.fastq.gz"]
     fastp_cmd = (
         f"fastp -i {read1} -I {read2} "
-        f"-o {read1}.trimmed.fastq.gz -O {read2}.trimmed.fastq.gz "
+        f"-o {trimmed[0]} -O {trimmed[1]} "
         f"-j fastp.json -h fastp.html"
     )
-    run_command(fastp_cmd, "Sequence Trimming (fastp)", log_file, critical=True)
+    if manifest is not None and manifest.is_done("fastp", trimmed, [read1, read2], fastp_cmd):
+        log_status(log_file, "Sequence Trimming (fastp): SKIPPED (resume)")
+    else:
+        run_command(fastp_cmd, "Sequence Trimming (fastp)", log_file, critical=True)
+        if manifest is not None:
+            manifest.record("fastp", trimmed, [read1, read2], fastp_cmd)
     # 1B. Run HybPiper assembly
     os.makedirs(output_hyb_dir, exist_ok=True)
     log_status(log_file, f"Create Output Directory ({output_hyb_dir}): SUCCESS")
     hybpiper_cmd = (
         f"hybpiper assemble -t_dna {target_fasta} "
-        f"-r {read1}.trimmed.fastq.gz {read2}.trimmed.fastq.gz "
-        f"--prefix {project} --bwa --cpu {num_threads} -o {output_hyb_dir}"
+        f"-r {trimmed[0]} {trimmed[1]} "
+        f"--prefix {project} --bwa -o {output_hyb_dir}"
     )
-    run_command(hybpiper_cmd, "Sequence Assembly (HybPiper)", log_file, critical=True)
+    assembly_dir = [os.path.join(output_hyb_dir, project)]
+    if manifest is not None and manifest.is_done("hybpiper", assembly_dir, trimmed + [target_fasta], hybpiper_cmd):
+        log_status(log_file, "Sequence Assembly (HybPiper): SKIPPED (resume)")
+        return
+    run_command(f"{hybpiper_cmd} --cpu {num_threads}", "Sequence Assembly (HybPiper)", log_file, critical=True)
+    if manifest is not None:
+        manifest.record("hybpiper", assembly_dir, trimmed + [target_fasta], hybpiper_cmd)
+
+def extract_gene_exons(gene, input_project_dir, output_exon_dir, overlap_threshold):
+    """
+    Worker task: run `process_exon_data` for one gene.
+    Its console output is captured rather than printed, so genes running in parallel do not interleave.
+    Returns (gene, captured output, error message or None, exon FASTA paths).
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            exon_files = process_exon_data(input_project_dir, gene, output_exon_dir, overlap_threshold)
+        except Exception as e:
+            return gene, output.getvalue(), str(e), []
+    return gene, output.getvalue(), None, exon_files
 
-def exon_extraction(gene_list_path, overlap_threshold, project, log_file, input_hyb_dir, output_exon_dir):
+def gene_checkpoint(gene, input_project_dir, output_exon_dir, overlap_threshold):
+    """Manifest entry of one gene's exon extraction: (outputs, inputs, params)."""
+    data_label = os.path.basename(input_project_dir)
+    outputs = [os.path.join(output_exon_dir, f"{data_label}_{gene}_exon_split.tsv")]
+    inputs = [
+        os.path.join(input_project_dir, gene, data_label, 'exonerate_stats.tsv'),
+        os.path.join(input_project_dir, gene, f"{gene}_contigs.fasta"),
+    ]
+    return outputs, inputs, f"overlap={overlap_threshold}"
+
+def report_gene_results(results, log_file, checkpoints=None, manifest=None):
+    """
+    Print the captured output of each gene and log its status, in the order of `results`.
+    Successful genes are recorded in `manifest` using their `checkpoints` entry, with
+    their exon FASTAs as written files.
+    """
+    for gene, output, error, exon_files in results:
+        print(output, end='')
+        if error is None:
+            log_status(log_file, f"Processed Exons for Gene {gene}: SUCCESS")
+            if manifest is not None:
+                manifest.record("exons", *checkpoints[gene], written=exon_files)
+        else:
+            log_status(log_file, f"Failed to Process Exons for Gene {gene}: {error}: FAILURE")
+            print(f"Error processing exons for gene {gene}: {error}")
+
+def exon_extraction(gene_list_path, overlap_threshold, project, log_file, input_hyb_dir, output_exon_dir, workers=1,
+                    manifest=None):
     """
     Step 2: For each gene in the gene list, process exons and extract contigs.
+    With `workers` > 1 the genes are processed in a process pool; console output, log lines
+    and errors are still reported in gene-list order. Genes that `manifest` reports as done
+    are skipped. Returns the cleaned gene names.
     """
     # Read gene names (strip any “.fasta” extension in the list if present)
     with open(gene_list_path, 'r') as f:
@@ -171,13 +270,22 @@ def exon_extraction(gene_list_path, overlap_threshold, project, log_file, input_
     os.makedirs(output_exon_dir, exist_ok=True)
     log_status(log_file, f"Create Output Directory ({output_exon_dir}): SUCCESS")
     input_project_dir = os.path.join(input_hyb_dir, project)
+    checkpoints = {gene: gene_checkpoint(gene, input_project_dir, output_exon_dir, overlap_threshold) for gene in gene_names}
+    pending = []
     for gene in gene_names:
-        try:
-            process_exon_data(input_project_dir, gene, output_exon_dir, overlap_threshold)
-            log_status(log_file, f"Processed Exons for Gene {gene}: SUCCESS")
-        except Exception as e:
-            log_status(log_file, f"Failed to Process Exons for Gene {gene}: {e}: FAILURE")
-            print(f"Error processing exons for gene {gene}: {e}")
+        if manifest is not None and manifest.is_done("exons", *checkpoints[gene]):
+            log_status(log_file, f"Processed Exons for Gene {gene}: SKIPPED (resume)")
+        else:
+            pending.append(gene)
+    task_args = (pending, repeat(input_project_dir), repeat(output_exon_dir), repeat(overlap_threshold))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(pending) // (workers * 4))
+            report_gene_results(executor.map(extract_gene_exons, *task_args, chunksize=chunksize), log_file,
+                                checkpoints, manifest)
+    else:
+        report_gene_results(map(extract_gene_exons, *task_args), log_file, checkpoints, manifest)
+    return gene_names
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Assemble reads and extract exons from a mixed sample.")
@@ -193,6 +301,8 @@ if __name__ == "__main__":
                         default=0.8)
     parser.add_argument("--output_hyb", help="Output folder for HybPiper results", default="01_hyb_output")
     parser.add_argument("--output_exon", help="Output folder for exon FASTAs", default="02_exon_extracted")
+    parser.add_argument("--extract_workers", type=int, help="Worker processes for per-gene exon extraction (default: threads)")
+    parser.add_argument("--resume", action="store_true", help="Skip work recorded as completed in the project manifest")
     args = parser.parse_args()
 
     # Load config file if provided
@@ -209,16 +319,19 @@ if __name__ == "__main__":
     overlap = args.overlap if args.overlap is not None else config.get('overlap', 0.8)
     output_hyb = args.output_hyb or config.get('output_hyb', "01_hyb_output")
     output_exon = args.output_exon or config.get('output_exon', "02_exon_extracted")
+    extract_workers = args.extract_workers if args.extract_workers is not None else config.get('extract_workers', threads)
     # Validate required params
     if threads is None or not read1 or not read2 or not proj_name or not gene_list:
         parser.error("Missing required parameters (threads, read1, read2, proj_name, gene_list).")
     if not is_valid_project_name(proj_name):
         sys.exit(f"Error: Project name '{proj_name}' is invalid (contains disallowed characters).")
     threads = int(threads)
+    extract_workers = int(extract_workers)
     overlap = float(overlap)
     # Initialize log file
     log_file = f"{proj_name}_01_exon_assembly.out"
-    if os.path.exists(log_file):
+    # A resumed run appends to the log of the interrupted one
+    if os.path.exists(log_file) and not args.resume:
         os.remove(log_file)
     log_status(log_file, "Pipeline started with the following parameters:")
     log_status(log_file, f"  Threads: {threads}")
@@ -230,8 +343,11 @@ if __name__ == "__main__":
     log_status(log_file, f"  Overlap Threshold: {overlap}")
     log_status(log_file, f"  Output Hyb: {output_hyb}")
     log_status(log_file, f"  Output Exon: {output_exon}")
+    log_status(log_file, f"  Extraction Workers: {extract_workers}")
+    log_status(log_file, f"  Resume: {args.resume}")
+    manifest = Manifest(manifest_path(proj_name), args.resume)
     # Run steps 1 and 2
-    sequence_assembly(threads, read1, read2, mega353, proj_name, log_file, output_hyb)
-    exon_extraction(gene_list, overlap, proj_name, log_file, output_hyb, output_exon)
+    sequence_assembly(threads, read1, read2, mega353, proj_name, log_file, output_hyb, manifest)
+    exon_extraction(gene_list, overlap, proj_name, log_file, output_hyb, output_exon, extract_workers, manifest)
     log_status(log_file, "Pipeline completed successfully.")
     print(f"Pipeline completed. Check {log_file} for details.")
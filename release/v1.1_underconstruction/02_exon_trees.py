@@ -4,7 +4,10 @@
 This script processes exon sequences for each gene, aligning them to a reference
 alignment, trimming the alignment, and constructing a phylogenetic tree.
 
-It supports parallel processing of multiple genes and logs the status of each step.
+Each exon's MAFFT -> trimAl -> tree chain is one job. Jobs are packed against a global
+budget of `--threads` cores: small alignments run single-threaded side by side, and
+large ones get up to `--max_job_threads` MAFFT/IQ-TREE threads, so the run never starts
+more threads than cores. The status of each step is logged.
 It requires the following tools:
 - MAFFT for sequence alignment
 - trimAl for trimming alignments
@@ -13,7 +16,8 @@ It can be run with command-line arguments or a configuration file.
 
 Arguments:
 - -c, --config: Path to configuration file (YAML/JSON/TOML)
-- -t, --threads: Number of CPU threads to use for parallel processing
+- -t, --threads: Total number of CPU cores to use
+- --max_job_threads: Maximum threads for a single exon job (default 4)
 - -e, --input_exon: Directory of extracted exon FASTA files
 - -r, --ref_alignment: Directory of reference alignments
 - -g, --gene_list: Path to gene list file
@@ -22,6 +26,15 @@ Arguments:
 - -m, --min_exon_size: Minimum exon length to include in analysis
 - --tree_method: Phylogenetic tree construction method (fasttree or iqtree)
 - --iqtree_mode: IQ-TREE mode (fixed, fixed+gamma, or mfp)
+- --cache_dir: Directory of the step cache; MAFFT/trimAl/tree results are reused across runs (default: off)
+- --cache_max_gb: Size cap of the step cache in GB; least recently used entries are evicted (default 20)
+- --resume: Skip exon steps recorded as completed in the project manifest (<proj_name>.manifest.jsonl)
+- --backbone_dir: Directory of per-gene reference backbone trees. When set, each gene's reference
+  alignment gets one tree per --tree_method/--iqtree_mode (built on the first run, reused afterwards
+  while the alignment is unchanged; the method is part of the file name) and the
+  sample sequences of each exon are placed onto it instead of building the whole tree (default: off)
+- --placement: Placement method in backbone mode: distance (attach to the closest reference, default)
+  or iqtree (IQ-TREE search constrained to the backbone with -g)
 
 Usage:
 python 02_exon_trees.py -c config.yaml -t 8 -e 02_exon_extracted -r ref -g gene_list.txt -p my_project -o 03_phylo_results -m 80 --tree_method fasttree --iqtree_mode fixed
@@ -32,8 +45,15 @@ import os
 import glob
 import argparse
 from Bio import SeqIO
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pipeline_utils import log_status, run_command, load_config, is_valid_project_name
+from step_cache import StepCache
+from checkpoint import Manifest, manifest_path
+from ref_index import open_index
+from placement import place_queries, rename_to_backbone
+
+# Alignment cells (sequences x columns) per extra MAFFT/IQ-TREE thread of one exon job
+CELLS_PER_THREAD = 200000
 
 def all_sequences_meet_minimum_length(fasta_path, min_length=80):
     """Check if all sequences in the FASTA file are at least `min_length` bases long."""
@@ -42,25 +62,31 @@ def all_sequences_meet_minimum_length(fasta_path, min_length=80):
             return False
     return True
 
-def process_gene_exon_alignment(
-    gene_name, threads, input_dir, ref_dir, output_dir, log_file, min_size,
-    tree_method="fasttree", iqtree_mode="fixed"
-):
+def alignment_cells(fasta_path):
+    """Return (number of sequences, longest sequence length) of a FASTA file; (0, 0) if it is missing."""
+    if not os.path.exists(fasta_path):
+        return 0, 0
+    num_seqs, max_len = 0, 0
+    for record in SeqIO.parse(fasta_path, "fasta"):
+        num_seqs += 1
+        max_len = max(max_len, len(record.seq))
+    return num_seqs, max_len
+
+def job_threads(cells, cores, max_job_threads):
+    """
+    Threads for one exon job: one per `CELLS_PER_THREAD` alignment cells, capped by
+    `max_job_threads` and the core budget. Small alignments run single-threaded, so
+    many of them can share the cores; only large ones get extra MAFFT/IQ-TREE threads.
+    """
+    return max(1, min(cells // CELLS_PER_THREAD, max_job_threads, cores))
+
+def collect_exon_jobs(gene_name, input_dir, ref_dir, log_file, min_size, cores, max_job_threads, ref_index=None):
+    """
+    List the exon jobs (MAFFT -> trimAl -> tree) of one gene.
+    Each job is a dict with the gene, exon number, exon/reference paths, the estimated
+    alignment size in cells (sequences x columns) and the threads it will use.
+    The reference size is taken from `ref_index` (ref_index.RefIndex) when it covers the gene.
     """
-    Align and build tree for all exon contigs of a given gene.
-    Supports FastTree and IQ-TREE (fixed or MFP mode).
-    Args:
-        gene_name: Name of the gene to process.
-        threads: Number of threads to use for parallel processing.
-        input_dir: Directory containing exon FASTA files.
-        ref_dir: Directory containing reference alignments.
-        output_dir: Directory to save output trees.
-        log_file: Log file to record status messages.
-        min_size: Minimum length of exon sequences to include.
-        tree_method: Phylogenetic tree construction method ('fasttree' or 'iqtree').
-        iqtree_mode: IQ-TREE mode ('fixed', 'fixed+gamma', or 'mfp').
- 
-        """
     # Find all exon FASTA files for this gene
     try:
         pattern = os.path.join(input_dir, f"*{gene_name}*.fasta")
@@ -68,57 +94,253 @@ def process_gene_exon_alignment(
     except Exception as e:
         log_status(log_file, f"List exons for {gene_name}: FAILURE")
         print(f"Error listing exons for {gene_name}: {e}")
-        return
+        return []
     log_status(log_file, f"List exons for {gene_name}: SUCCESS")
     if not exon_files:
         log_status(log_file, f"No exon files found for {gene_name}, skipping.")
-        return
+        return []
     exon_files.sort()
+    ref_alignment = os.path.join(ref_dir, f"{gene_name}.fasta")
+    if ref_index is not None and ref_index.is_current(gene_name):
+        ref_seqs, ref_len = ref_index.alignment_cells(gene_name)
+    else:
+        ref_seqs, ref_len = alignment_cells(ref_alignment)
+    jobs = []
     for i, exon_path in enumerate(exon_files, start=1):
         # Enforce minimum exon length
         if not all_sequences_meet_minimum_length(exon_path, min_size):
             log_status(log_file, f"Skipping {os.path.basename(exon_path)} (sequences < {min_size} bp)")
             continue
-        # Alignment with MAFFT
-        ref_alignment = os.path.join(ref_dir, f"{gene_name}.fasta")
-        aligned_out = os.path.join(output_dir, f"{gene_name}_exon_{i}_aligned.fasta")
-        mafft_cmd = (
-            f"mafft --preservecase --maxiterate 1000 --localpair --adjustdirection "
-            f"--thread {threads} --addfragments {exon_path} {ref_alignment} > {aligned_out}"
+        exon_seqs, exon_len = alignment_cells(exon_path)
+        cells = (ref_seqs + exon_seqs) * max(ref_len, exon_len)
+        jobs.append({
+            'gene': gene_name, 'exon': i, 'exon_path': exon_path, 'ref_alignment': ref_alignment,
+            'cells': cells, 'threads': job_threads(cells, cores, max_job_threads),
+        })
+    return jobs
+
+def run_step(command, step_name, log_file, outputs, cache=None, tool=None, flags="", inputs=(), manifest=None):
+    """
+    Run one tool step, or restore its `outputs` from `cache` when the same tool version,
+    flags and input contents were run before. Successful results are added to the cache.
+    With a resuming `manifest`, a step already completed on the same inputs is skipped;
+    completed steps are recorded in it. Returns True if the outputs are in place.
+    """
+    if manifest is not None and manifest.is_done(tool, outputs, inputs, flags):
+        log_status(log_file, f"{step_name}: SKIPPED (resume)")
+        return True
+    key = None
+    if cache is not None:
+        key = cache.step_key(tool, flags, inputs)
+        if cache.restore(key, outputs):
+            log_status(log_file, f"{step_name}: CACHED")
+            if manifest is not None:
+                manifest.record(tool, outputs, inputs, flags)
+            return True
+    if not run_command(command, step_name, log_file):
+        return False
+    complete = all(os.path.exists(path) and os.path.getsize(path) > 0 for path in outputs)
+    if key is not None and complete:
+        cache.store(key, outputs)
+    if manifest is not None and complete:
+        manifest.record(tool, outputs, inputs, flags)
+    return True
+
+def iqtree_model_flags(iqtree_mode):
+    """
+    IQ-TREE model flags for `iqtree_mode` ('fixed', 'fixed+gamma' or 'mfp').
+    The thread count (-nt) is left to the command: it does not change the tree, so it
+    stays out of the cache and manifest keys.
+    """
+    if iqtree_mode == "mfp":
+        return "-m MFP --quiet"
+    # fixed model (GTR+G or GTR)
+    return f"-m GTR{'+' if 'gamma' in (iqtree_mode or 'fixed') else ''}G --quiet"
+
+def backbone_path(backbone_dir, gene, tree_method, iqtree_mode):
+    """Backbone tree of `gene` built with `tree_method` (and `iqtree_mode`), e.g. `<gene>.iqtree_mfp.backbone.tre`."""
+    method = "fasttree" if tree_method != "iqtree" else f"iqtree_{(iqtree_mode or 'fixed').replace('+', '_')}"
+    return os.path.join(backbone_dir, f"{gene}.{method}.backbone.tre")
+
+def backbone_is_current(backbone, ref_alignment):
+    """True if the backbone tree exists and is newer than its reference alignment."""
+    return (os.path.exists(backbone) and os.path.getsize(backbone) > 0
+            and os.path.getmtime(backbone) >= os.path.getmtime(ref_alignment))
+
+def run_backbone_job(job, log_file, tree_method="fasttree", iqtree_mode="fixed", cache=None):
+    """Build the backbone tree of one gene from its reference alignment alone."""
+    gene_name, backbone = job['gene'], job['backbone']
+    if tree_method == "iqtree":
+        prefix = backbone[:-len('.tre')]
+        flags = iqtree_model_flags(iqtree_mode)
+        command = f"iqtree2 -s {job['ref_alignment']} -nt {job['threads']} {flags} -pre {prefix} && mv {prefix}.treefile {backbone}"
+        tool = "iqtree2"
+    else:
+        flags = "-gtr -gamma -nt"
+        command = f"fasttree {flags} {job['ref_alignment']} > {backbone}"
+        tool = "fasttree"
+    run_step(command, f"Backbone tree for {gene_name}", log_file, [backbone], cache, tool, flags, [job['ref_alignment']])
+
+def place_on_backbone(job, trimmed_out, tree_out, log_file, placement, iqtree_mode, cache=None, manifest=None):
+    """
+    Insert the sample sequences of a trimmed exon alignment into the gene's backbone tree.
+    'distance' attaches each sequence next to its closest reference (see placement.py);
+    'iqtree' runs an IQ-TREE search constrained to the backbone topology (-g).
+    """
+    gene_name, i, backbone = job['gene'], job['exon'], job['backbone']
+    step_name = f"Placement for {gene_name} exon {i} ({placement})"
+    if placement == "iqtree":
+        prefix = tree_out.replace('.tre', '')
+        # References MAFFT reversed (_R_ prefix) must carry their backbone names for the constraint
+        renamed_out = f"{prefix}_backbone_names.fasta"
+        try:
+            rename_to_backbone(backbone, trimmed_out, renamed_out)
+        except Exception as e:
+            log_status(log_file, f"{step_name}: FAILURE")
+            print(f"Error during {step_name}: {e}")
+            return
+        flags = f"{iqtree_model_flags(iqtree_mode)} -fast -g"
+        command = (f"iqtree2 -s {renamed_out} -nt {job['threads']} {flags} {backbone} -pre {prefix} && "
+                   f"mv {prefix}.treefile {tree_out}")
+        run_step(command, step_name, log_file, [tree_out], cache, "iqtree2", flags, [trimmed_out, backbone], manifest)
+        return
+    if manifest is not None and manifest.is_done("placement", [tree_out], [trimmed_out, backbone]):
+        log_status(log_file, f"{step_name}: SKIPPED (resume)")
+        return
+    try:
+        placed = place_queries(backbone, trimmed_out, tree_out)
+    except Exception as e:
+        log_status(log_file, f"{step_name}: FAILURE")
+        print(f"Error during {step_name}: {e}")
+        return
+    log_status(log_file, f"{step_name}: SUCCESS ({placed} sequences placed)")
+    if manifest is not None:
+        manifest.record("placement", [tree_out], [trimmed_out, backbone])
+
+def run_exon_job(job, output_dir, log_file, tree_method="fasttree", iqtree_mode="fixed", cache=None, manifest=None,
+                 placement="distance"):
+    """
+    Align one exon to its reference alignment, trim it and build its tree.
+    MAFFT and IQ-TREE use `job['threads']` threads; trimAl and FastTree are single-threaded.
+    Supports FastTree and IQ-TREE (fixed or MFP mode). With a `cache` (StepCache), steps
+    whose inputs were already processed are restored instead of recomputed; with a resuming
+    `manifest` (checkpoint.Manifest), steps completed by an interrupted run are skipped.
+    If the job has a 'backbone' tree, the sample sequences are placed onto it (`placement`)
+    instead of building the tree from scratch.
+    """
+    gene_name, i, threads = job['gene'], job['exon'], job['threads']
+    # Alignment with MAFFT
+    aligned_out = os.path.join(output_dir, f"{gene_name}_exon_{i}_aligned.fasta")
+    # The thread count does not change the alignment, so it is kept out of the cache key
+    mafft_flags = "--preservecase --maxiterate 1000 --localpair --adjustdirection"
+    mafft_cmd = f"mafft {mafft_flags} --thread {threads} --addfragments {job['exon_path']} {job['ref_alignment']} > {aligned_out}"
+    run_step(mafft_cmd, f"MAFFT alignment for {gene_name} exon {i}", log_file, [aligned_out],
+             cache, "mafft", mafft_flags, [job['exon_path'], job['ref_alignment']], manifest)
+    # Trim alignment with trimAl
+    trimmed_out = os.path.join(output_dir, f"{gene_name}_exon_{i}_trimmed.fasta")
+    trimal_cmd = f"trimal -in {aligned_out} -out {trimmed_out} -gt 0.5"
+    run_step(trimal_cmd, f"Trim alignment for {gene_name} exon {i}", log_file, [trimmed_out],
+             cache, "trimal", "-gt 0.5", [aligned_out], manifest)
+    # Build tree with selected method
+    tree_out = os.path.join(output_dir, f"{gene_name}_exon_{i}.tre")
+    if job.get('backbone'):
+        place_on_backbone(job, trimmed_out, tree_out, log_file, placement, iqtree_mode, cache, manifest)
+    elif tree_method == "fasttree":
+        fasttree_cmd = f"fasttree -gtr -gamma -nt {trimmed_out} > {tree_out}"
+        run_step(fasttree_cmd, f"Tree construction for {gene_name} exon {i} (FastTree)", log_file, [tree_out],
+                 cache, "fasttree", "-gtr -gamma -nt", [trimmed_out], manifest)
+    elif tree_method == "iqtree":
+        prefix = tree_out.replace('.tre', '')
+        iqtree_flags = iqtree_model_flags(iqtree_mode)
+        # IQ-TREE outputs .treefile, so rename/move to .tre for consistency
+        iqtree_cmd = (
+            f"iqtree2 -s {trimmed_out} -nt {threads} {iqtree_flags} -pre {prefix} && "
+            f"mv {prefix}.treefile {tree_out}"
         )
-        run_command(mafft_cmd, f"MAFFT alignment for {gene_name} exon {i}", log_file)
-        # Trim alignment with trimAl
-        trimmed_out = os.path.join(output_dir, f"{gene_name}_exon_{i}_trimmed.fasta")
-        trimal_cmd = f"trimal -in {aligned_out} -out {trimmed_out} -gt 0.5"
-        run_command(trimal_cmd, f"Trim alignment for {gene_name} exon {i}", log_file)
-        # Build tree with selected method
-        tree_out = os.path.join(output_dir, f"{gene_name}_exon_{i}.tre")
-        if tree_method == "fasttree":
-            fasttree_cmd = f"fasttree -gtr -gamma -nt {trimmed_out} > {tree_out}"
-            run_command(fasttree_cmd, f"Tree construction for {gene_name} exon {i} (FastTree)", log_file)
-        elif tree_method == "iqtree":
-            if iqtree_mode == "mfp":
-                iqtree_cmd = (
-                    f"iqtree2 -s {trimmed_out} -nt {threads} -m MFP -pre {tree_out.replace('.tre','')} "
-                    f"--quiet"
-                )
-            else:  # fixed model (GTR+G or GTR)
-                iqtree_cmd = (
-                    f"iqtree2 -s {trimmed_out} -nt {threads} -m GTR{'+' if 'gamma' in iqtree_mode else ''}G "
-                    f"-pre {tree_out.replace('.tre','')} --quiet"
-                )
-            run_command(iqtree_cmd, f"Tree construction for {gene_name} exon {i} (IQ-TREE)", log_file)
-            # IQ-TREE outputs .treefile, so rename/move to .tre for consistency
-            iqtree_treefile = tree_out.replace('.tre', '.treefile')
-            if os.path.exists(iqtree_treefile):
-                os.replace(iqtree_treefile, tree_out)
-        else:
-            log_status(log_file, f"Unknown tree method: {tree_method}")
+        run_step(iqtree_cmd, f"Tree construction for {gene_name} exon {i} (IQ-TREE)", log_file, [tree_out],
+                 cache, "iqtree2", iqtree_flags, [trimmed_out], manifest)
+    else:
+        log_status(log_file, f"Unknown tree method: {tree_method}")
+
+def schedule_exon_jobs(jobs, cores, run_job):
+    """
+    Run `run_job(job)` for every job without using more than `cores` threads in total.
+    Jobs are started largest first, and whenever cores are freed the largest pending jobs
+    that fit are started, so small single-threaded jobs backfill around the large ones.
+    """
+    pending = sorted(jobs, key=lambda job: job['cells'], reverse=True)
+    free_cores = cores
+    running = {}
+    with ThreadPoolExecutor(max_workers=cores) as executor:
+        while pending or running:
+            waiting = []
+            for job in pending:
+                if job['threads'] <= free_cores:
+                    free_cores -= job['threads']
+                    running[executor.submit(run_job, job)] = job
+                else:
+                    waiting.append(job)
+            pending = waiting
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                free_cores += running.pop(future)['threads']
+                future.result()
+
+def build_backbones(jobs, backbone_dir, threads, max_job_threads, log_file, tree_method, iqtree_mode, cache=None):
+    """
+    Make sure every gene of `jobs` has a backbone tree in `backbone_dir` (built from the
+    reference alignment only, and rebuilt when the alignment is newer), then point each
+    job at its gene's backbone. Backbones of other tree methods or IQ-TREE modes are
+    kept under their own names and never reused for this one.
+    """
+    os.makedirs(backbone_dir, exist_ok=True)
+    backbone_jobs = {}
+    for job in jobs:
+        gene = job['gene']
+        job['backbone'] = backbone_path(backbone_dir, gene, tree_method, iqtree_mode)
+        if gene in backbone_jobs or backbone_is_current(job['backbone'], job['ref_alignment']):
+            continue
+        ref_seqs, ref_len = alignment_cells(job['ref_alignment'])
+        backbone_jobs[gene] = {
+            'gene': gene, 'ref_alignment': job['ref_alignment'], 'backbone': job['backbone'],
+            'cells': ref_seqs * ref_len, 'threads': job_threads(ref_seqs * ref_len, threads, max_job_threads),
+        }
+    log_status(log_file, f"Scheduling {len(backbone_jobs)} backbone tree jobs on {threads} cores")
+    schedule_exon_jobs(
+        list(backbone_jobs.values()), threads,
+        lambda job: run_backbone_job(job, log_file, tree_method, iqtree_mode, cache)
+    )
+    # Genes whose backbone could not be built fall back to a full tree
+    for job in jobs:
+        if not backbone_is_current(job['backbone'], job['ref_alignment']):
+            job['backbone'] = None
+
+def build_exon_trees(
+    genes, threads, input_dir, ref_dir, output_dir, log_file, min_size, max_job_threads=4,
+    tree_method="fasttree", iqtree_mode="fixed", cache=None, manifest=None, backbone_dir=None, placement="distance"
+):
+    """
+    Align and build trees for the exons of all `genes` as jobs within a budget of `threads` cores.
+    With a `backbone_dir`, one reference tree per gene is built once (and reused by later runs),
+    and each exon's sample sequences are placed onto it with `placement` ('distance' or 'iqtree').
+    """
+    jobs = []
+    ref_index = open_index(ref_dir)
+    for gene in genes:
+        jobs.extend(collect_exon_jobs(gene, input_dir, ref_dir, log_file, min_size, threads, max_job_threads, ref_index))
+    if backbone_dir:
+        build_backbones(jobs, backbone_dir, threads, max_job_threads, log_file, tree_method, iqtree_mode, cache)
+    log_status(log_file, f"Scheduling {len(jobs)} exon jobs on {threads} cores")
+    schedule_exon_jobs(
+        jobs, threads,
+        lambda job: run_exon_job(job, output_dir, log_file, tree_method, iqtree_mode, cache, manifest, placement)
+    )
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Align exons and build exon trees for each gene.")
     parser.add_argument("-c", "--config", help="Path to config file (YAML/JSON/TOML)")
-    parser.add_argument("-t", "--threads", type=int, help="Number of CPU threads for parallel processing")
+    parser.add_argument("-t", "--threads", type=int, help="Total number of CPU cores to use")
+    parser.add_argument("--max_job_threads", type=int, help="Maximum threads for a single exon job (default: 4)")
     parser.add_argument("-e", "--input_exon", help="Directory of extracted exon FASTA files", default="02_exon_extracted")
     parser.add_argument("-r", "--ref_alignment", help="Directory of reference alignments", default="ref")
     parser.add_argument("-g", "--gene_list", help="Path to gene list file", default="gene_list.txt")
@@ -129,6 +351,12 @@ if __name__ == "__main__":
                         help="Phylogeny method: fasttree or iqtree (default: fasttree)")
     parser.add_argument("--iqtree_mode", choices=["fixed", "fixed+gamma", "mfp"], default="fixed",
                         help="IQ-TREE mode: fixed (GTR), fixed+gamma (GTR+G), or mfp (ModelFinder Plus)")
+    parser.add_argument("--cache_dir", "--cache-dir", help="Directory of the MAFFT/trimAl/tree step cache (default: no cache)")
+    parser.add_argument("--cache_max_gb", type=float, help="Size cap of the step cache in GB (default: 20)")
+    parser.add_argument("--resume", action="store_true", help="Skip steps recorded as completed in the project manifest")
+    parser.add_argument("--backbone_dir", help="Directory of per-gene reference backbone trees; enables placement mode (default: off)")
+    parser.add_argument("--placement", choices=["distance", "iqtree"],
+                        help="Placement onto the backbone: distance (nearest reference) or iqtree (constrained search, -g)")
     args = parser.parse_args()
 
     # Load config if provided
@@ -137,6 +365,7 @@ if __name__ == "__main__":
         config = load_config(args.config)
     # Determine parameters (CLI overrides config)
     threads = args.threads if args.threads is not None else config.get('threads')
+    max_job_threads = args.max_job_threads if args.max_job_threads is not None else config.get('max_job_threads', 4)
     proj_name = args.proj_name or config.get('proj_name')
     input_exon_dir = args.input_exon if args.input_exon != parser.get_default('input_exon') else config.get('input_exon', "02_exon_extracted")
     ref_dir = args.ref_alignment if args.ref_alignment != parser.get_default('ref_alignment') else config.get('ref_alignment', "ref")
@@ -145,6 +374,10 @@ if __name__ == "__main__":
     min_size = args.min_exon_size if args.min_exon_size != parser.get_default('min_exon_size') else config.get('min_exon_size', 80)
     tree_method = args.tree_method if args.tree_method else config.get('tree_method', 'fasttree')
     iqtree_mode = args.iqtree_mode if args.iqtree_mode else config.get('iqtree_mode', 'fixed')
+    cache_dir = args.cache_dir or config.get('cache_dir')
+    cache_max_gb = args.cache_max_gb if args.cache_max_gb is not None else config.get('cache_max_gb', 20)
+    backbone_dir = args.backbone_dir or config.get('backbone_dir')
+    placement = args.placement or config.get('placement', 'distance')
     # Disable iqtree_mode if tree_method is fasttree
     if tree_method == "fasttree":
         iqtree_mode = None
@@ -153,13 +386,16 @@ if __name__ == "__main__":
     if not is_valid_project_name(proj_name):
         parser.error(f"Project name '{proj_name}' contains invalid characters.")
     threads = int(threads)
+    max_job_threads = int(max_job_threads)
     min_size = int(min_size)
     # Initialize log file
     log_file = f"{proj_name}_02_exons_phylo.log"
-    if os.path.exists(log_file):
+    # A resumed run appends to the log of the interrupted one
+    if os.path.exists(log_file) and not args.resume:
         os.remove(log_file)
     log_status(log_file, "Pipeline started with the following parameters:")
     log_status(log_file, f"  Threads: {threads}")
+    log_status(log_file, f"  Max Threads per Exon Job: {max_job_threads}")
     log_status(log_file, f"  Input Exon Directory: {input_exon_dir}")
     log_status(log_file, f"  Reference Alignment Directory: {ref_dir}")
     log_status(log_file, f"  Gene List: {gene_list_path}")
@@ -169,21 +405,19 @@ if __name__ == "__main__":
     log_status(log_file, f"  Tree Method: {tree_method}")
     if tree_method == "iqtree":
         log_status(log_file, f"  IQ-TREE Mode: {iqtree_mode}")
+    log_status(log_file, f"  Step Cache: {cache_dir + f' ({cache_max_gb} GB)' if cache_dir else 'off'}")
+    log_status(log_file, f"  Resume: {args.resume}")
+    log_status(log_file, f"  Backbone Placement: {f'{placement} ({backbone_dir})' if backbone_dir else 'off'}")
     os.makedirs(output_dir, exist_ok=True)
     log_status(log_file, f"Created directory {output_dir}")
-    # Read gene list and execute alignments/trees in parallel
+    # Read gene list, then run every exon's alignment/tree as a job within the core budget
     with open(gene_list_path, 'r') as f:
         genes = [line.strip() for line in f if line.strip()]
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = [
-            executor.submit(
-                process_gene_exon_alignment,
-                gene, threads, input_exon_dir, ref_dir, output_dir, log_file, min_size,
-                tree_method, iqtree_mode
-            )
-            for gene in genes
-        ]
-        for future in futures:
-            future.result()
+    cache = StepCache(cache_dir, int(float(cache_max_gb) * 1024 ** 3)) if cache_dir else None
+    manifest = Manifest(manifest_path(proj_name), args.resume)
+    build_exon_trees(
+        genes, threads, input_exon_dir, ref_dir, output_dir, log_file, min_size, max_job_threads,
+        tree_method, iqtree_mode, cache, manifest, backbone_dir, placement
+    )
     log_status(log_file, "Pipeline completed successfully.")
     print(f"Pipeline completed. Check {log_file} for details.")
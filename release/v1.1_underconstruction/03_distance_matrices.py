@@ -8,7 +8,7 @@ It can be run with command-line arguments or a configuration file.
 
 Arguments:
 - `-c`, `--config`: Path to configuration file (YAML/JSON/TOML).
-- `-t`, `--threads`: Number of threads for parallel processing. Defaults to 1 if not specified.
+- `-t`, `--threads`: Number of parallel workers (processes or threads, see `--parallel_mode`).
 - `-p`, `--proj_name`: Project name identifier for output files.
 - `-g`, `--gene_list`: Path to file containing list of gene names.  Defaults to "gene_list.txt".
 - `--threshold`: Threshold for distance filtering (default: 1.96). 
@@ -16,6 +16,10 @@ Arguments:
 - `--use_threshold`: Enable threshold-based filtering (default: off).
 - `--input_dir`: Directory containing input .tre files (default: "03_phylo_results").
 - `--output_dir`: Directory for output matrices (default: "04_all_trees").
+- `--parallel_mode`: "process" (default) computes genes in a process pool; "thread" uses a thread pool.
+- `--resume`: Skip genes recorded as completed in the project manifest (`<proj_name>.manifest.jsonl`).
+- `--export_csv`: Also write per-tree CSV matrices (.matrix/.cleaned.csv) next to the binary .matrix.npz files,
+  store the binary matrices in float64, and build the summary from the CSV files as the CSV-only pipeline did.
 
 Usage:
 python 03_distance_matrices.py -c config.yaml -t 4 -p my_project -g gene_list.txt --threshold 1.96 --use_flag --input_dir 03_phylo_results --output_dir 04_all_trees
@@ -24,51 +28,85 @@ python 03_distance_matrices.py --config config.yaml --threads 4 --proj_name my_p
 """
 import os
 import glob
+import shutil
 import argparse
-from concurrent.futures import ThreadPoolExecutor
-from Bio import Phylo
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import repeat
 import pandas as pd
 import numpy as np
 from pipeline_utils import log_status, load_config, is_valid_project_name
+from tree_utils import TreeIndex
+from newick import read_newick, OutgroupResolver, root_by_outgroup
+from matrix_utils import MATRIX_SUFFIX, save_distance_matrix, read_matrix_frame, matrix_to_frame, ordered_row_sums
+from checkpoint import Manifest, manifest_path
 
-def find_clade_and_move(tree, node_name):
-    """
-    Find sister taxa for a collapsed node (e.g., "NODE_x"): return names of all non-NODE tips 
-    in the sister clade of the smallest clade containing node_name, if support > 0.7.
-    """
-    target = None
-    for leaf in tree.get_terminals():
-        if leaf.name == node_name:
-            target = leaf
-            break
-    related_taxa = []
-    if target:
-        # Traverse from target leaf up toward root
-        path = tree.get_path(target)
-        for clade in reversed(path):
-            if clade.clades:  # if not a terminal
-                # Check each sibling clade for real (non-"NODE") taxa
-                for sister in clade.clades:
-                    if sister is not clade and any("NODE" not in leaf.name for leaf in sister.get_terminals()):
-                        related_taxa.extend([leaf.name for leaf in sister.get_terminals() if "NODE" not in leaf.name])
-                        break
-                # If this clade had any sister taxa, and clade support is >0.7, stop climbing up
-                if related_taxa and (clade.confidence is None or clade.confidence > 0.7):
-                    break
-    return related_taxa
-
-def calculate_genetic_distance(tree):
-    """
-    Calculate pairwise distances between all leaves in the tree.
-    Returns a tuple of (list_of_taxa, distance_matrix_numpy).
-    """
-    taxa = [leaf.name for leaf in tree.get_terminals()]
-    n = len(taxa)
-    distances = np.zeros((n, n))
-    for i in range(n):
-        for j in range(i+1, n):
-            d = tree.distance(taxa[i], taxa[j])
-            distances[i, j] = distances[j, i] = d
+# Outgroups by priority: the first node whose name contains the first available one roots the tree
+REROOT_TAXA = OutgroupResolver(["Amborella", "Nymphaea", "Austrobaileya"], substring=True)
+
+def find_node_sister_taxa(index, keep=None):
+    """
+    Find sister taxa for every collapsed node tip (e.g., "NODE_x") in a single sweep.
+    For each NODE tip, climb from its parent toward the root (the root itself is not used):
+    at each ancestor take the non-NODE tips of its first child clade that has any, and stop
+    once some taxa were collected and the ancestor's support is missing or > 0.7.
+    With `keep` (one flag per node), only the tips whose flag is set can be sister taxa.
+    Returns a list of (node_name, related_taxa) in tip order, for tips with sister taxa.
+    """
+    names = index.names
+    is_tip = index.is_tip.tolist()
+    if keep is None:
+        keep = [True] * len(names)
+    is_real = [tip and kept and "NODE" not in name for tip, kept, name in zip(is_tip, keep, names)]
+    # Non-NODE tips of the subtree rooted at node v are real_names[real_before[v]:real_before[subtree_end[v]]]
+    real_names = [name for name, real in zip(names, is_real) if real]
+    real_before = np.concatenate(([0], np.cumsum(is_real)))
+    end = index.subtree_end
+    # Post-order pass: per internal node, the range of non-NODE tips of its first child that has any
+    sister_range = [None] * len(names)
+    for v in range(len(names) - 1, 0, -1):
+        if is_tip[v]:
+            continue
+        for child in index.children(v):
+            lo, hi = real_before[child], real_before[end[child]]
+            if hi > lo:
+                sister_range[v] = (lo, hi)
+                break
+    # Duplicate tip names all resolve to the first tip carrying that name
+    first_tip = {}
+    for v, name in enumerate(names):
+        if is_tip[v]:
+            first_tip.setdefault(name, v)
+    # Support missing (NaN) or above 0.7
+    stop_support = (~(index.support <= 0.7)).tolist()
+    records = []
+    for v, name in enumerate(names):
+        if not is_tip[v] or "NODE" not in name:
+            continue
+        related_taxa = []
+        node = index.parent[first_tip[name]]
+        while node > 0:
+            if sister_range[node] is not None:
+                lo, hi = sister_range[node]
+                related_taxa.extend(real_names[lo:hi])
+            if related_taxa and stop_support[node]:
+                break
+            node = index.parent[node]
+        if related_taxa:
+            records.append((name, related_taxa))
+    return records
+
+def calculate_genetic_distance(tree, index=None):
+    """
+    Calculate pairwise distances between all leaves in the tree (NewickTree or Bio.Phylo tree).
+    Returns a tuple of (list_of_taxa, distance_matrix_numpy), taxa in tip order.
+    Uses a single tree walk with an LCA index (see tree_utils) instead of one
+    `tree.distance` call per pair; the values are identical.
+    An existing TreeIndex of `tree` can be passed to avoid rebuilding it.
+    """
+    if index is None:
+        index = TreeIndex(tree)
+    taxa = index.tip_names()
+    distances = index.distance_matrix(index.lookup(taxa))
     return taxa, distances
 
 def distance_to_similarity(dist_df):
@@ -78,76 +116,311 @@ def distance_to_similarity(dist_df):
     sim_df[numeric_cols] = 1 / (1 + sim_df[numeric_cols])
     return sim_df
 
-def clean_up_matrix(df, project, threshold, taxa_file=None, use_flag=False, use_threshold=True):
+def column_mean_std(values):
+    """
+    Mean and sample standard deviation (ddof=1) of each row of a 2D array, skipping NaN.
+    Follows the two-pass algorithm of pandas' Series.mean/Series.std, so the values are
+    bit-identical to computing them column by column on the DataFrame.
+    """
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, values)
+    count = (values.shape[1] - missing.sum(axis=1)).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=1) / count
+        sqr = (mean[:, None] - filled) ** 2
+        sqr[missing] = 0
+        dof = np.where(count > 1, count - 1, np.nan)
+        sd = np.sqrt(sqr.sum(axis=1) / dof)
+    return mean, sd
+
+def load_species_to_taxa(taxa_file):
+    """Parse a NODE sister-taxa list file into {node_tip_name: set_of_taxa}."""
+    species_to_taxa = {}
+    with open(taxa_file, 'r') as tf:
+        for line in tf:
+            parts = line.strip().split(':')
+            if len(parts) == 2:
+                species, taxa_list = parts
+                species_to_taxa[species.strip()] = {tax.strip() for tax in taxa_list.split(';')}
+    return species_to_taxa
+
+def group_taxa_flags(names, project, candidates):
+    """
+    Per-name flags of one candidate group: the sample's own names and those containing any
+    candidate. Missing names (unnamed internal nodes) are not flagged.
+    """
+    return [bool(name) and (project in name or any(candidate in name for candidate in candidates))
+            for name in names]
+
+def node_records_to_taxa(node_records):
+    """In-memory equivalent of `load_species_to_taxa` for the records of `find_node_sister_taxa`."""
+    return {node_name: set(related_taxa) for node_name, related_taxa in node_records}
+
+def clean_up_matrix(df, project, threshold, taxa_file=None, use_flag=False, use_threshold=True, species_to_taxa=None):
     """
     Clean a distance matrix DataFrame by filtering out irrelevant entries:
     - Remove rows where the taxon name contains the project name (i.e., self-hits).
     - Keep only columns (species) that belong to the project.
     - Apply either standard deviation threshold filtering or "flag" method to mark outliers as 999.
-    - If a taxa mapping file is provided, mask distances for species that do not co-occur with expected taxa.
+    - If a taxa mapping file (or an in-memory `species_to_taxa` mapping) is provided, mask distances
+      for species that do not co-occur with expected taxa.
+    All filters are applied as NumPy masks over the whole value block.
     """
     # Exclude any rows that correspond to the project’s own sequences
     df = df[~df.iloc[:, 0].str.contains(project)]
     # Keep only columns where header contains the project name (plus the first column for row labels)
-    cols_to_keep = [df.columns[0]] + [col for col in df.columns[1:] if project in col]
-    df = df[cols_to_keep]
-    # Apply filtering to each project column
-    for col in df.columns[1:]:
+    label_col = df.columns[0]
+    value_cols = [col for col in df.columns[1:] if project in col]
+    labels = df[label_col]
+    # One contiguous row per project column, so column sums run in the same order as in pandas
+    values = df[value_cols].to_numpy(dtype=np.float64).T.copy()
+    # Columns that end up holding only the integer codes are stored as int64, as the old per-cell apply did
+    int_cols = np.zeros(len(value_cols), dtype=bool)
+    if len(labels):
         if use_flag:
-            # Flag method: set the minimum value in this column to 0 (best match) and all others to 999
-            min_val = df[col].min()
-            df[col] = df[col].apply(lambda x: 0 if x == min_val else 999)
+            # Flag method: set the minimum value in each column to 0 (best match) and all others to 999
+            col_min = np.fmin.reduce(values, axis=1)
+            values = np.where(values == col_min[:, None], 0, 999)
+            int_cols[:] = True
         elif use_threshold:
             # Standard deviation method: mark as 999 any value higher than (mean - threshold*std) for the column
-            mean = df[col].mean()
-            sd = df[col].std()
-            df[col] = df[col].apply(lambda x: 999 if x > (mean - threshold * sd) else x)
+            mean, sd = column_mean_std(values)
+            outliers = values > (mean - threshold * sd)[:, None]
+            values = np.where(outliers, 999.0, values)
+            int_cols = outliers.all(axis=1)
         # If neither flag nor threshold, do not filter
-    # If a taxa mapping file is available, use it to further clean the matrix
+    # If a taxa mapping is available, mark rows whose taxon is not a recorded sister of the NODE column
     if taxa_file and os.path.exists(taxa_file):
-        species_to_taxa = {}
-        with open(taxa_file, 'r') as tf:
-            for line in tf:
-                parts = line.strip().split(':')
-                if len(parts) == 2:
-                    species, taxa_list = parts
-                    species_to_taxa[species.strip()] = [tax.strip() for tax in taxa_list.split(';')]
-        for header in df.columns[1:]:
-            for species, taxa_list in species_to_taxa.items():
-                if header == species:
-                    # For each row, if its taxon (row_name) is not in the expected taxa list for this species, mark distance as 999
-                    for idx, row in df.iterrows():
-                        if row[df.columns[0]] not in taxa_list:
-                            df.at[idx, header] = 999
+        species_to_taxa = load_species_to_taxa(taxa_file)
+    if species_to_taxa is not None:
+        for k, header in enumerate(value_cols):
+            if header in species_to_taxa:
+                values[k, ~labels.isin(species_to_taxa[header]).to_numpy()] = 999
+    cleaned = {label_col: labels}
+    for k, col in enumerate(value_cols):
+        cleaned[col] = values[k].astype(np.int64) if int_cols[k] else values[k]
+    df = pd.DataFrame(cleaned, index=labels.index)
     # Simplify row names by removing any trailing numbers/underscores (from original sample IDs)
     df.iloc[:, 0] = df.iloc[:, 0].str.replace(r'\d+', '', regex=True).str.rstrip('_')
     return df
 
-def process_matrices(matrix_dir, project, threshold, use_flag, use_threshold):
+def row_totals(df, project, threshold, use_flag, use_threshold, taxa_file=None, species_to_taxa=None,
+               column_order=None):
+    """
+    Clean one per-tree matrix, convert it to similarities and sum each row.
+    `column_order` ({column: position}, shared across the matrices of one summary) makes each
+    row sum run over the columns in order of first appearance, as in the concatenation of all
+    matrices (see `ordered_row_sums`), so totals match that reduction exactly even when
+    matrices share NODE columns.
+    Returns (row_names, totals) arrays.
+    """
+    df = clean_up_matrix(df, project, threshold, taxa_file, use_flag, use_threshold, species_to_taxa)
+    df = distance_to_similarity(df)
+    names = df.iloc[:, 0].to_numpy(dtype=object)
+    if column_order is not None:
+        return names, ordered_row_sums(df.iloc[:, 1:], column_order)
+    # Sum similarity scores of each row; columns of other genes would only contribute zeros
+    return names, df.iloc[:, 1:].sum(axis=1).to_numpy(dtype=np.float64)
+
+def totals_frame(row_names, totals):
+    """Stack per-matrix row names and totals into the summary DataFrame (row_name, total_value)."""
+    return pd.DataFrame({
+        'row_name': np.concatenate(row_names) if row_names else np.array([], dtype=object),
+        'total_value': np.concatenate(totals) if totals else np.array([], dtype=np.float64),
+    })
+
+def process_matrices(matrix_dir, project, threshold, use_flag, use_threshold, prefer_csv=False):
     """
     Combine all per-gene distance matrices in `matrix_dir` into one summary DataFrame.
-    Converts distances to similarities and computes a total sum per taxon.
+    Reads the binary `.matrix.npz` store, falling back to `cleaned.csv` for trees without one;
+    with `prefer_csv` the `cleaned.csv` files are read instead wherever they exist.
+    Converts distances to similarities and computes the total similarity of each row.
+    Matrices are reduced one at a time, so peak memory is a single matrix rather than
+    the NaN-padded union of every gene's columns.
     """
-    all_dfs = []
+    # Map each tree prefix ("<gene>.<i>.") to its matrix file, preferring the binary store
+    # (or the CSV files, in directory order as the CSV-only pipeline read them)
+    binary, text = {}, {}
     for filename in os.listdir(matrix_dir):
-        if filename.endswith('cleaned.csv'):
-            file_path = os.path.join(matrix_dir, filename)
-            df = pd.read_csv(file_path)
-            # Identify corresponding taxa list file (if exists) for further filtering
-            prefix = filename.split('cleaned.csv')[0]
-            taxa_file = os.path.join(matrix_dir, f"{prefix}list.txt")
-            df = clean_up_matrix(df, project, threshold, taxa_file if os.path.exists(taxa_file) else None, use_flag, use_threshold)
-            df = distance_to_similarity(df)
-            all_dfs.append(df)
-    # Concatenate all gene similarity data
-    total_df = pd.concat(all_dfs, ignore_index=True)
-    total_df.fillna(0, inplace=True)
-    # Sum similarity scores across all genes for each taxon
-    value_cols = [col for col in total_df.columns if col != 'Unnamed: 0']
-    total_df['total_value'] = total_df[value_cols].sum(axis=1)
+        if filename.endswith(MATRIX_SUFFIX):
+            binary[filename[:-len('matrix.npz')]] = filename
+        elif filename.endswith('cleaned.csv'):
+            text.setdefault(filename.split('cleaned.csv')[0], filename)
+    preferred, other = (text, binary) if prefer_csv else (binary, text)
+    matrix_files = dict(preferred)
+    for prefix, filename in other.items():
+        matrix_files.setdefault(prefix, filename)
+    row_names, totals = [], []
+    column_order = {}
+    for prefix, filename in matrix_files.items():
+        df = read_matrix_frame(os.path.join(matrix_dir, filename))
+        # Identify corresponding taxa list file (if exists) for further filtering
+        taxa_file = os.path.join(matrix_dir, f"{prefix}list.txt")
+        names, sums = row_totals(df, project, threshold, use_flag, use_threshold,
+                                 taxa_file if os.path.exists(taxa_file) else None, column_order=column_order)
+        row_names.append(names)
+        totals.append(sums)
     # Return a DataFrame with taxon (row_name) and its aggregated total value
-    result = total_df[['Unnamed: 0', 'total_value']].rename(columns={'Unnamed: 0': 'row_name'})
-    return result
+    return totals_frame(row_names, totals)
+
+def summarize_gene_results(results, project, threshold, use_flag, use_threshold):
+    """
+    In-memory counterpart of `process_matrices` for `compute_gene_matrices` results:
+    reduces every tree's matrix to row totals without reading matrix or list files.
+    """
+    row_names, totals = [], []
+    column_order = {}
+    for _, gene_results, _ in results:
+        for node_records, taxa, distances in gene_results:
+            df = matrix_to_frame(taxa, np.asarray(distances, dtype=np.float64))
+            names, sums = row_totals(df, project, threshold, use_flag, use_threshold,
+                                     species_to_taxa=node_records_to_taxa(node_records), column_order=column_order)
+            row_names.append(names)
+            totals.append(sums)
+    return totals_frame(row_names, totals)
+
+def tree_distance_matrix(tree_file, groups=None):
+    """
+    Reroot one exon tree and compute its NODE sister-taxa records and pairwise distances.
+    Returns (node_records, list_of_taxa, distance_matrix_numpy).
+    With `groups` = (project, {label: candidate names}), node_records is instead a dict of
+    per-label records, each searched among that label's taxa only (see `group_taxa_flags`).
+    """
+    tree = read_newick(tree_file)
+    # Root with the first available outgroup; fall back to midpoint rooting
+    tree = root_by_outgroup(tree, REROOT_TAXA)
+    index = TreeIndex(tree)
+    if groups is None:
+        node_records = find_node_sister_taxa(index)
+    else:
+        project, candidates = groups
+        node_records = {label: find_node_sister_taxa(index, group_taxa_flags(index.names, project, names))
+                        for label, names in candidates.items()}
+    taxa, distances = calculate_genetic_distance(tree, index)
+    return node_records, taxa, distances
+
+def write_node_records(node_records, node_output_file):
+    """Write NODE sister-taxa records as `<node tip>: <taxon>; <taxon>; ...` lines."""
+    with open(node_output_file, 'w') as fh:
+        for node_name, related_taxa in node_records:
+            fh.write(f'{node_name}: {"; ".join(related_taxa)}\n')
+
+def genetic_distance_matrix(tree_file, node_output_file, output_file):
+    """
+    Reroot one exon tree, record the sister taxa of each NODE tip in `node_output_file`,
+    and write the full pairwise distance matrix to `output_file` (binary if it ends
+    with .npz, CSV otherwise). Returns (list_of_taxa, distance_matrix_numpy).
+    """
+    node_records, taxa, distances = tree_distance_matrix(tree_file)
+    write_node_records(node_records, node_output_file)
+    if output_file.endswith('.npz'):
+        save_distance_matrix(output_file, taxa, distances)
+    else:
+        pd.DataFrame(distances, index=taxa, columns=taxa).to_csv(output_file)
+    return taxa, distances
+
+def compute_gene_matrices(gene_name, input_dir, dtype=np.float32, groups=None):
+    """
+    Worker task: compute NODE records and distance matrices for every exon tree of one gene.
+    Nothing is written to disk or to the log, so it can run in a separate process.
+    Returns (gene_name, results, error): one (node_records, taxa, distances) tuple per tree,
+    with distances cast to `dtype`, and the error message if a tree failed (else None).
+    `groups` is passed to `tree_distance_matrix`.
+    """
+    results = []
+    try:
+        tree_files = sorted(glob.glob(os.path.join(input_dir, f"{gene_name}*tre")))
+        for tree_file in tree_files:
+            node_records, taxa, distances = tree_distance_matrix(tree_file, groups)
+            results.append((node_records, taxa, distances.astype(dtype, copy=False)))
+    except Exception as e:
+        return gene_name, results, str(e)
+    return gene_name, results, None
+
+def write_gene_matrices(gene_name, results, error, output_dir, log_file, export_csv=False):
+    """
+    Write the output of `compute_gene_matrices` for one gene and log each step.
+    For tree i, writes `<gene>.<i>.list.txt` (NODE sister taxa) and `<gene>.<i>.matrix.npz` to
+    `output_dir`, in the dtype of the computed distances. With `export_csv`, the matrix is
+    also written as `<gene>.<i>.matrix` and `<gene>.<i>.cleaned.csv`. The trees finished before an error are still written, and
+    the gene is logged as failed.
+    """
+    if error is None:
+        log_status(log_file, f"List trees for {gene_name}: SUCCESS")
+    for i, (node_records, taxa, distances) in enumerate(results, start=1):
+        write_node_records(node_records, os.path.join(output_dir, f"{gene_name}.{i}.list.txt"))
+        save_distance_matrix(os.path.join(output_dir, f"{gene_name}.{i}{MATRIX_SUFFIX}"), taxa, distances,
+                             distances.dtype)
+        log_status(log_file, f"Generated matrix for {gene_name} tree {i}")
+        if export_csv:
+            csv_file = os.path.join(output_dir, f"{gene_name}.{i}.matrix")
+            pd.DataFrame(distances, index=taxa, columns=taxa).to_csv(csv_file)
+            shutil.copyfile(csv_file, os.path.join(output_dir, f"{gene_name}.{i}.cleaned.csv"))
+            log_status(log_file, f"Exported CSV matrix for {gene_name} tree {i}")
+    if error is not None:
+        log_status(log_file, f"List trees for {gene_name}: FAILURE")
+        log_status(log_file, f"Failed processing {gene_name}: {error}")
+        print(f"Failed processing {gene_name}: {error}")
+
+def process_gene(gene_name, input_dir, output_dir, log_file, export_csv=False):
+    """Build, write and log the distance matrices for every exon tree of one gene."""
+    dtype = np.float64 if export_csv else np.float32
+    write_gene_matrices(*compute_gene_matrices(gene_name, input_dir, dtype), output_dir, log_file, export_csv)
+
+def compute_distance_stage(gene_names, input_dir, threads, dtype=np.float32, parallel_mode="process", groups=None):
+    """
+    Compute the matrices of all genes with `threads` workers, yielding the
+    `compute_gene_matrices` result of each gene in gene-list order (`groups` is passed on).
+    `parallel_mode` "process" uses a process pool, so the pure-Python tree work scales past
+    the GIL; "thread" keeps the old thread pool.
+    """
+    if parallel_mode == "process":
+        executor = ProcessPoolExecutor(max_workers=threads)
+        chunksize = max(1, len(gene_names) // (threads * 4))
+    else:
+        executor = ThreadPoolExecutor(max_workers=threads)
+        chunksize = 1
+    with executor:
+        yield from executor.map(compute_gene_matrices, gene_names, repeat(input_dir), repeat(dtype), repeat(groups),
+                                 chunksize=chunksize)
+
+def gene_checkpoint(gene_name, input_dir, output_dir, export_csv=False):
+    """Manifest entry of one gene's matrices: (outputs, inputs, params)."""
+    tree_files = sorted(glob.glob(os.path.join(input_dir, f"{gene_name}*tre")))
+    suffixes = [".list.txt", MATRIX_SUFFIX] + ([".matrix", ".cleaned.csv"] if export_csv else [])
+    outputs = [os.path.join(output_dir, f"{gene_name}.{i}{suffix}")
+               for i in range(1, len(tree_files) + 1) for suffix in suffixes]
+    return outputs, tree_files, f"export_csv={export_csv}"
+
+def run_distance_stage(gene_names, input_dir, output_dir, log_file, threads, export_csv=False, parallel_mode="process",
+                       manifest=None):
+    """
+    Compute the matrices of all genes and write them to `output_dir`.
+    Workers only return results: files and log lines are written here, in gene-list order.
+    Genes that a resuming `manifest` reports as done are skipped; completed genes are recorded in it.
+    """
+    # CSV export keeps full precision, in the binary store too
+    dtype = np.float64 if export_csv else np.float32
+    pending = []
+    for gene_name in gene_names:
+        if manifest is not None and manifest.is_done("matrices", *gene_checkpoint(gene_name, input_dir, output_dir, export_csv)):
+            log_status(log_file, f"Generated matrices for {gene_name}: SKIPPED (resume)")
+        else:
+            pending.append(gene_name)
+    for result in compute_distance_stage(pending, input_dir, threads, dtype, parallel_mode):
+        write_gene_matrices(*result, output_dir, log_file, export_csv)
+        gene_name, _, error = result
+        if manifest is not None and error is None:
+            manifest.record("matrices", *gene_checkpoint(gene_name, input_dir, output_dir, export_csv))
+
+def cumulative_totals(data):
+    """Sum total values per taxon, excluding NODE rows."""
+    filtered = data[~data['row_name'].str.contains("NODE")]
+    return filtered.groupby('row_name')['total_value'].sum().reset_index()
+
+def group_and_sum(input_file, output_file):
+    """Sum total values per taxon (excluding NODE rows) and write the cumulative table."""
+    cumulative_totals(pd.read_csv(input_file)).to_csv(output_file, index=False)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Compute distance matrices from exon trees and aggregate them.")
@@ -160,6 +433,9 @@ if __name__ == "__main__":
     parser.add_argument("--use_threshold", action="store_true", help="Enable threshold-based filtering (default: off)")
     parser.add_argument("--input_dir", help="Directory with input .tre files", default="03_phylo_results")
     parser.add_argument("--output_dir", help="Directory for output matrices", default="04_all_trees")
+    parser.add_argument("--export_csv", action="store_true", help="Also write per-tree matrices as CSV (.matrix/.cleaned.csv)")
+    parser.add_argument("--parallel_mode", choices=["process", "thread"], help="Worker pool type for the tree-to-matrix step (default: process)")
+    parser.add_argument("--resume", action="store_true", help="Skip genes recorded as completed in the project manifest")
     args = parser.parse_args()
 
     # Load config if provided
@@ -174,6 +450,8 @@ if __name__ == "__main__":
     use_threshold = args.use_threshold or bool(config.get('use_threshold', False))
     input_dir = args.input_dir if args.input_dir != parser.get_default('input_dir') else config.get('input_dir', "03_phylo_results")
     output_dir = args.output_dir if args.output_dir != parser.get_default('output_dir') else config.get('output_dir', "04_all_trees")
+    export_csv = args.export_csv or bool(config.get('export_csv', False))
+    parallel_mode = args.parallel_mode or config.get('parallel_mode', "process")
 
     # Conflict check: use_flag and use_threshold cannot both be True
     if use_flag and use_threshold:
@@ -187,7 +465,8 @@ if __name__ == "__main__":
     threshold = float(threshold)
     # Initialize log
     log_file = f"{proj_name}_03_distance_calc.log"
-    if os.path.exists(log_file):
+    # A resumed run appends to the log of the interrupted one
+    if os.path.exists(log_file) and not args.resume:
         os.remove(log_file)
     log_status(log_file, "Pipeline started with the following parameters:")
     log_status(log_file, f"  Threads: {threads}")
@@ -197,17 +476,18 @@ if __name__ == "__main__":
     log_status(log_file, f"  Use Flag: {use_flag}")
     log_status(log_file, f"  Input Directory: {input_dir}")
     log_status(log_file, f"  Output Directory: {output_dir}")
+    log_status(log_file, f"  Export CSV: {export_csv}")
+    log_status(log_file, f"  Parallel Mode: {parallel_mode}")
+    log_status(log_file, f"  Resume: {args.resume}")
     os.makedirs(output_dir, exist_ok=True)
     log_status(log_file, f"Created directory {output_dir}")
     # Load gene names and process each gene's trees in parallel
     with open(gene_list_path, 'r') as f:
         gene_names = [line.strip() for line in f if line.strip()]
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = [executor.submit(process_gene, gene, input_dir, output_dir, log_file) for gene in gene_names]
-        for future in futures:
-            future.result()  # raise exceptions if any
+    manifest = Manifest(manifest_path(proj_name), args.resume)
+    run_distance_stage(gene_names, input_dir, output_dir, log_file, threads, export_csv, parallel_mode, manifest)
     # Combine all matrices and output summary
-    summary_df = process_matrices(output_dir, proj_name, threshold, use_flag, use_threshold)
+    summary_df = process_matrices(output_dir, proj_name, threshold, use_flag, use_threshold, prefer_csv=export_csv)
     summary_csv = os.path.join(output_dir, f"{proj_name}.summary_dist.csv")
     summary_df.to_csv(summary_csv, index=False)
     log_status(log_file, f"Processed matrices saved to {summary_csv}")
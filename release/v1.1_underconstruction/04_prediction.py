@@ -3,25 +3,36 @@
 04_prediction.py – Summarize total scores by taxonomic level and filter by significance.
 This script processes cumulative scores from a CSV file, summarizes them by taxonomic level,
 and filters taxa based on a z-score threshold.
+Several levels and thresholds can be given at once: the CSV is read once, each level is
+grouped and z-scored once, and every threshold is applied to that summary.
 It supports command-line arguments or a configuration file for flexibility.
 
 Arguments:
     -c, --config: Path to a configuration file (YAML/JSON/TOML).
     -i, --input_file: Input CSV file containing cumulative scores.
-    -o, --output_file: Output CSV file for summarized scores by taxonomy.
-    -tl, --taxonomic_level: Taxonomic level to summarize (o = Order, f = Family, g = Genus, s = Species).
-    -z, --zscore_threshold: Z-score threshold for filtering significant taxa.
-    -to, --taxonomy_output_file: Output file for selected taxonomy names based on z-score.
+    -o, --output_file: Output CSV file(s) for summarized scores by taxonomy, one per level
+        or a single name containing "{level}".
+    -tl, --taxonomic_level: Taxonomic level(s) to summarize (o = Order, f = Family, g = Genus, s = Species).
+    -z, --zscore_threshold: Z-score threshold(s) for filtering significant taxa.
+    -to, --taxonomy_output_file: Output file(s) for selected taxonomy names based on z-score, one per
+        level and threshold (level by level, thresholds in the order given) or a single name
+        containing "{level}" and/or "{z}".
+    --resume: Skip the run if the project manifest records the same outputs from the same input and parameters.
+    -p, --proj_name: Project name, used to locate the manifest (<proj_name>.manifest.jsonl).
 
 Usage:
     python 04_prediction.py -i input_scores.csv -o summary_scores.csv -tl g -z 2.0 -to selected_taxa.txt
+    python 04_prediction.py -i input_scores.csv -o summary_scores.csv -tl o -z -0.1 0.5 0.9 \
+        -to taxa_NPV95.txt taxa_NPV90.txt taxa_NPV85.txt
     or
     python 04_prediction.py --config config.yaml
 """
+import sys
 import argparse
 import pandas as pd
 from scipy.stats import zscore
 from pipeline_utils import load_config
+from checkpoint import Manifest, manifest_path
 
 def process_column(column, level):
     """
@@ -49,14 +60,73 @@ def select_taxonomy_by_zscore(summary_df, z_threshold):
     """Return list of taxon names from summary_df where z_score > z_threshold."""
     return summary_df.loc[summary_df['z_score'] > z_threshold, 'row_name'].tolist()
 
+def summarize_scores(df, taxonomic_level):
+    """
+    Sum the cumulative scores (`total_value`) per taxon at the given level and add z-scores.
+    Returns a DataFrame (row_name, sum_of_total_value, z_score) sorted by descending score.
+    """
+    df = df.copy()
+    df['taxon_level'] = process_column(df.iloc[:, 0], taxonomic_level)
+    summary = df.groupby('taxon_level')['total_value'].sum().reset_index()
+    summary['z_score'] = zscore(summary['total_value'])
+    summary = summary.rename(columns={'taxon_level': 'row_name', 'total_value': 'sum_of_total_value'})
+    return summary.sort_values(by='sum_of_total_value', ascending=False)
+
+def as_list(value):
+    """Config values may be a single value or a list; CLI values are already lists."""
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+def expand_output_names(names, keys, option):
+    """
+    Map each key (a dict of "level" and, for candidate lists, "z") to an output file name.
+    `names` has one name per key, or a single name with format fields (e.g. "{level}").
+    """
+    if len(names) == len(keys):
+        return dict(zip((tuple(key.values()) for key in keys), names))
+    if len(names) == 1:
+        expanded = [names[0].format(**key) for key in keys]
+        if len(set(expanded)) == len(expanded):
+            return dict(zip((tuple(key.values()) for key in keys), expanded))
+    raise ValueError(f"{option} needs {len(keys)} file names or one name with "
+                     f"{' and '.join('{' + field + '}' for field in keys[0])} fields")
+
+def predict_taxa(df, levels, z_thresholds):
+    """
+    Summarize `df` once per taxonomic level and select taxa at every z-score threshold.
+    Returns ({level: summary}, {(level, z): taxon names}).
+    """
+    summaries, candidates = {}, {}
+    for level in levels:
+        summaries[level] = summarize_scores(df, level)
+        for z_threshold in z_thresholds:
+            candidates[(level, z_threshold)] = select_taxonomy_by_zscore(summaries[level], z_threshold)
+    return summaries, candidates
+
+def write_predictions(summaries, candidates, summary_files, taxonomy_files):
+    """Write each summary and candidate list to its file; yields a message per file."""
+    for level, summary in summaries.items():
+        summary.to_csv(summary_files[(level,)], index=False)
+        yield f"Summary has been written to {summary_files[(level,)]}"
+    for (level, z_threshold), names in candidates.items():
+        with open(taxonomy_files[(level, z_threshold)], 'w') as fout:
+            for name in names:
+                fout.write(name + "\n")
+        yield (f"Selected taxonomy names (z_score > {z_threshold}) have been written to "
+               f"{taxonomy_files[(level, z_threshold)]}")
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Summarize and filter taxa by total scores and z-score.')
     parser.add_argument('-c', '--config', help='Path to config file (YAML/JSON/TOML)')
     parser.add_argument('-i', '--input_file', help='Input CSV file (cumulative scores)')
-    parser.add_argument('-o', '--output_file', help='Output CSV for summarized scores by taxonomy')
-    parser.add_argument('-tl', '--taxonomic_level', choices=['o', 'f', 'g', 's'], help='Taxonomic level (o, f, g, s)')
-    parser.add_argument('-z', '--zscore_threshold', type=float, help='Z-score threshold for significance')
-    parser.add_argument('-to', '--taxonomy_output_file', help='Output file for selected taxonomy names')
+    parser.add_argument('-o', '--output_file', nargs='+', help='Output CSV(s) for summarized scores, one per level or one with {level}')
+    parser.add_argument('-tl', '--taxonomic_level', nargs='+', choices=['o', 'f', 'g', 's'], help='Taxonomic level(s) (o, f, g, s)')
+    parser.add_argument('-z', '--zscore_threshold', nargs='+', type=float, help='Z-score threshold(s) for significance')
+    parser.add_argument('-to', '--taxonomy_output_file', nargs='+',
+                        help='Output file(s) for selected taxonomy names, one per level and threshold or one with {level}/{z}')
+    parser.add_argument('-p', '--proj_name', help='Project name identifier (locates the manifest)')
+    parser.add_argument('--resume', action='store_true', help='Skip if already completed with the same input and parameters')
     args = parser.parse_args()
 
     # Load config if given
@@ -65,27 +135,31 @@ if __name__ == '__main__':
         config = load_config(args.config)
     # Gather parameters (CLI or config)
     input_file = args.input_file or config.get('input_file')
-    output_file = args.output_file or config.get('output_file')
-    taxonomic_level = args.taxonomic_level or config.get('taxonomic_level')
-    z_threshold = args.zscore_threshold if args.zscore_threshold is not None else config.get('zscore_threshold')
-    taxonomy_output = args.taxonomy_output_file or config.get('taxonomy_output_file')
-    if not input_file or not output_file or not taxonomic_level or z_threshold is None or not taxonomy_output:
+    output_files = as_list(args.output_file or config.get('output_file'))
+    # Duplicates would only write the same file twice
+    levels = list(dict.fromkeys(as_list(args.taxonomic_level or config.get('taxonomic_level'))))
+    z_thresholds = args.zscore_threshold if args.zscore_threshold is not None else as_list(config.get('zscore_threshold'))
+    z_thresholds = list(dict.fromkeys(float(z) for z in z_thresholds))
+    taxonomy_outputs = as_list(args.taxonomy_output_file or config.get('taxonomy_output_file'))
+    if not input_file or not output_files or not levels or not z_thresholds or not taxonomy_outputs:
         parser.error("Parameters missing: input_file, output_file, taxonomic_level, zscore_threshold, taxonomy_output_file are required.")
-    z_threshold = float(z_threshold)
-
-    # Read input data and compute summary by taxonomic level
-    df = pd.read_csv(input_file)
-    df['taxon_level'] = process_column(df.iloc[:, 0], taxonomic_level)
-    summary = df.groupby('taxon_level')['total_value'].sum().reset_index()
-    summary['z_score'] = zscore(summary['total_value'])
-    summary = summary.rename(columns={'taxon_level': 'row_name', 'total_value': 'sum_of_total_value'})
-    summary = summary.sort_values(by='sum_of_total_value', ascending=False)
-    summary.to_csv(output_file, index=False)
-    print(f"Summary has been written to {output_file}")
+    try:
+        summary_files = expand_output_names(output_files, [{'level': level} for level in levels], "--output_file")
+        taxonomy_files = expand_output_names(
+            taxonomy_outputs, [{'level': level, 'z': z} for level in levels for z in z_thresholds], "--taxonomy_output_file")
+    except ValueError as e:
+        parser.error(str(e))
+    proj_name = args.proj_name or config.get('proj_name')
+    manifest = Manifest(manifest_path(proj_name), args.resume) if proj_name else None
+    checkpoint = (list(summary_files.values()) + list(taxonomy_files.values()), [input_file],
+                  f"{levels}|{z_thresholds}")
+    if manifest is not None and manifest.is_done("prediction", *checkpoint):
+        print(f"Prediction already completed for {input_file}; skipped (resume)")
+        sys.exit(0)
 
-    # Filter by z-score threshold and save selected taxa
-    significant_taxa = select_taxonomy_by_zscore(summary, z_threshold)
-    with open(taxonomy_output, 'w') as fout:
-        for name in significant_taxa:
-            fout.write(name + "\n")
-    print(f"Selected taxonomy names (z_score > {z_threshold}) have been written to {taxonomy_output}")
+    # Read input data once, summarize each taxonomic level once and filter at every threshold
+    summaries, candidates = predict_taxa(pd.read_csv(input_file), levels, z_thresholds)
+    for message in write_predictions(summaries, candidates, summary_files, taxonomy_files):
+        print(message)
+    if manifest is not None:
+        manifest.record("prediction", *checkpoint)
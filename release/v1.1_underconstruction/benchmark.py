@@ -0,0 +1,249 @@
+# benchmark.py
+"""
+Synthetic scaling benchmarks for the pipeline stages.
+
+`distance`: builds a synthetic run of exon trees (353 genes by default, named like the
+03_phylo_results output) and times the tree-to-matrix stage of 03_distance_matrices.py
+for each worker count, in process and/or thread mode.
+
+`exons`: builds a synthetic HybPiper output (353 genes by default, with exonerate_stats.tsv
+and contigs per gene) and times the exon extraction step of 01_exons_assembly.py for each
+worker count.
+
+`cleanup`: times the per-cell/iterrows `clean_up_matrix` of the CSV-only pipeline against
+the NumPy one of 03_distance_matrices.py on one synthetic matrix (500 reference rows x 50
+NODE columns by default) with a NODE sister-taxa file, in flag and threshold modes, and
+checks that both return the same frame.
+
+Example:
+    python benchmark.py distance --workers 1 4 16 64 --modes process thread
+    python benchmark.py exons --workers 1 4 16 64
+    python benchmark.py cleanup --rows 500 --columns 50
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import importlib
+import contextlib
+
+def random_newick(tip_names, rng):
+    """Random binary tree over `tip_names` in Newick format, with random branch lengths and supports."""
+    nodes = [f"{name}:{rng.uniform(0.001, 0.2):.5f}" for name in tip_names]
+    while len(nodes) > 1:
+        i, j = sorted(rng.sample(range(len(nodes)), 2), reverse=True)
+        left, right = nodes.pop(i), nodes.pop(j)
+        nodes.append(f"({left},{right}){rng.uniform(0.5, 1.0):.3f}:{rng.uniform(0.001, 0.2):.5f}")
+    return nodes[0].rsplit(':', 1)[0] + ';'
+
+def build_distance_run(run_dir, project, num_genes, exons_per_gene, num_refs, num_nodes, seed):
+    """Write synthetic exon trees and a gene list to `run_dir`. Returns the gene names."""
+    rng = random.Random(seed)
+    tree_dir = os.path.join(run_dir, 'trees')
+    os.makedirs(tree_dir, exist_ok=True)
+    refs = ["Amborellales_Amborellaceae_Amborella_trichopoda"] + [
+        f"Order{k % 12}_Family{k % 30}_Genus{k}_species{k}" for k in range(num_refs - 1)]
+    gene_names = [str(4471 + g) for g in range(num_genes)]
+    for gene in gene_names:
+        for exon in range(1, exons_per_gene + 1):
+            tips = refs + [f"{project}_{gene}_exon_{exon}_NODE_{k}_length_{rng.randint(100, 900)}_cov_1"
+                           for k in range(1, num_nodes + 1)]
+            with open(os.path.join(tree_dir, f"{gene}_exon_{exon}.tre"), 'w') as fh:
+                fh.write(random_newick(tips, rng) + '\n')
+    with open(os.path.join(run_dir, 'genes.txt'), 'w') as fh:
+        fh.write('\n'.join(gene_names) + '\n')
+    return gene_names
+
+def build_exon_run(run_dir, project, num_genes, num_contigs, num_hits, seed):
+    """Write a synthetic HybPiper output directory and gene list to `run_dir`. Returns the gene names."""
+    rng = random.Random(seed)
+    gene_names = [str(4471 + g) for g in range(num_genes)]
+    columns = ['query_id', 'query_length', 'hit_percent_id', 'hit_id', 'query_HSP_range_limits',
+               'query_HSP_length', 'query_ranges', 'query_range_total', 'hit_HSP_range_limits',
+               'hit_strand', 'hit_length', 'hit_HSP_length', 'hit_range_total', 'hit_ranges']
+    for gene in gene_names:
+        gene_dir = os.path.join(run_dir, 'hyb', project, gene)
+        os.makedirs(os.path.join(gene_dir, project), exist_ok=True)
+        contig_ids = [f"NODE_{k}_length_1000_cov_{rng.uniform(1, 50):.3f}" for k in range(1, num_contigs + 1)]
+        with open(os.path.join(gene_dir, f"{gene}_contigs.fasta"), 'w') as fh:
+            for contig_id in contig_ids:
+                fh.write(f">{contig_id}\n{''.join(rng.choice('ACGT') for _ in range(1000))}\n")
+        rows = ['\t'.join(columns)]
+        for hit in range(num_hits):
+            query, target, pos = [], [], rng.randint(0, 60)
+            for _ in range(rng.randint(1, 4)):
+                length = rng.randint(40, 200)
+                query.append((pos, pos + length))
+                target.append((pos + 5, pos + length + 5))
+                pos += length + rng.randint(0, 30)
+            rows.append('\t'.join([f"{gene}_q{hit}", '900', '95.0', rng.choice(contig_ids), '', '', str(query),
+                                   '', '', rng.choice(['1', '-1']), '1000', '', '', str(target)]))
+        rows.append('Hits filtered to remove hits with frameshifts' + '\t' * (len(columns) - 1))
+        with open(os.path.join(gene_dir, project, 'exonerate_stats.tsv'), 'w') as fh:
+            fh.write('\n'.join(rows) + '\n')
+    with open(os.path.join(run_dir, 'genes.txt'), 'w') as fh:
+        fh.write('\n'.join(gene_names) + '\n')
+    return gene_names
+
+def benchmark_exons(args):
+    """Time the exon extraction step of 01_exons_assembly.py on a synthetic HybPiper output."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    exons_assembly = importlib.import_module('01_exons_assembly')
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as run_dir:
+        gene_names = build_exon_run(run_dir, args.project_name, args.genes, args.contigs, args.hits, args.seed)
+        print(f"Synthetic HybPiper output: {len(gene_names)} genes, {args.hits} exonerate hits per gene")
+        print(f"{'workers':>7} {'seconds':>9} {'speedup':>8}")
+        # exon_extraction writes gene_list.txt to the working directory
+        os.chdir(run_dir)
+        try:
+            baseline = None
+            for workers in args.workers:
+                log_file = f"exons_{workers}.log"
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    exons_assembly.exon_extraction('genes.txt', 0.8, args.project_name, log_file,
+                                                   'hyb', f"exons_{workers}", workers)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed * args.workers[0]
+                print(f"{workers:>7} {elapsed:>9.2f} {baseline / elapsed:>7.2f}x")
+        finally:
+            os.chdir(cwd)
+
+def benchmark_distance(args):
+    """Time the tree-to-matrix stage of 03_distance_matrices.py on a synthetic run."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # Imported by module name so that process-pool workers can unpickle its functions
+    distance_matrices = importlib.import_module('03_distance_matrices')
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as run_dir:
+        gene_names = build_distance_run(run_dir, args.project_name, args.genes, args.exons,
+                                        args.refs, args.nodes, args.seed)
+        print(f"Synthetic run: {len(gene_names)} genes x {args.exons} exon trees, "
+              f"{args.refs + args.nodes} tips per tree")
+        print(f"{'mode':<8} {'workers':>7} {'seconds':>9} {'speedup':>8}")
+        for mode in args.modes:
+            baseline = None
+            for workers in args.workers:
+                output_dir = os.path.join(run_dir, f"{mode}_{workers}")
+                os.makedirs(output_dir)
+                log_file = os.path.join(run_dir, f"{mode}_{workers}.log")
+                start = time.perf_counter()
+                distance_matrices.run_distance_stage(gene_names, os.path.join(run_dir, 'trees'), output_dir,
+                                                     log_file, workers, parallel_mode=mode)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed * args.workers[0]
+                print(f"{mode:<8} {workers:>7} {elapsed:>9.2f} {baseline / elapsed:>7.2f}x")
+
+def legacy_clean_up_matrix(df, project, threshold, taxa_file=None, use_flag=False, use_threshold=True):
+    """`clean_up_matrix` as the CSV-only pipeline ran it: a lambda per cell and iterrows() per NODE column."""
+    df = df[~df.iloc[:, 0].str.contains(project)]
+    cols_to_keep = [df.columns[0]] + [col for col in df.columns[1:] if project in col]
+    df = df[cols_to_keep]
+    for col in df.columns[1:]:
+        if use_flag:
+            min_val = df[col].min()
+            df[col] = df[col].apply(lambda x: 0 if x == min_val else 999)
+        elif use_threshold:
+            mean = df[col].mean()
+            sd = df[col].std()
+            df[col] = df[col].apply(lambda x: 999 if x > (mean - threshold * sd) else x)
+    if taxa_file and os.path.exists(taxa_file):
+        species_to_taxa = {}
+        with open(taxa_file, 'r') as tf:
+            for line in tf:
+                parts = line.strip().split(':')
+                if len(parts) == 2:
+                    species, taxa_list = parts
+                    species_to_taxa[species.strip()] = [tax.strip() for tax in taxa_list.split(';')]
+        for header in df.columns[1:]:
+            for species, taxa_list in species_to_taxa.items():
+                if header == species:
+                    for idx, row in df.iterrows():
+                        if row[df.columns[0]] not in taxa_list:
+                            df.at[idx, header] = 999
+    df.iloc[:, 0] = df.iloc[:, 0].str.replace(r'\d+', '', regex=True).str.rstrip('_')
+    return df
+
+def build_cleanup_matrix(run_dir, project, num_rows, num_columns, seed):
+    """Synthetic per-tree matrix frame (as read from a cleaned.csv) and its NODE sister-taxa file."""
+    import numpy as np
+    import pandas as pd
+    rng = random.Random(seed)
+    refs = [f"Order{k % 12}_Family{k % 30}_Genus{k}_species{k}" for k in range(num_rows)]
+    nodes = [f"{project}_4471_exon_1_NODE_{k}_length_{rng.randint(100, 900)}_cov_1" for k in range(1, num_columns + 1)]
+    taxa = refs + nodes
+    values = np.random.default_rng(seed).uniform(0.01, 2.0, size=(len(taxa), len(taxa)))
+    df = pd.DataFrame(values, columns=taxa)
+    df.insert(0, 'Unnamed: 0', taxa)
+    taxa_file = os.path.join(run_dir, '4471.1.list.txt')
+    with open(taxa_file, 'w') as fh:
+        for node in nodes:
+            fh.write(f"{node}: {'; '.join(rng.sample(refs, 20))}\n")
+    return df, taxa_file
+
+def benchmark_cleanup(args):
+    """Time the old and the NumPy `clean_up_matrix` on one synthetic matrix, in flag and threshold modes."""
+    import pandas as pd
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    distance_matrices = importlib.import_module('03_distance_matrices')
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as run_dir:
+        df, taxa_file = build_cleanup_matrix(run_dir, args.project_name, args.rows, args.columns, args.seed)
+        print(f"Synthetic matrix: {args.rows} reference rows x {args.columns} NODE columns, with a taxa file")
+        print(f"{'mode':<10} {'old ms':>9} {'new ms':>9} {'speedup':>8}")
+        for mode, use_flag, use_threshold in [("flag", True, False), ("threshold", False, True)]:
+            timings, outputs = [], []
+            for clean in (legacy_clean_up_matrix, distance_matrices.clean_up_matrix):
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    result = clean(df, args.project_name, 1.96, taxa_file, use_flag, use_threshold)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings.append(best * 1000)
+                outputs.append(result)
+            pd.testing.assert_frame_equal(outputs[0], outputs[1], check_exact=True)
+            print(f"{mode:<10} {timings[0]:>9.1f} {timings[1]:>9.1f} {timings[0] / timings[1]:>7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic scaling benchmarks for the pipeline stages.")
+    subparsers = parser.add_subparsers(dest="stage", required=True)
+
+    distance = subparsers.add_parser("distance", help="Tree-to-matrix stage of 03_distance_matrices.py")
+    distance.add_argument("--workers", type=int, nargs='+', default=[1, 4, 16, 64], help="Worker counts to time")
+    distance.add_argument("--modes", nargs='+', choices=["process", "thread"], default=["process", "thread"], help="Pool types to time")
+    distance.add_argument("--genes", type=int, default=353, help="Number of synthetic genes")
+    distance.add_argument("--exons", type=int, default=3, help="Exon trees per gene")
+    distance.add_argument("--refs", type=int, default=300, help="Reference tips per tree")
+    distance.add_argument("--nodes", type=int, default=5, help="Sample NODE tips per tree")
+    distance.add_argument("--seed", type=int, default=1, help="Random seed")
+    distance.add_argument("--project_name", default="MIX", help="Project name used in the NODE tip names")
+    distance.add_argument("--work_dir", default=None, help="Directory for the temporary run (default: system temp)")
+    distance.set_defaults(func=benchmark_distance)
+
+    exons = subparsers.add_parser("exons", help="Exon extraction step of 01_exons_assembly.py")
+    exons.add_argument("--workers", type=int, nargs='+', default=[1, 4, 16, 64], help="Worker counts to time")
+    exons.add_argument("--genes", type=int, default=353, help="Number of synthetic genes")
+    exons.add_argument("--contigs", type=int, default=30, help="Contigs per gene")
+    exons.add_argument("--hits", type=int, default=200, help="Exonerate hits per gene")
+    exons.add_argument("--seed", type=int, default=1, help="Random seed")
+    exons.add_argument("--project_name", default="MIX", help="Project (HybPiper prefix) name")
+    exons.add_argument("--work_dir", default=None, help="Directory for the temporary run (default: system temp)")
+    exons.set_defaults(func=benchmark_exons)
+
+    cleanup = subparsers.add_parser("cleanup", help="Old and NumPy clean_up_matrix of 03_distance_matrices.py")
+    cleanup.add_argument("--rows", type=int, default=500, help="Reference rows of the matrix")
+    cleanup.add_argument("--columns", type=int, default=50, help="Sample NODE columns of the matrix")
+    cleanup.add_argument("--repeat", type=int, default=3, help="Runs per version; the fastest is reported")
+    cleanup.add_argument("--seed", type=int, default=1, help="Random seed")
+    cleanup.add_argument("--project_name", default="MIX", help="Project name used in the NODE names")
+    cleanup.add_argument("--work_dir", default=None, help="Directory for the temporary taxa file (default: system temp)")
+    cleanup.set_defaults(func=benchmark_cleanup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# checkpoint.py
+"""
+Completed-work manifest for resuming interrupted pipeline runs.
+Each finished unit of work (a gene, or one step of one exon) is appended to a JSON-lines
+file with a digest of its parameters and of the size and modification time of its input
+files, and the size and modification time of every output it wrote. Inputs are never
+read, so recording stays cheap for large read files. A unit is identified by its step name
+and output paths; files whose names are only known once the unit ran are recorded as
+`written` files and checked the same way. With `--resume`, a stage skips any unit whose
+record still matches: same parameters and inputs, and outputs that exist and were not
+touched since. Everything else is recomputed. Records are only appended, so a run killed mid-write loses at most
+its last line.
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+def manifest_path(proj_name):
+    """Manifest file shared by all stages of a project, in the working directory."""
+    return f"{proj_name}.manifest.jsonl"
+
+def output_signature(path):
+    """(size, mtime_ns) of an output file or directory, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+class Manifest:
+    """JSON-lines record of completed work units; `resume` enables skipping of recorded units."""
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.resume = resume
+        self._lock = threading.Lock()
+        self._records = {}
+        if os.path.exists(path):
+            with open(path, 'r') as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # truncated last line of an interrupted run
+                    self._records[record['key']] = record
+
+    def _key(self, step, outputs):
+        return '|'.join([step] + [os.path.abspath(path) for path in outputs])
+
+    def _input_digest(self, params, inputs):
+        """Digest of the parameters and of the (size, mtime) of each input; missing inputs count too."""
+        digest = hashlib.sha256(str(params).encode())
+        for path in inputs:
+            digest.update(b'\0' + json.dumps(output_signature(path)).encode())
+        return digest.hexdigest()
+
+    def is_done(self, step, outputs, inputs=(), params=""):
+        """True if resuming and `step` already produced `outputs` from the same inputs and parameters."""
+        if not self.resume:
+            return False
+        record = self._records.get(self._key(step, outputs))
+        if record is None:
+            return False
+        if any(output_signature(path) != signature for path, signature in zip(outputs, record['outputs'])):
+            return False
+        if any(output_signature(path) != signature for path, signature in record.get('written', {}).items()):
+            return False
+        return record['inputs'] == self._input_digest(params, inputs)
+
+    def record(self, step, outputs, inputs=(), params="", written=()):
+        """
+        Append a record that `step` produced `outputs` from `inputs` with `params`.
+        `written` lists further files the step wrote; they must also be unchanged for `is_done`.
+        """
+        record = {
+            'key': self._key(step, outputs),
+            'inputs': self._input_digest(params, inputs),
+            'outputs': [output_signature(path) for path in outputs],
+            'written': {os.path.abspath(path): output_signature(path) for path in written},
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._lock:
+            self._records[record['key']] = record
+            with open(self.path, 'a') as fh:
+                fh.write(json.dumps(record) + '\n')
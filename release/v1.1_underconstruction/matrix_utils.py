@@ -0,0 +1,48 @@
+# matrix_utils.py
+"""
+Binary storage for per-tree distance matrices.
+Each exon tree's matrix is stored as one uncompressed NumPy `.npz` file holding the
+taxon labels and a float32 distance matrix, which avoids the float-to-text
+formatting and parsing of the CSV round-trip. The loaders return the same
+DataFrame layout as `pd.read_csv` on the legacy `.matrix`/`.cleaned.csv` files
+(row labels in an 'Unnamed: 0' column, one column per taxon).
+`ordered_row_sums` sums the rows of one matrix at a time in the column order of the
+concatenation of all matrices, so streamed totals equal the concatenated ones exactly.
+"""
+import numpy as np
+import pandas as pd
+
+MATRIX_SUFFIX = '.matrix.npz'
+
+def save_distance_matrix(path, taxa, distances, dtype=np.float32):
+    """Write taxon labels and a square distance matrix to a `.npz` file."""
+    np.savez(path, taxa=np.asarray(taxa, dtype=str), distances=np.asarray(distances, dtype=dtype))
+
+def load_distance_matrix(path):
+    """Read a `.npz` matrix file. Returns (list_of_taxa, float64 distance matrix)."""
+    with np.load(path) as data:
+        return data['taxa'].tolist(), data['distances'].astype(np.float64)
+
+def matrix_to_frame(taxa, distances):
+    """Build the DataFrame that `pd.read_csv` returns for the CSV export of this matrix."""
+    df = pd.DataFrame(distances, columns=taxa)
+    df.insert(0, 'Unnamed: 0', taxa)
+    return df
+
+def read_matrix_frame(path):
+    """Load a per-tree matrix from either a `.npz` store or a legacy CSV file."""
+    if path.endswith('.npz'):
+        return matrix_to_frame(*load_distance_matrix(path))
+    return pd.read_csv(path)
+
+def ordered_row_sums(values, column_order):
+    """
+    Row sums of the DataFrame `values`, adding its columns in order of first appearance
+    across the matrices of one summary. `column_order` ({column: position}) is shared by
+    those matrices and updated here; the columns of other matrices, which a concatenation
+    would fill with zeros, do not change the sums.
+    """
+    for col in values.columns:
+        column_order.setdefault(col, len(column_order))
+    positions = sorted(range(values.shape[1]), key=lambda k: column_order[values.columns[k]])
+    return values.iloc[:, positions].sum(axis=1).to_numpy(dtype=np.float64)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+mdna.py – Run the whole pipeline (01 -> 04) in a single process.
+The four stage scripts are imported as modules, so Biopython/pandas/scipy are loaded once
+and the config and gene list are parsed once. The gene list is passed in memory from
+step 1 onwards, and the distance matrices of step 3 are reduced in memory and handed to
+step 4 without writing the per-tree `.matrix.npz`/`.list.txt` files or the summary table
+(use `--keep_intermediates` to write them as 03_distance_matrices.py does). Exon FASTAs
+and exon trees are still written, since MAFFT and the tree programs read and write files.
+
+After each stage, the wall-clock time and the peak resident set size so far of this
+process and of its finished child processes (tools and worker pools) are reported.
+
+`refine` runs the hierarchical (order -> family -> genus) refinement of one sample after
+`run`. For each round, the reference alignments of the next taxonomic level are subset in
+memory to the union of the candidates of all NPV levels and written once per gene; the
+exons of the genes with any matching reference are aligned and their trees built once; and
+each tree's distances are then filtered to the candidates of every NPV level before the
+per-level scoring and prediction. Each level's candidates feed the next round.
+Outputs per round and NPV level: `<proj>.<level>_<label>.cumulative_dist.csv`,
+`<proj>.<level>_<label>.predictions.csv` and `<proj>.<level>_<label>_candidates.txt`;
+the union references and trees are kept in `<proj>_<level>_refine/`.
+
+Parameters are read from the config file, with the same keys and defaults as the stage
+scripts; the options below override them.
+
+Arguments:
+- `-c`, `--config`: Path to configuration file (YAML/JSON/TOML).
+- `-t`, `--threads`: Number of CPU cores to use.
+- `-p`, `--proj_name`: Project name identifier.
+- `--resume`: Skip the step 1 and 2 work recorded as completed in the project manifest
+  (`<proj_name>.manifest.jsonl`, shared with the stage scripts).
+`run` only:
+- `--stages`: Stages to run (default: 1 2 3 4). Later stages read the files of earlier ones when those are skipped.
+- `--keep_intermediates`: Also write the per-tree matrices, NODE lists and summary table of step 3.
+`refine` only (config keys `refine_candidates`, `refine_rounds`, `refine_zscore_threshold`):
+- `--candidates`: Starting candidate lists as `<label>=<file>`, one per NPV level.
+- `--rounds`: Refinement rounds as `<level>:<reference dir>`, e.g. `f:family_refs g:genus_refs`.
+- `--zscore_threshold`: Z-score threshold for the candidates of each round (default: 0).
+
+Usage:
+python mdna.py run -c config.yaml -t 64 -p my_project
+python mdna.py run -c config.yaml --stages 3 4
+python mdna.py refine -c config.yaml --candidates NPV95=my_project.order_candidates_NPV95.txt \
+    NPV90=my_project.order_candidates_NPV90.txt --rounds f:family298_refs_50genes
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import importlib
+import numpy as np
+import pandas as pd
+from pipeline_utils import log_status, load_config, is_valid_project_name
+from step_cache import StepCache
+from pick_match_list import subset_reference_panel
+from ref_index import open_index
+from checkpoint import Manifest, manifest_path
+
+# Stage scripts start with digits, so they are imported by module name
+exons_assembly = importlib.import_module('01_exons_assembly')
+exon_trees = importlib.import_module('02_exon_trees')
+distance_matrices = importlib.import_module('03_distance_matrices')
+prediction = importlib.import_module('04_prediction')
+
+def peak_rss_mb():
+    """Peak resident set size so far of this process and of its waited-for children, in MB."""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+def run_stage(name, log_file, func, *args):
+    """Run one stage, then log its wall-clock time and the peak RSS so far."""
+    log_status(log_file, f"{name}: started")
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    own, children = peak_rss_mb()
+    message = f"{name}: finished in {elapsed:.1f} s (peak RSS: driver {own:.0f} MB, children {children:.0f} MB)"
+    log_status(log_file, message)
+    print(message)
+    return result
+
+def read_gene_list(gene_list_path):
+    """Gene names from a gene list file, with any .fasta extension removed (as in step 1)."""
+    with open(gene_list_path, 'r') as f:
+        return [line.strip().replace('.fasta', '') for line in f if line.strip()]
+
+def distance_stage(params, gene_names, log_file):
+    """
+    Step 3 with in-memory hand-off: reduce each gene's matrices as soon as they are computed.
+    Returns the cumulative (row_name, total_value) DataFrame.
+    """
+    os.makedirs(params['matrix_dir'], exist_ok=True)
+    keep = params['keep_intermediates']
+    export_csv = params['export_csv']
+
+    def computed_genes():
+        results = distance_matrices.compute_distance_stage(
+            gene_names, params['phylo_dir'], params['threads'],
+            np.float64 if export_csv else np.float32, params['parallel_mode'])
+        for gene_name, trees, error in results:
+            if keep:
+                distance_matrices.write_gene_matrices(gene_name, trees, error, params['matrix_dir'], log_file, export_csv)
+            elif error is not None:
+                log_status(log_file, f"Failed processing {gene_name}: {error}")
+                print(f"Failed processing {gene_name}: {error}")
+            # Reduce the same values the file-based run reads back: float32, or float64 with export_csv
+            yield gene_name, [(records, taxa, distances.astype(np.float64 if export_csv else np.float32, copy=False))
+                              for records, taxa, distances in trees], error
+
+    summary_df = distance_matrices.summarize_gene_results(
+        computed_genes(), params['proj_name'], params['threshold'], params['use_flag'], params['use_threshold'])
+    if keep:
+        summary_csv = os.path.join(params['matrix_dir'], f"{params['proj_name']}.summary_dist.csv")
+        summary_df.to_csv(summary_csv, index=False)
+        log_status(log_file, f"Processed matrices saved to {summary_csv}")
+    cumulative = distance_matrices.cumulative_totals(summary_df)
+    cumulative.to_csv(params['cumulative_csv'], index=False)
+    log_status(log_file, f"Generated cumulative distance file: {params['cumulative_csv']}")
+    return cumulative
+
+def prediction_stage(params, cumulative, log_file):
+    """Step 4: summarize the cumulative scores by each taxonomic level and select taxa at each z-score."""
+    summaries, candidates = prediction.predict_taxa(cumulative, params['taxonomic_level'], params['zscore_threshold'])
+    for message in prediction.write_predictions(summaries, candidates, params['prediction_file'],
+                                                params['taxonomy_output_file']):
+        log_status(log_file, message)
+
+LEVEL_NAMES = {'o': 'order', 'f': 'family', 'g': 'genus', 's': 'species'}
+
+def read_candidates(candidate_file):
+    """Taxon names of a candidate list, one per line; blank lines are ignored."""
+    with open(candidate_file, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def level_taxa(taxa, project, names):
+    """Indices of the taxa kept for one NPV level: the sample's tips and the references matching a candidate."""
+    return [k for k, kept in enumerate(distance_matrices.group_taxa_flags(taxa, project, names)) if kept]
+
+def refine_round(params, gene_names, level, ref_dir, candidates, log_file, cache=None, manifest=None):
+    """
+    One refinement round at taxonomic `level`, shared by all NPV levels.
+    `candidates` maps each NPV label to its candidate names from the previous round. The
+    references matching any candidate are aligned and placed once; every tree's distance
+    matrix is then reduced once per label, restricted to that label's references. The NODE
+    sister taxa are also searched per label, among that label's references only, as on the
+    label's own tree in a separate run.
+    Returns {label: candidate names at `level`}.
+    """
+    proj = params['proj_name']
+    work_dir = f"{proj}_{LEVEL_NAMES[level]}_refine"
+    union = sorted(set().union(*candidates.values()))
+    union_ref = os.path.join(work_dir, 'ref')
+    genes = subset_reference_panel(ref_dir, gene_names, union_ref, union, open_index(ref_dir))
+    log_status(log_file, f"Union reference of {len(union)} candidates written for {len(genes)} genes to {union_ref}")
+    phylo_dir = os.path.join(work_dir, 'phylo')
+    os.makedirs(phylo_dir, exist_ok=True)
+    exon_trees.build_exon_trees(
+        genes, params['threads'], params['output_exon'], union_ref, phylo_dir, log_file, params['min_exon_size'],
+        params['max_job_threads'], params['tree_method'], params['iqtree_mode'], cache, manifest,
+        # The union reference changes with the candidates, so its backbones live with the round
+        os.path.join(work_dir, 'backbone') if params['backbone_dir'] else None, params['placement'])
+    row_names = {label: [] for label in candidates}
+    totals = {label: [] for label in candidates}
+    column_orders = {label: {} for label in candidates}
+    results = distance_matrices.compute_distance_stage(genes, phylo_dir, params['threads'], np.float32,
+                                                       params['parallel_mode'], (proj, candidates))
+    for gene_name, trees, error in results:
+        if error is not None:
+            log_status(log_file, f"Failed processing {gene_name}: {error}")
+            print(f"Failed processing {gene_name}: {error}")
+        for node_records, taxa, distances in trees:
+            for label, names in candidates.items():
+                species_to_taxa = distance_matrices.node_records_to_taxa(node_records[label])
+                keep = level_taxa(taxa, proj, names)
+                df = distance_matrices.matrix_to_frame(
+                    [taxa[k] for k in keep], np.asarray(distances[np.ix_(keep, keep)], dtype=np.float64))
+                names_, sums = distance_matrices.row_totals(
+                    df, proj, params['threshold'], params['use_flag'], params['use_threshold'],
+                    species_to_taxa=species_to_taxa, column_order=column_orders[label])
+                row_names[label].append(names_)
+                totals[label].append(sums)
+    refined = {}
+    for label in candidates:
+        stem = f"{proj}.{LEVEL_NAMES[level]}_{label}"
+        cumulative = distance_matrices.cumulative_totals(distance_matrices.totals_frame(row_names[label], totals[label]))
+        cumulative.to_csv(f"{stem}.cumulative_dist.csv", index=False)
+        summary = prediction.summarize_scores(cumulative, level)
+        summary.to_csv(f"{stem}.predictions.csv", index=False)
+        refined[label] = prediction.select_taxonomy_by_zscore(summary, params['refine_zscore_threshold'])
+        with open(f"{stem}_candidates.txt", 'w') as fout:
+            for name in refined[label]:
+                fout.write(name + "\n")
+        log_status(log_file, f"{label}: {len(refined[label])} {LEVEL_NAMES[level]} candidates written to {stem}_candidates.txt")
+    return refined
+
+def refine_pipeline(params):
+    """Run the refinement rounds, feeding each NPV level's candidates into the next round."""
+    log_file = f"{params['proj_name']}_refine.log"
+    if os.path.exists(log_file) and not params['resume']:
+        os.remove(log_file)
+    log_status(log_file, "Refinement started with the following parameters:")
+    for key, value in params.items():
+        log_status(log_file, f"  {key}: {value}")
+    gene_names = read_gene_list(params['gene_list'])
+    candidates = {label: read_candidates(path) for label, path in params['refine_candidates'].items()}
+    cache = None
+    if params['cache_dir']:
+        cache = StepCache(params['cache_dir'], int(float(params['cache_max_gb']) * 1024 ** 3))
+    manifest = Manifest(manifest_path(params['proj_name']), params['resume'])
+    for level, ref_dir in params['refine_rounds']:
+        candidates = run_stage(f"Refine {LEVEL_NAMES[level]}", log_file, refine_round,
+                               params, gene_names, level, ref_dir, candidates, log_file, cache, manifest)
+    log_status(log_file, "Refinement completed successfully.")
+    print(f"Refinement completed. Check {log_file} for details.")
+
+def parse_pairs(values, separator, option):
+    """Split `key<separator>value` items (a list or a config mapping) into (key, value) pairs."""
+    if isinstance(values, dict):
+        return list(values.items())
+    pairs = []
+    for item in values or []:
+        key, sep, value = str(item).partition(separator)
+        if not sep or not key or not value:
+            raise ValueError(f"{option} items must look like key{separator}value, got '{item}'")
+        pairs.append((key, value))
+    return pairs
+
+def run_pipeline(params):
+    """Run the selected stages, passing the gene list and step 3 results between stages in memory."""
+    log_file = f"{params['proj_name']}_pipeline.log"
+    if os.path.exists(log_file) and not params['resume']:
+        os.remove(log_file)
+    log_status(log_file, "Pipeline started with the following parameters:")
+    for key, value in params.items():
+        log_status(log_file, f"  {key}: {value}")
+    stages = params['stages']
+    manifest = Manifest(manifest_path(params['proj_name']), params['resume'])
+    gene_names = None
+    if 1 in stages:
+        run_stage("Step 1 Sequence Assembly", log_file, exons_assembly.sequence_assembly,
+                  params['threads'], params['read1'], params['read2'], params['mega353'],
+                  params['proj_name'], log_file, params['output_hyb'], manifest)
+        gene_names = run_stage("Step 1 Exon Extraction", log_file, exons_assembly.exon_extraction,
+                               params['gene_list'], params['overlap'], params['proj_name'], log_file,
+                               params['output_hyb'], params['output_exon'], params['extract_workers'], manifest)
+    if gene_names is None:
+        gene_names = read_gene_list(params['gene_list'])
+    if 2 in stages:
+        os.makedirs(params['phylo_dir'], exist_ok=True)
+        cache = None
+        if params['cache_dir']:
+            cache = StepCache(params['cache_dir'], int(float(params['cache_max_gb']) * 1024 ** 3))
+        run_stage("Step 2 Exon Trees", log_file, exon_trees.build_exon_trees,
+                  gene_names, params['threads'], params['output_exon'], params['ref_alignment'],
+                  params['phylo_dir'], log_file, params['min_exon_size'], params['max_job_threads'],
+                  params['tree_method'], params['iqtree_mode'], cache, manifest,
+                  params['backbone_dir'], params['placement'])
+    cumulative = None
+    if 3 in stages:
+        cumulative = run_stage("Step 3 Distance Matrices", log_file, distance_stage, params, gene_names, log_file)
+    if 4 in stages:
+        if cumulative is None:
+            cumulative = pd.read_csv(params['cumulative_csv'])
+        run_stage("Step 4 Prediction", log_file, prediction_stage, params, cumulative, log_file)
+    log_status(log_file, "Pipeline completed successfully.")
+    print(f"Pipeline completed. Check {log_file} for details.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mixed-sample pipeline (steps 1-4) in one process.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-c", "--config", help="Path to config file (YAML/JSON/TOML)")
+    common.add_argument("-t", "--threads", type=int, help="Number of CPU cores to use")
+    common.add_argument("-p", "--proj_name", help="Project name identifier")
+    common.add_argument("--resume", action="store_true", help="Skip step 1 and 2 work recorded as completed in the project manifest")
+    run = subparsers.add_parser("run", parents=[common], help="Run the pipeline stages")
+    run.add_argument("--stages", type=int, nargs='+', choices=[1, 2, 3, 4], default=[1, 2, 3, 4], help="Stages to run")
+    run.add_argument("--keep_intermediates", action="store_true", help="Also write step 3 per-tree matrices, NODE lists and summary")
+    refine = subparsers.add_parser("refine", parents=[common], help="Refine predictions to lower taxonomic levels")
+    refine.add_argument("--candidates", nargs='+', help="Starting candidate lists as <label>=<file>, one per NPV level")
+    refine.add_argument("--rounds", nargs='+', help="Refinement rounds as <level>:<reference dir>, e.g. f:family_refs")
+    refine.add_argument("--zscore_threshold", type=float, help="Z-score threshold for the candidates of each round (default: 0)")
+    args = parser.parse_args()
+
+    config = load_config(args.config) if args.config else {}
+    threads = args.threads if args.threads is not None else config.get('threads')
+    proj_name = args.proj_name or config.get('proj_name')
+    if threads is None or not proj_name:
+        parser.error("Required parameters missing: threads and proj_name must be specified.")
+    if not is_valid_project_name(proj_name):
+        parser.error(f"Project name '{proj_name}' contains invalid characters.")
+    threads = int(threads)
+    params = {
+        'proj_name': proj_name,
+        'threads': threads,
+        'resume': args.resume,
+        # Step 1
+        'read1': config.get('read1'),
+        'read2': config.get('read2'),
+        'mega353': config.get('mega353', "angiosperms353_v2_interim_targetfile.fasta"),
+        'gene_list': config.get('gene_list', "gene_list.txt"),
+        'overlap': float(config.get('overlap', 0.8)),
+        'output_hyb': config.get('output_hyb', "01_hyb_output"),
+        'output_exon': config.get('output_exon', "02_exon_extracted"),
+        'extract_workers': int(config.get('extract_workers', threads)),
+        # Step 2
+        'ref_alignment': config.get('ref_alignment', "ref"),
+        'phylo_dir': config.get('input_dir', "03_phylo_results"),
+        'min_exon_size': int(config.get('min_exon_size', 80)),
+        'max_job_threads': int(config.get('max_job_threads', 4)),
+        'tree_method': config.get('tree_method', "fasttree"),
+        'iqtree_mode': config.get('iqtree_mode', "fixed"),
+        'cache_dir': config.get('cache_dir'),
+        'cache_max_gb': config.get('cache_max_gb', 20),
+        'backbone_dir': config.get('backbone_dir'),
+        'placement': config.get('placement', "distance"),
+        # Step 3
+        'matrix_dir': config.get('output_dir', "04_all_trees"),
+        'threshold': float(config.get('threshold', 1.96)),
+        'use_flag': bool(config.get('use_flag', False)),
+        'use_threshold': bool(config.get('use_threshold', False)),
+        'export_csv': bool(config.get('export_csv', False)),
+        'parallel_mode': config.get('parallel_mode', "process"),
+        'cumulative_csv': f"{proj_name}.cumulative_dist.csv",
+        # Step 4
+        'taxonomic_level': list(dict.fromkeys(prediction.as_list(config.get('taxonomic_level', "o")))),
+        'zscore_threshold': list(dict.fromkeys(float(z) for z in prediction.as_list(config.get('zscore_threshold', 0.5)))),
+    }
+    # Output names: one per level (and threshold), or one name with {level}/{z} fields
+    try:
+        params['prediction_file'] = prediction.expand_output_names(
+            prediction.as_list(config.get('output_file', f"{proj_name}.predictions.csv")),
+            [{'level': level} for level in params['taxonomic_level']], "output_file")
+        params['taxonomy_output_file'] = prediction.expand_output_names(
+            prediction.as_list(config.get('taxonomy_output_file', f"{proj_name}.candidates.txt")),
+            [{'level': level, 'z': z} for level in params['taxonomic_level'] for z in params['zscore_threshold']],
+            "taxonomy_output_file")
+    except ValueError as e:
+        parser.error(str(e))
+    if params['use_flag'] and params['use_threshold']:
+        parser.error("use_flag and use_threshold cannot both be enabled.")
+    if params['tree_method'] == "fasttree":
+        params['iqtree_mode'] = None
+    if args.command == "refine":
+        try:
+            params['refine_candidates'] = dict(parse_pairs(args.candidates or config.get('refine_candidates'), '=', "--candidates"))
+            params['refine_rounds'] = parse_pairs(args.rounds or config.get('refine_rounds'), ':', "--rounds")
+        except ValueError as e:
+            parser.error(str(e))
+        z_threshold = args.zscore_threshold if args.zscore_threshold is not None else config.get('refine_zscore_threshold', 0)
+        params['refine_zscore_threshold'] = float(z_threshold)
+        if not params['refine_candidates'] or not params['refine_rounds']:
+            parser.error("refine needs candidate lists (--candidates) and rounds (--rounds).")
+        if any(level not in LEVEL_NAMES for level, _ in params['refine_rounds']):
+            parser.error(f"Round levels must be one of {', '.join(LEVEL_NAMES)}.")
+        refine_pipeline(params)
+        return
+    params['stages'] = sorted(set(args.stages))
+    params['keep_intermediates'] = args.keep_intermediates
+    if 1 in params['stages'] and (not params['read1'] or not params['read2']):
+        parser.error("Step 1 needs read1 and read2 in the config file.")
+    run_pipeline(params)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# name_matcher.py
+"""
+Substring matcher for selecting FASTA records by name.
+`NameMatcher(names).matches(text)` is True when `text` contains any of `names`, exactly like
+`any(name in text for name in names)`, but the names are compiled once into an Aho–Corasick
+automaton, so each text is scanned once regardless of how many names there are. Results are
+memoized per text, since the same taxon IDs recur in every gene's reference alignment.
+"""
+from collections import deque
+
+class NameMatcher:
+    """Aho–Corasick automaton answering "does this text contain any of the names?"."""
+    def __init__(self, names):
+        names = set(names)
+        # An empty name is a substring of every text
+        self.match_all = '' in names
+        self._goto = [{}]
+        self._out = [False]
+        for name in names:
+            node = 0
+            for ch in name:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto.append({})
+                    self._out.append(False)
+                    self._goto[node][ch] = child
+                node = child
+            if name:
+                self._out[node] = True
+        # Failure links in breadth-first order; a node also matches if its failure target does
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0) if node else 0
+                self._fail[child] = target
+                self._out[child] = self._out[child] or self._out[target]
+        self._memo = {}
+
+    def matches(self, text):
+        """True if `text` contains any of the names."""
+        if self.match_all:
+            return True
+        hit = self._memo.get(text)
+        if hit is None:
+            hit = self._scan(text)
+            self._memo[text] = hit
+        return hit
+
+    def _scan(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                return True
+        return False
@@ -1,21 +1,95 @@
+import os
 import argparse
 from Bio import SeqIO
+from name_matcher import NameMatcher
 
-def extract_sequences(input_fasta, output_fasta, names_list):
+def read_names(names_file):
+    """Names to match, one per line (stripped)."""
+    with open(names_file, "r") as f:
+        return [line.strip() for line in f]
+
+def extract_sequences(input_fasta, output_fasta, names_list, matcher=None):
+    """
+    Stream the records of `input_fasta` whose ID contains any of `names_list` to `output_fasta`.
+    Returns the number of records written. A prebuilt `matcher` (NameMatcher) can be shared
+    across files.
+    """
+    matcher = matcher or NameMatcher(names_list)
     with open(input_fasta, "r") as input_handle, open(output_fasta, "w") as output_handle:
-        for record in SeqIO.parse(input_handle, "fasta"):
-            if any(name in record.id for name in names_list):
-                SeqIO.write(record, output_handle, "fasta")
+        records = SeqIO.parse(input_handle, "fasta")
+        return SeqIO.write((record for record in records if matcher.matches(record.id)), output_handle, "fasta")
+
+def fasta_names(input_dir, gene_list=None):
+    """
+    FASTA file names to process in `input_dir`: all *.fasta files, or the entries of `gene_list`
+    (used as file names, with ".fasta" added when no file of that exact name exists).
+    """
+    if gene_list is None:
+        return sorted(name for name in os.listdir(input_dir) if name.endswith(".fasta"))
+    with open(gene_list, "r") as f:
+        genes = [line.strip() for line in f if line.strip()]
+    return [gene if os.path.exists(os.path.join(input_dir, gene)) else f"{gene}.fasta" for gene in genes]
+
+def extract_directory(input_dir, output_dir, names_list, gene_list=None):
+    """
+    Run `extract_sequences` on every FASTA of `input_dir` (or of `gene_list`), writing the
+    files of the same name to `output_dir`. The name matcher is built once for the batch.
+    Returns {file name: records written}; missing input files are skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    matcher = NameMatcher(names_list)
+    written = {}
+    for name in fasta_names(input_dir, gene_list):
+        input_fasta = os.path.join(input_dir, name)
+        if not os.path.exists(input_fasta):
+            print(f"Skipping {input_fasta}: file not found")
+            continue
+        written[name] = extract_sequences(input_fasta, os.path.join(output_dir, name), names_list, matcher)
+    return written
+
+def subset_reference_panel(ref_dir, genes, output_dir, names_list, index=None):
+    """
+    Write the records of each gene's reference alignment (`<ref_dir>/<gene>.fasta`) whose ID
+    contains any of `names_list` to `<output_dir>/<gene>.fasta`, in one pass per file.
+    With a reference `index` (ref_index.RefIndex), the matching taxa are found once for the
+    whole panel and the records of unchanged files are copied by byte range without parsing.
+    Returns the genes with at least one matching record; genes without are not written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    matcher = NameMatcher(names_list)
+    taxa = index.taxa_matching(names_list) if index is not None else None
+    kept = []
+    for gene in genes:
+        output_fasta = os.path.join(output_dir, f"{gene}.fasta")
+        if index is not None and index.is_current(gene):
+            if index.write_subset(gene, taxa, output_fasta):
+                kept.append(gene)
+            continue
+        input_fasta = os.path.join(ref_dir, f"{gene}.fasta")
+        if not os.path.exists(input_fasta):
+            continue
+        records = [record for record in SeqIO.parse(input_fasta, "fasta") if matcher.matches(record.id)]
+        if records:
+            SeqIO.write(records, output_fasta, "fasta")
+            kept.append(gene)
+    return kept
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract sequences from a FASTA file.")
-    parser.add_argument("input_fasta", help="Input FASTA file")
-    parser.add_argument("output_fasta", help="Output FASTA file")
+    parser = argparse.ArgumentParser(
+        description="Extract sequences whose names contain any listed name from a FASTA file, "
+                    "or from every FASTA file of a directory with --dir.")
+    parser.add_argument("input_fasta", help="Input FASTA file (input directory with --dir)")
+    parser.add_argument("output_fasta", help="Output FASTA file (output directory with --dir)")
     parser.add_argument("names_file", help="File containing names to extract")
-    
+    parser.add_argument("--dir", action="store_true", help="Treat input/output as directories and process all FASTA files")
+    parser.add_argument("--gene_list", help="With --dir, only process these genes/files (one per line)")
+
     args = parser.parse_args()
 
-    with open(args.names_file, "r") as f:
-        names_list = [line.strip() for line in f]
+    names_list = read_names(args.names_file)
 
-    extract_sequences(args.input_fasta, args.output_fasta, names_list)
+    if args.dir:
+        written = extract_directory(args.input_fasta, args.output_fasta, names_list, args.gene_list)
+        print(f"Extracted {sum(written.values())} sequences from {len(written)} files to {args.output_fasta}")
+    else:
+        extract_sequences(args.input_fasta, args.output_fasta, names_list)
@@ -36,15 +36,18 @@ def run_command(command, step_name, log_file, critical=False):
     """
     Run a shell command and log its status (SUCCESS/FAILURE).
     If the command fails and `critical` is True, exit the program.
+    Returns True if the command succeeded.
     """
     try:
         subprocess.run(command, shell=True, check=True)
         log_status(log_file, f"{step_name}: SUCCESS")
+        return True
     except subprocess.CalledProcessError:
         log_status(log_file, f"{step_name}: FAILURE")
         print(f"Error: {step_name} failed. Check {log_file} for details.")
         if critical:
             exit(1)
+        return False
 
 def is_valid_project_name(project_name):
     """
@@ -0,0 +1,108 @@
+# placement.py
+"""
+Distance-based placement of sample sequences onto a fixed reference backbone tree.
+The backbone is built once per gene from the reference alignment alone. For a sample,
+the exon alignment (references plus the sample's NODE sequences, after MAFFT and trimAl)
+only has to be read: each query sequence is attached as the sister of its closest
+reference, on a new node that splits the reference's terminal branch. Sequences that MAFFT
+reversed (`--adjustdirection` adds an `_R_` prefix) are matched to the backbone by their
+original name, so a reversed reference is not placed again as a query. Distances are
+Jukes–Cantor corrected p-distances over the columns where both sequences have a base,
+computed for all references at once with NumPy. The result is written as a Newick tree
+with the same tip names as a full FastTree/IQ-TREE tree, so step 3 reads it unchanged.
+"""
+import numpy as np
+from Bio import Phylo, SeqIO
+from Bio.Phylo.BaseTree import Clade
+
+GAP_CHARS = b'-.?NnXx'
+# Prefix MAFFT --adjustdirection adds to the names of reverse-complemented sequences
+REVERSE_PREFIX = '_R_'
+# Upper bound of the corrected distance, for sequences too divergent (or too short) to correct
+MAX_DISTANCE = 5.0
+
+def read_alignment(alignment_file):
+    """Aligned sequences as ({id: row index}, uint8 matrix of upper-case characters)."""
+    ids, rows = {}, []
+    for record in SeqIO.parse(alignment_file, "fasta"):
+        ids.setdefault(record.id, len(rows))
+        rows.append(str(record.seq).upper().encode())
+    width = max((len(row) for row in rows), default=0)
+    matrix = np.full((len(rows), width), ord('-'), dtype=np.uint8)
+    for k, row in enumerate(rows):
+        matrix[k, :len(row)] = np.frombuffer(row, dtype=np.uint8)
+    return ids, matrix
+
+def strip_reverse_prefix(name):
+    """`name` without the prefix MAFFT adds to reversed sequences."""
+    return name[len(REVERSE_PREFIX):] if name.startswith(REVERSE_PREFIX) else name
+
+def jc_distances(query, references):
+    """Jukes–Cantor distances from one aligned sequence to every row of `references`."""
+    gaps = np.frombuffer(GAP_CHARS.upper(), dtype=np.uint8)
+    valid = ~np.isin(references, gaps) & ~np.isin(query, gaps)
+    sites = valid.sum(axis=1)
+    mismatches = ((references != query) & valid).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = mismatches / sites
+        d = -0.75 * np.log(1 - 4.0 / 3.0 * p)
+    return np.where((sites > 0) & np.isfinite(d), np.minimum(d, MAX_DISTANCE), MAX_DISTANCE)
+
+def attach_sister(tree, target, name, distance):
+    """
+    Insert tip `name` as the sister of clade `target`, splitting the target's branch at
+    distance/2 (or at its parent, for a shorter branch). The query's branch takes the rest,
+    so the path from the query to `target` is exactly `distance`.
+    The backbone's branch lengths come from the whole-gene reference alignment, while the
+    query's branch comes from this exon's distance only.
+    """
+    half = distance / 2.0
+    branch = target.branch_length or 0.0
+    parent = tree.get_path(target)
+    parent = parent[-2] if len(parent) > 1 else tree.root
+    node = Clade(branch_length=max(branch - half, 0.0))
+    position = parent.clades.index(target)
+    target.branch_length = min(branch, half)
+    node.clades = [target, Clade(branch_length=distance - target.branch_length, name=name)]
+    parent.clades[position] = node
+
+def rename_to_backbone(backbone_file, alignment_file, output_file):
+    """
+    Copy `alignment_file` to `output_file`, giving the sequences that match a backbone tip only
+    up to the reverse prefix that tip's name, so a constraint search (IQ-TREE -g) on the
+    backbone finds every reference. Returns the number of renamed sequences.
+    """
+    tips = {strip_reverse_prefix(clade.name): clade.name for clade in Phylo.read(backbone_file, "newick").get_terminals()}
+    records, renamed = [], 0
+    for record in SeqIO.parse(alignment_file, "fasta"):
+        tip = tips.get(strip_reverse_prefix(record.id))
+        if tip is not None and tip != record.id:
+            record.id, record.description = tip, ''
+            renamed += 1
+        records.append(record)
+    SeqIO.write(records, output_file, "fasta")
+    return renamed
+
+def place_queries(backbone_file, alignment_file, output_file):
+    """
+    Place every sequence of `alignment_file` that is not a backbone tip onto the backbone
+    tree and write the tree to `output_file`. Returns the number of placed sequences.
+    """
+    tree = Phylo.read(backbone_file, "newick")
+    ids, matrix = read_alignment(alignment_file)
+    tips = {strip_reverse_prefix(clade.name): clade for clade in tree.get_terminals()}
+    # Alignment rows by original name, so reversed references still match their backbone tip
+    rows = {}
+    for name, row in ids.items():
+        rows.setdefault(strip_reverse_prefix(name), row)
+    ref_names = [name for name in tips if name in rows]
+    if not ref_names:
+        raise ValueError(f"No backbone taxa found in {alignment_file}")
+    references = matrix[[rows[name] for name in ref_names]]
+    queries = [name for name in ids if strip_reverse_prefix(name) not in tips]
+    for name in queries:
+        distances = jc_distances(matrix[ids[name]], references)
+        best = int(np.argmin(distances))
+        attach_sister(tree, tips[ref_names[best]], name, float(distances[best]))
+    Phylo.write(tree, output_file, "newick")
+    return len(queries)
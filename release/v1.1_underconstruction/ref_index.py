@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+ref_index.py – Persistent index of a directory of per-gene reference alignments.
+`build` scans every `<gene>.fasta` of a reference directory once and stores, in an SQLite
+file (default `<ref_dir>/ref_index.sqlite`):
+- per gene: the file's size and modification time, its number of sequences and alignment length;
+- per record: the taxon (sequence ID), the byte offset and size of the record in the file,
+  and its aligned and ungapped sequence lengths;
+- per taxon: order, family, genus and species parsed from the `Order_Family_Genus_Species`
+  name (as 04_prediction.process_column does).
+Rebuilding only rescans files whose size or modification time changed. Taxonomic subsets
+are then written by copying the byte ranges of the matching records, and the size of a
+reference alignment is looked up without parsing it; files changed since indexing are
+detected and read directly instead.
+
+Usage:
+python ref_index.py build ref
+python ref_index.py subset ref/ref_index.sqlite order_candidates.txt ref_subset [--gene_list gene_list.txt]
+python ref_index.py taxa ref/ref_index.sqlite -tl f
+"""
+import os
+import re
+import sqlite3
+import argparse
+from name_matcher import NameMatcher
+
+INDEX_NAME = "ref_index.sqlite"
+LEVEL_COLUMNS = {'o': 'order_name', 'f': 'family', 'g': 'genus', 's': 'species'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    gene TEXT PRIMARY KEY, file_name TEXT, size INTEGER, mtime_ns INTEGER, nseqs INTEGER, max_len INTEGER);
+CREATE TABLE IF NOT EXISTS records (
+    gene TEXT, taxon TEXT, offset INTEGER, nbytes INTEGER, seq_len INTEGER, ungapped_len INTEGER);
+CREATE INDEX IF NOT EXISTS records_gene ON records (gene);
+CREATE INDEX IF NOT EXISTS records_taxon ON records (taxon);
+CREATE TABLE IF NOT EXISTS taxa (
+    taxon TEXT PRIMARY KEY, order_name TEXT, family TEXT, genus TEXT, species TEXT);
+"""
+
+def default_index_path(ref_dir):
+    """Index file kept inside the reference directory."""
+    return os.path.join(ref_dir, INDEX_NAME)
+
+def parse_taxon(name):
+    """(order, family, genus, species) of an `Order_Family_Genus_Species` name; missing parts fall back to `name`."""
+    parts = name.split('_')
+    order, family, genus = (parts[k] if len(parts) > k else name for k in range(3))
+    species = '_'.join(parts[2:4]) if len(parts) >= 4 else name
+    return order, family, genus, species
+
+def scan_fasta(path):
+    """List of (taxon, offset, nbytes, seq_len, ungapped_len) for the records of a FASTA file."""
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    starts = [match.start() for match in re.finditer(rb'^>', data, re.M)]
+    records = []
+    for k, start in enumerate(starts):
+        end = starts[k + 1] if k + 1 < len(starts) else len(data)
+        eol = data.find(b'\n', start, end)
+        eol = end if eol < 0 else eol
+        header = data[start + 1:eol].decode().strip()
+        seq = data[eol + 1:end].translate(None, b' \t\r\n')
+        taxon = header.split()[0] if header else ''
+        records.append((taxon, start, end - start, len(seq), len(seq.translate(None, b'-.'))))
+    return records
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def build_index(ref_dir, index_path=None):
+    """
+    Index every `*.fasta` of `ref_dir`, rescanning only files that are new or changed since
+    the last build and dropping files that were removed. Returns (scanned, unchanged) counts.
+    """
+    index_path = index_path or default_index_path(ref_dir)
+    conn = sqlite3.connect(index_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('ref_dir', ?)", (os.path.abspath(ref_dir),))
+        indexed = {gene: (size, mtime) for gene, size, mtime in conn.execute("SELECT gene, size, mtime_ns FROM files")}
+        present = set()
+        scanned = unchanged = 0
+        for file_name in sorted(os.listdir(ref_dir)):
+            if not file_name.endswith('.fasta'):
+                continue
+            gene = file_name[:-len('.fasta')]
+            present.add(gene)
+            path = os.path.join(ref_dir, file_name)
+            signature = file_signature(path)
+            if indexed.get(gene) == signature:
+                unchanged += 1
+                continue
+            records = scan_fasta(path)
+            conn.execute("DELETE FROM records WHERE gene = ?", (gene,))
+            conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                             [(gene, *record) for record in records])
+            conn.executemany("INSERT OR IGNORE INTO taxa VALUES (?, ?, ?, ?, ?)",
+                             [(record[0], *parse_taxon(record[0])) for record in records])
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                         (gene, file_name, *signature, len(records), max((r[3] for r in records), default=0)))
+            scanned += 1
+        for gene in set(indexed) - present:
+            conn.execute("DELETE FROM records WHERE gene = ?", (gene,))
+            conn.execute("DELETE FROM files WHERE gene = ?", (gene,))
+        conn.execute("DELETE FROM taxa WHERE taxon NOT IN (SELECT taxon FROM records)")
+        conn.commit()
+    finally:
+        conn.close()
+    return scanned, unchanged
+
+class RefIndex:
+    """Read access to a reference index built by `build_index`; `ref_dir` overrides the indexed directory."""
+    def __init__(self, index_path, ref_dir=None):
+        # check_same_thread=False: lookups are read-only and may come from scheduler threads
+        self.conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+        self.ref_dir = ref_dir or self.conn.execute("SELECT value FROM meta WHERE key = 'ref_dir'").fetchone()[0]
+        self.files = {gene: (file_name, size, mtime, nseqs, max_len) for gene, file_name, size, mtime, nseqs, max_len
+                      in self.conn.execute("SELECT * FROM files")}
+
+    def genes(self):
+        return sorted(self.files)
+
+    def path(self, gene):
+        return os.path.join(self.ref_dir, self.files[gene][0])
+
+    def is_current(self, gene):
+        """True if `gene` is indexed and its file has not changed since."""
+        if gene not in self.files:
+            return False
+        try:
+            return file_signature(self.path(gene)) == self.files[gene][1:3]
+        except OSError:
+            return False
+
+    def alignment_cells(self, gene):
+        """(number of sequences, alignment length) of an indexed gene."""
+        return self.files[gene][3:5]
+
+    def records(self, gene):
+        """List of (taxon, offset, nbytes, seq_len, ungapped_len) of a gene, in file order."""
+        return self.conn.execute(
+            "SELECT taxon, offset, nbytes, seq_len, ungapped_len FROM records WHERE gene = ? ORDER BY offset",
+            (gene,)).fetchall()
+
+    def taxa_matching(self, names_list):
+        """Set of indexed taxa whose name contains any of `names_list` (as pick_match_list matches IDs)."""
+        matcher = NameMatcher(names_list)
+        return {taxon for (taxon,) in self.conn.execute("SELECT taxon FROM taxa") if matcher.matches(taxon)}
+
+    def taxa_at_level(self, level):
+        """{name at `level` (o/f/g/s): sorted list of taxa} over the whole panel."""
+        groups = {}
+        for taxon, name in self.conn.execute(f"SELECT taxon, {LEVEL_COLUMNS[level]} FROM taxa ORDER BY taxon"):
+            groups.setdefault(name, []).append(taxon)
+        return groups
+
+    def write_subset(self, gene, taxa, output_fasta):
+        """Copy the records of `gene` whose taxon is in `taxa` to `output_fasta`. Returns the number written."""
+        selected = [(offset, nbytes) for taxon, offset, nbytes, _, _ in self.records(gene) if taxon in taxa]
+        if not selected:
+            return 0
+        with open(self.path(gene), 'rb') as src, open(output_fasta, 'wb') as dst:
+            for offset, nbytes in selected:
+                src.seek(offset)
+                chunk = src.read(nbytes)
+                dst.write(chunk if chunk.endswith(b'\n') else chunk + b'\n')
+        return len(selected)
+
+def open_index(ref_dir):
+    """RefIndex of `ref_dir` if it has been indexed, else None."""
+    index_path = default_index_path(ref_dir)
+    return RefIndex(index_path, ref_dir) if os.path.exists(index_path) else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the index of a reference alignment directory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Index (or update the index of) a reference directory")
+    build.add_argument("ref_dir", help="Directory of <gene>.fasta reference alignments")
+    build.add_argument("-o", "--index", help=f"Index file (default: <ref_dir>/{INDEX_NAME})")
+    subset = subparsers.add_parser("subset", help="Write the references matching a name list for every gene")
+    subset.add_argument("index", help="Index file")
+    subset.add_argument("names_file", help="File containing names to extract")
+    subset.add_argument("output_dir", help="Output directory for the <gene>.fasta subsets")
+    subset.add_argument("--gene_list", help="Only these genes (default: all indexed genes)")
+    taxa = subparsers.add_parser("taxa", help="List the taxa of the panel grouped by taxonomic level")
+    taxa.add_argument("index", help="Index file")
+    taxa.add_argument("-tl", "--taxonomic_level", choices=list(LEVEL_COLUMNS), default='o', help="Taxonomic level")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        scanned, unchanged = build_index(args.ref_dir, args.index)
+        print(f"Indexed {args.ref_dir}: {scanned} files scanned, {unchanged} unchanged")
+    elif args.command == "subset":
+        from pick_match_list import read_names, subset_reference_panel
+        index = RefIndex(args.index)
+        genes = index.genes()
+        if args.gene_list:
+            with open(args.gene_list, 'r') as f:
+                genes = [line.strip().replace('.fasta', '') for line in f if line.strip()]
+        kept = subset_reference_panel(index.ref_dir, genes, args.output_dir, read_names(args.names_file), index)
+        print(f"Wrote reference subsets for {len(kept)} of {len(genes)} genes to {args.output_dir}")
+    else:
+        for name, members in sorted(RefIndex(args.index).taxa_at_level(args.taxonomic_level).items()):
+            print(f"{name}\t{len(members)}")
+
+if __name__ == "__main__":
+    main()
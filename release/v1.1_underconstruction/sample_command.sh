@@ -16,7 +16,7 @@ python 01_exons_assembly.py -t 64 -r1 RENAME.R1.fastq -r2 RENAME.R2.fastq \
 
 # Step 2: Exon Tree Creation
 python 02_exon_trees.py -t 64 -p RENAME \
-	-e RENAME_exon \
+	-e RENAME_exon --cache_dir RENAME_step_cache \
 	-r order106_refs_50genes \
 	--output_dir RENAME_phylo
 
@@ -27,25 +27,26 @@ python 03_distance_matrices.py -t 64 -p RENAME --threshold 1 \
 
 # Step 4: Prediction and Identification into Order
 ## We perform 3 different order level predictions at z-score=-0.1/0.5/0.9
-python 04_prediction.py -i RENAME.cumulative_dist.csv -o RENAME.predictions.csv -tl o -z -0.1 -to RENAME.order_candidates_NPV95.txt
-
-python 04_prediction.py -i RENAME.cumulative_dist.csv -o RENAME.predictions.csv -tl o -z 0.5 -to RENAME.order_candidates_NPV90.txt
-
-python 04_prediction.py -i RENAME.cumulative_dist.csv -o RENAME.predictions.csv -tl o -z 0.9 -to RENAME.order_candidates_NPV85.txt
+python 04_prediction.py -i RENAME.cumulative_dist.csv -o RENAME.predictions.csv -tl o -z -0.1 0.5 0.9 \
+	-to RENAME.order_candidates_NPV95.txt RENAME.order_candidates_NPV90.txt RENAME.order_candidates_NPV85.txt
 
 # ----------------
 # If only need the order level, you can ignore the following commands
 
 # Family Level Predictions
 ## We run 3 tests here for different NPV levels.
+## The same refinement, with the alignments and trees shared by the three levels, is:
+## python mdna.py refine -c RENAME.yaml -t 64 -p RENAME --rounds f:family298_refs_50genes \
+##	--candidates NPV95=RENAME.order_candidates_NPV95.txt NPV90=RENAME.order_candidates_NPV90.txt NPV85=RENAME.order_candidates_NPV85.txt
+## (RENAME.yaml: gene_list: gene.list.txt, output_exon: RENAME_exon, threshold: 1, cache_dir: RENAME_step_cache)
 ## For NPV=90% (z-score=0.5)
 # Step 1: Select families from predicted orders
-mkdir RENAME_ref_NPV90
-while read line; do python pick_match_list.py family298_refs_50genes/${line} RENAME_ref_NPV90/${line} RENAME.order_candidates_NPV90.txt; done < gene.list.txt
+python pick_match_list.py family298_refs_50genes RENAME_ref_NPV90 RENAME.order_candidates_NPV90.txt \
+	--dir --gene_list gene.list.txt
 
 # Step 2: Use the selected families as reference to reconstruct phylogeny
 python 02_exon_trees.py -t 64 -p RENAME -r RENAME_ref_NPV90 \
-        -e RENAME_exon \
+        -e RENAME_exon --cache_dir RENAME_step_cache \
         --output_dir RENAME_fam90_phylo
 
 # Step 3: Distance Matrix Calculation
@@ -59,12 +60,12 @@ python 04_prediction.py -i RENAME.cumulative_dist.csv -o RENAME.predictions_fam9
 # ---
 ## For NPV=95% (z-score=-0.1)
 # Step 1: Select families from predicted orders
-mkdir RENAME_ref_NPV95
-while read line; do python pick_match_list.py family298_refs_50genes/${line} RENAME_ref_NPV95/${line} RENAME.order_candidates_NPV95.txt; done < gene.list.txt
+python pick_match_list.py family298_refs_50genes RENAME_ref_NPV95 RENAME.order_candidates_NPV95.txt \
+	--dir --gene_list gene.list.txt
 
 # Step 2: Use the selected families as reference to reconstruct phylogeny
 python 02_exon_trees.py -t 64 -p RENAME -r RENAME_ref_NPV95 \
-        -e RENAME_exon \
+        -e RENAME_exon --cache_dir RENAME_step_cache \
         --output_dir RENAME_fam95_phylo
 
 # Step 3: Distance Matrix Calculation
@@ -78,12 +79,12 @@ python 04_prediction.py -i RENAME.cumulative_dist.csv -o RENAME.predictions_fam9
 # ---
 ## For NPV=85% (z-score=0.9)
 # Step 1: Select families from predicted orders
-mkdir RENAME_ref_NPV85
-while read line; do python pick_match_list.py family298_refs_50genes/${line} RENAME_ref_NPV85/${line} RENAME.order_candidates_NPV85.txt; done < gene.list.txt
+python pick_match_list.py family298_refs_50genes RENAME_ref_NPV85 RENAME.order_candidates_NPV85.txt \
+	--dir --gene_list gene.list.txt
 
 # Step 2: Use the selected families as reference to reconstruct phylogeny
 python 02_exon_trees.py -t 64 -p RENAME -r RENAME_ref_NPV85 \
-        -e RENAME_exon \
+        -e RENAME_exon --cache_dir RENAME_step_cache \
         --output_dir RENAME_fam85_phylo
 
 # Step 3: Distance Matrix Calculation
@@ -1,5 +1,7 @@
+import os
 import argparse
 from Bio import SeqIO
+from name_matcher import NameMatcher
 
 def read_numbers_from_file(number_file):
     # Read the list of numbers from the provided file
@@ -7,16 +9,25 @@ def read_numbers_from_file(number_file):
         numbers = [line.strip() for line in f]
     return numbers
 
-def filter_fasta_by_numbers(fasta_file, numbers, output_file):
-    # Open the output file to write the selected sequences
+def filter_fasta_by_numbers(fasta_file, numbers, output_file, matcher=None):
+    # Match all "-<number>" patterns in one scan of each name; a record is written once
+    # even if several numbers match it
+    matcher = matcher or NameMatcher(f"-{number}" for number in numbers)
+    # Open the output file and stream the selected sequences to it
     with open(output_file, 'w') as out_f:
-        # Parse the fasta file
-        for record in SeqIO.parse(fasta_file, 'fasta'):
-            # Check if any number from the list is in the sequence name
-            for number in numbers:
-                if f"-{number}" in record.id:
-                    # If a match is found, write the sequence to the output file
-                    SeqIO.write(record, out_f, 'fasta')
+        records = SeqIO.parse(fasta_file, 'fasta')
+        return SeqIO.write((record for record in records if matcher.matches(record.id)), out_f, 'fasta')
+
+def filter_fasta_directory(fasta_dir, numbers, output_dir):
+    # Filter every FASTA file of a directory into files of the same name, sharing one matcher
+    os.makedirs(output_dir, exist_ok=True)
+    matcher = NameMatcher(f"-{number}" for number in numbers)
+    written = 0
+    for name in sorted(os.listdir(fasta_dir)):
+        if name.endswith(('.fasta', '.fa', '.fas', '.fna')):
+            written += filter_fasta_by_numbers(os.path.join(fasta_dir, name), numbers,
+                                               os.path.join(output_dir, name), matcher)
+    return written
 
 def main():
     # Argument parser setup
@@ -24,10 +35,11 @@ def main():
     
     # Input files
     parser.add_argument("number_file", type=str, help="Path to the file containing list of numbers")
-    parser.add_argument("fasta_file", type=str, help="Path to the input FASTA file")
+    parser.add_argument("fasta_file", type=str, help="Path to the input FASTA file (directory with --dir)")
     
     # Output file
-    parser.add_argument("output_file", type=str, help="Path to the output FASTA file")
+    parser.add_argument("output_file", type=str, help="Path to the output FASTA file (directory with --dir)")
+    parser.add_argument("--dir", action="store_true", help="Filter every FASTA file of the input directory")
 
     # Parse arguments
     args = parser.parse_args()
@@ -36,7 +48,10 @@ def main():
     numbers = read_numbers_from_file(args.number_file)
     
     # Filter the fasta sequences by the numbers
-    filter_fasta_by_numbers(args.fasta_file, numbers, args.output_file)
+    if args.dir:
+        filter_fasta_directory(args.fasta_file, numbers, args.output_file)
+    else:
+        filter_fasta_by_numbers(args.fasta_file, numbers, args.output_file)
 
     print(f"Filtered sequences saved to {args.output_file}")
 
@@ -0,0 +1,156 @@
+# step_cache.py
+"""
+Content-addressed cache for external tool steps (MAFFT, trimAl, FastTree, IQ-TREE).
+A step's key is the SHA-256 of the tool version, its command flags and the contents of
+its input files, so the same exon aligned against the same reference alignment is
+recognised across runs and output directories. Each entry is a directory holding the
+step's output files; entries are written atomically and evicted least recently used
+first once the cache grows past its size cap.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from functools import lru_cache
+
+# Argument that makes each tool print its version and exit without reading input
+VERSION_ARGS = {'mafft': '--version', 'trimal': '--version', 'fasttree': '-help', 'iqtree2': '--version'}
+
+_version_lock = threading.Lock()
+
+def tool_version(tool):
+    """Version banner of `tool` (resolved executable path plus its version output)."""
+    # Serialized so that concurrent jobs query each tool only once
+    with _version_lock:
+        return _tool_version(tool)
+
+@lru_cache(maxsize=None)
+def _tool_version(tool):
+    path = shutil.which(tool) or tool
+    try:
+        result = subprocess.run(
+            [path, VERSION_ARGS.get(tool, '--version')], stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60
+        )
+        banner = result.stdout.decode(errors='replace').strip().splitlines()[:3]
+    except (OSError, subprocess.SubprocessError):
+        banner = []
+    return '\n'.join([path] + banner)
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class StepCache:
+    """Directory-backed store of step outputs, keyed by `step_key`, with an LRU size cap."""
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._digests = {}
+        self._digest_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total = self.prune()
+
+    def _file_digest(self, path):
+        """`file_digest` memoized by path, size and mtime, so a gene's reference alignment is hashed once."""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._digest_lock:
+            digest = self._digests.get(memo_key)
+        if digest is None:
+            digest = file_digest(path)
+            with self._digest_lock:
+                self._digests[memo_key] = digest
+        return digest
+
+    def step_key(self, tool, flags, inputs):
+        """Key of one step: tool version, command flags (without paths) and input file contents."""
+        digest = hashlib.sha256()
+        digest.update(tool_version(tool).encode())
+        digest.update(b'\0' + flags.encode())
+        for path in inputs:
+            digest.update(b'\0' + self._file_digest(path).encode())
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def restore(self, key, outputs):
+        """Copy a cached entry to the `outputs` paths. Returns False on a cache miss."""
+        entry = self._entry(key)
+        cached = [os.path.join(entry, str(n)) for n in range(len(outputs))]
+        if not all(os.path.exists(path) for path in cached):
+            return False
+        try:
+            for src, dst in zip(cached, outputs):
+                shutil.copyfile(src, dst)
+        except OSError:
+            # Evicted while being read
+            return False
+        # Entry mtime is the last-use time for LRU eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            # Evicted by another job after the copy; the outputs are already in place
+            pass
+        return True
+
+    def store(self, key, outputs):
+        """Add the `outputs` files under `key`, then evict old entries past the size cap."""
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Build the entry next to its final place and rename it in, so readers never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix='.tmp_')
+        size = 0
+        for n, path in enumerate(outputs):
+            shutil.copyfile(path, os.path.join(tmp_dir, str(n)))
+            size += os.path.getsize(path)
+        try:
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # Another run stored the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        with self._lock:
+            self._total += size
+            over_cap = self._total > self.max_bytes
+        if over_cap:
+            # Evict down to 90% of the cap so that the next few stores do not rescan the cache
+            self._total = self.prune(int(self.max_bytes * 0.9))
+
+    def prune(self, target_bytes=None):
+        """
+        Delete least recently used entries until the cache fits in `target_bytes`
+        (default `max_bytes`). Returns the remaining cache size in bytes.
+        """
+        target_bytes = self.max_bytes if target_bytes is None else target_bytes
+        with self._lock:
+            entries = []
+            for shard in os.scandir(self.cache_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.startswith('.tmp_'):
+                        continue
+                    try:
+                        size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                        entries.append((entry.stat().st_mtime, size, entry.path))
+                    except FileNotFoundError:
+                        # Evicted by another run in the meantime
+                        continue
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= target_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+            return total